@@ -0,0 +1,292 @@
+# core/frame_source.py
+import csv
+import os
+import time
+from typing import Optional
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+REPLAY_INDEX = 'timestamps.csv'  # 录制会话目录中的时间戳索引文件
+
+
+class FrameSource:
+    """
+    视频帧来源的基类。
+    read() 返回一帧BGR图像；暂时没有新帧时返回None，来源耗尽后 finished 为True。
+    timestamp 为最近一次 read() 返回的帧在来源自身时间轴上的时刻（秒）：实时来源为 time.monotonic()，
+    视频文件和录制会话为帧在文件中的时刻，与回放速度无关，运动检测的冷却期等按它计时，
+    加速或不节流回放时的行为因此与现场一致。
+    """
+    def __init__(self):
+        self.finished = False
+        self.timestamp = None
+        self._start = None
+
+    def open(self):
+        """打开来源，失败时抛出IOError"""
+        self.finished = False
+        self.timestamp = None
+        self._start = None
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _pace(self, offset: float, speed: float):
+        """按原始时间轴节流：第一帧之后，等到 offset/speed 秒再返回该帧；speed<=0 表示不节流"""
+        if speed <= 0:
+            return
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now - offset / speed
+            return
+        delay = self._start + offset / speed - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class CameraSource(FrameSource):
+    """实时摄像头"""
+    def __init__(self, index: int = 0):
+        super().__init__()
+        self.index = index
+        self.cap = None
+
+    def open(self):
+        super().open()
+        self.cap = cv2.VideoCapture(self.index)
+        if not self.cap.isOpened():
+            raise IOError("无法打开摄像头")
+
+    def read(self):
+        if not self.cap:
+            return None
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self.timestamp = time.monotonic()
+        return frame
+
+    def close(self):
+        if self.cap:
+            self.cap.release()
+            self.cap = None
+
+    def __repr__(self):
+        return f"CameraSource({self.index})"
+
+
+class VideoFileSource(FrameSource):
+    """
+    视频文件。
+    speed=1.0 按文件帧率实时播放，2.0 为两倍速，0 为不节流（尽快读取，用于离线测试）。
+    """
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.cap = None
+        self.fps = 0.0
+        self._index = 0
+        self._loop_base = 0.0  # 循环播放时此前各轮的总时长，保证时间轴不倒退
+
+    def open(self):
+        super().open()
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            raise IOError(f"无法打开视频文件: {self.path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self._index = 0
+        self._loop_base = 0.0
+
+    def read(self):
+        if not self.cap or self.finished:
+            return None
+        ret, frame = self.cap.read()
+        if not ret:
+            if not self.loop:
+                self.finished = True
+                return None
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self._loop_base += self._index / self.fps
+            self._index, self._start = 0, None
+            ret, frame = self.cap.read()
+            if not ret:
+                self.finished = True
+                return None
+        self._pace(self._index / self.fps, self.speed)
+        self.timestamp = self._loop_base + self._index / self.fps
+        self._index += 1
+        return frame
+
+    def close(self):
+        if self.cap:
+            self.cap.release()
+            self.cap = None
+
+    def __repr__(self):
+        return f"VideoFileSource({self.path!r})"
+
+
+class ImageFolderSource(FrameSource):
+    """
+    按文件名顺序读取目录中的静态图片，fps 控制播放速度（0为不节流）。
+    图片本身没有时刻，时间轴按 fps 排列，不节流时按每秒10张计。
+    """
+    def __init__(self, folder: str, fps: float = 10.0, loop: bool = False):
+        super().__init__()
+        self.folder = folder
+        self.fps = fps
+        self.loop = loop
+        self.files = []
+        self._index = 0
+        self._loop_base = 0.0
+
+    def open(self):
+        super().open()
+        if not os.path.isdir(self.folder):
+            raise IOError(f"图片目录不存在: {self.folder}")
+        self.files = sorted(f for f in os.listdir(self.folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise IOError(f"目录中没有图片: {self.folder}")
+        self._index = 0
+        self._loop_base = 0.0
+
+    def read(self):
+        if self.finished:
+            return None
+        if self._index >= len(self.files):
+            if not self.loop:
+                self.finished = True
+                return None
+            self._loop_base += len(self.files) / (self.fps or 10.0)
+            self._index, self._start = 0, None
+        path = os.path.join(self.folder, self.files[self._index])
+        if self.fps > 0:
+            self._pace(self._index / self.fps, 1.0)
+        self.timestamp = self._loop_base + self._index / (self.fps or 10.0)
+        self._index += 1
+        return cv2.imread(path)
+
+    def __repr__(self):
+        return f"ImageFolderSource({self.folder!r})"
+
+
+class ReplaySource(FrameSource):
+    """
+    回放用 SessionRecorder 录制的会话。
+    会话目录中包含逐帧图片和 timestamps.csv（文件名, 相对秒数），
+    speed=1.0 按录制时的原始节奏回放，大于1加速，0为不节流。
+    """
+    def __init__(self, folder: str, speed: float = 1.0):
+        super().__init__()
+        self.folder = folder
+        self.speed = speed
+        self.entries = []
+        self._index = 0
+
+    def open(self):
+        super().open()
+        index_path = os.path.join(self.folder, REPLAY_INDEX)
+        if not os.path.exists(index_path):
+            raise IOError(f"找不到录制索引: {index_path}")
+        with open(index_path, newline='', encoding='utf-8') as f:
+            self.entries = [(name, float(offset)) for name, offset in csv.reader(f)]
+        self._index = 0
+
+    def read(self):
+        if self._index >= len(self.entries):
+            self.finished = True
+            return None
+        name, offset = self.entries[self._index]
+        self._index += 1
+        self._pace(offset, self.speed)
+        self.timestamp = offset
+        return cv2.imread(os.path.join(self.folder, name))
+
+    def __repr__(self):
+        return f"ReplaySource({self.folder!r}, speed={self.speed})"
+
+
+class SessionRecorder:
+    """
+    把现场视频逐帧录制为 ReplaySource 可回放的会话目录。
+    write() 的 timestamp 应为帧的采集时刻（通常是来源的 timestamp），省略时为当前时刻。
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._index_file = open(os.path.join(folder, REPLAY_INDEX), 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._index_file)
+        self._start = None
+        self._count = 0
+
+    def write(self, frame, timestamp: Optional[float] = None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if self._start is None:
+            self._start = timestamp
+        name = f"{self._count:06d}.jpg"
+        cv2.imwrite(os.path.join(self.folder, name), frame)
+        self._writer.writerow([name, f"{timestamp - self._start:.4f}"])
+        self._count += 1
+
+    def close(self):
+        self._index_file.close()
+
+
+class RecordingSource(FrameSource):
+    """
+    包装另一个帧来源，读取的同时把每一帧录制到会话目录，之后可用 ReplaySource 按原始节奏回放。
+    每帧在读取线程中编码为JPEG，约增加几毫秒。
+    """
+    def __init__(self, source, folder: str):
+        super().__init__()
+        self.source = open_source(source)
+        self.folder = folder
+        self.recorder = None
+
+    def open(self):
+        super().open()
+        self.source.open()
+        self.recorder = SessionRecorder(self.folder)
+
+    def read(self):
+        frame = self.source.read()
+        self.finished = self.source.finished
+        if frame is not None:
+            self.timestamp = self.source.timestamp
+            self.recorder.write(frame, self.timestamp)
+        return frame
+
+    def close(self):
+        self.source.close()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def __repr__(self):
+        return f"RecordingSource({self.source!r}, {self.folder!r})"
+
+
+def open_source(spec, speed: float = 1.0) -> FrameSource:
+    """
+    根据描述创建帧来源（未打开）：
+    FrameSource 实例原样返回；整数或纯数字字符串为摄像头编号；
+    含 timestamps.csv 的目录为录制会话；其他目录为图片目录；其余视为视频文件。
+    """
+    if isinstance(spec, FrameSource):
+        return spec
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CameraSource(int(spec))
+    if os.path.isdir(spec):
+        if os.path.exists(os.path.join(spec, REPLAY_INDEX)):
+            return ReplaySource(spec, speed=speed)
+        return ImageFolderSource(spec, fps=10.0 * speed)
+    return VideoFileSource(spec, speed=speed)
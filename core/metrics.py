@@ -0,0 +1,342 @@
+# core/metrics.py
+"""
+运行指标：直方图和计数器，按 Prometheus 文本格式通过本地HTTP端口或定期重写的文本文件暴露给本地采集器。
+
+默认关闭。关闭时各处埋点只多一次布尔判断，不计时、不加锁。开启方式：
+    metrics.configure(http_port=9108)                    # http://127.0.0.1:9108/metrics
+    metrics.configure(textfile='metrics/parking.prom')   # 每隔 interval 秒原子地重写一次
+图形界面通过环境变量 PARKING_METRICS_PORT / PARKING_METRICS_FILE 开启（见 configure_from_env）。
+
+已有的运行统计（例如各车道的帧计数）不必重复计数，用 register_collector 注册一个函数，
+在每次输出时读取即可。
+"""
+import bisect
+import functools
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, Optional, Sequence
+
+# 默认的耗时分桶（秒），覆盖从亚毫秒级的数据库查询到数秒的OCR
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = False
+_lock = threading.Lock()
+_metrics = {}      # 名称 -> 指标，按注册顺序输出
+_collectors = []   # 输出时调用的采集函数
+_exporters = []    # 正在运行的HTTP服务或文本文件写入线程
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not _enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf 桶
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if not _enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """取得一组标签值对应的序列，标签值的个数须与 labelnames 一致"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(child.value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    """按分桶累计的直方图，用于耗时分布"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self):
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {cumulative}')
+        return lines
+
+
+def _register(cls, name, *args, **kwargs):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, *args, **kwargs)
+            if not metric.labelnames:
+                metric.labels()  # 无标签的指标从一开始就输出0
+        elif not isinstance(metric, cls):
+            raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+        return metric
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    """注册（或取得已注册的）计数器"""
+    return _register(Counter, name, help, labelnames)
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """注册（或取得已注册的）直方图"""
+    return _register(Histogram, name, help, labelnames, buckets)
+
+
+def timed(metric: Histogram, *labelvalues):
+    """装饰器：指标开启时把函数每次调用的耗时记入 metric 的对应标签"""
+    child = metric.labels(*labelvalues)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def register_collector(collect: Callable[[], Iterable[tuple]]):
+    """
+    注册一个在每次输出时调用的采集函数，返回 (名称, 类型, 说明, {标签: 值}, 数值) 的序列，
+    类型为 'counter' 或 'gauge'。用于暴露已有的运行统计，例如帧计数、帧率。
+    """
+    with _lock:
+        _collectors.append(collect)
+
+
+def unregister_collector(collect: Callable):
+    with _lock:
+        if collect in _collectors:
+            _collectors.remove(collect)
+
+
+def render() -> str:
+    """按 Prometheus 文本格式输出全部指标"""
+    with _lock:
+        metrics = list(_metrics.values())
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+
+    families = {}  # 名称 -> (类型, 说明, [样本行])，同名样本合并到一个头部下
+    for collect in collectors:
+        try:
+            samples = list(collect())
+        except Exception as e:
+            print(f"指标采集失败: {e}")
+            continue
+        for name, kind, help, labels, value in samples:
+            family = families.setdefault(name, (kind, help, []))
+            family[2].append(f'{name}{_labels(list(labels), list(labels.values()))} {_number(value)}')
+    for name, (kind, help, samples) in families.items():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path: str):
+    """把当前指标写入文本文件：先写临时文件再替换，采集器不会读到写了一半的内容"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(render())
+    os.replace(temp_path, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不在控制台输出每次抓取
+
+
+class _HttpExporter:
+    def __init__(self, port: int, host: str):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _TextfileExporter:
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name='metrics-textfile', daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                write_textfile(self.path)
+            except OSError as e:
+                print(f"写入指标文件失败: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+        write_textfile(self.path)  # 退出前写入最终结果
+
+
+def configure(http_port: Optional[int] = None, textfile: Optional[str] = None, interval: float = 10.0,
+              host: str = '127.0.0.1'):
+    """开启指标，并按参数启动本地HTTP端口和/或文本文件输出（两者都省略时只在进程内累计）"""
+    enable()
+    with _lock:
+        if http_port:
+            _exporters.append(_HttpExporter(http_port, host))
+        if textfile:
+            _exporters.append(_TextfileExporter(textfile, interval))
+
+
+def configure_from_env() -> bool:
+    """
+    按环境变量开启指标，返回是否开启：
+    PARKING_METRICS_PORT 本地HTTP端口；PARKING_METRICS_FILE 文本文件路径；
+    PARKING_METRICS_INTERVAL 文本文件的重写间隔（秒，默认10）
+    """
+    port = os.environ.get('PARKING_METRICS_PORT')
+    path = os.environ.get('PARKING_METRICS_FILE')
+    if not port and not path:
+        return False
+    configure(http_port=int(port) if port else None, textfile=path or None,
+              interval=float(os.environ.get('PARKING_METRICS_INTERVAL', 10)))
+    return True
+
+
+def shutdown():
+    """停止HTTP端口和文本文件输出（文本文件会在停止前再写一次）"""
+    with _lock:
+        exporters = list(_exporters)
+        _exporters.clear()
+    for exporter in exporters:
+        exporter.stop()
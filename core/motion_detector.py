@@ -0,0 +1,58 @@
+# core/motion_detector.py
+import time
+
+import cv2
+
+
+class MotionDetector:
+    """
+    基于帧差的运动检测，用于在车道空闲或画面静止时跳过OCR。
+    比较的是缩小后的灰度图，单次检测只需几百微秒。
+    """
+    def __init__(self, sensitivity: float = 0.01, pixel_threshold: int = 25,
+                 work_width: int = 160, cooldown: float = 2.0):
+        """
+        sensitivity: 变化像素占比超过该值即认为有运动，越小越灵敏
+        pixel_threshold: 单个像素灰度变化超过该值才计为变化（过滤噪声）
+        work_width: 比较前把帧缩小到的宽度
+        cooldown: 最近一次检测到运动后，继续放行OCR的秒数，
+                  保证车辆停稳后仍有足够的帧用于投票；按 should_process 传入的帧时刻计算
+        """
+        self.sensitivity = sensitivity
+        self.pixel_threshold = pixel_threshold
+        self.work_width = work_width
+        self.cooldown = cooldown
+        self._previous = None
+        self._last_motion = None
+
+    def reset(self):
+        self._previous = None
+        self._last_motion = None
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.work_width / w)
+        small = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_ratio(self, frame) -> float:
+        """返回本帧相对上一帧的变化像素占比，并更新参考帧"""
+        current = self._prepare(frame)
+        previous, self._previous = self._previous, current
+        if previous is None or previous.shape != current.shape:
+            return 1.0  # 第一帧视为有变化
+        diff = cv2.absdiff(current, previous)
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / float(mask.size)
+
+    def should_process(self, frame, now: float = None) -> bool:
+        """
+        本帧是否需要做OCR：有运动，或仍处于上次运动后的冷却期内。
+        now 为该帧的时刻（秒，通常是帧来源的 timestamp），回放录制时与回放速度无关；省略时为当前时刻。
+        """
+        now = time.monotonic() if now is None else now
+        if self.changed_ratio(frame) >= self.sensitivity:
+            self._last_motion = now
+            return True
+        return self._last_motion is not None and now - self._last_motion <= self.cooldown
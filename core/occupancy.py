@@ -0,0 +1,89 @@
+# core/occupancy.py
+import heapq
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class OccupancyIndex:
+    """
+    停车场实时占用情况的内存索引。
+    空闲车位保存在最小堆中（总是分配编号最小的空位，与原有规则一致），
+    在场车辆保存在 车牌号 -> 停车记录 的字典中：
+    查询余位、判断是否在场为O(1)，分配和释放车位为O(log n)。
+    其他闸机占用的车位不从堆中删除，而是记入已占用集合，分配时跳过（惰性删除）。
+    """
+    def __init__(self, total_spots: int):
+        self.total_spots = total_spots
+        self._free = []
+        self._occupied = set()  # 已占用或已取出待写库的车位（只含 1..total_spots）
+        self._sessions: Dict[str, Tuple[int, int, int]] = {}  # 车牌号 -> (记录id, 车位号, 入场时间毫秒)
+        self._plates: Dict[int, str] = {}  # 记录id -> 车牌号
+        self.load([])
+
+    def load(self, open_sessions: Iterable[Tuple[int, str, int, int]]):
+        """用数据库中所有未出场的记录 (id, 车牌号, 车位号, 入场时间) 重建索引"""
+        self._sessions = {}
+        self._plates = {}
+        self._occupied = set()
+        for record_id, plate_number, spot_number, entry_time in open_sessions:
+            self.add_session(plate_number, record_id, spot_number, entry_time)
+        # 有序列表本身就是合法的最小堆
+        self._free = [spot for spot in range(1, self.total_spots + 1) if spot not in self._occupied]
+
+    def apply_changes(self, records: Iterable[Tuple[int, Optional[str], Optional[int], Optional[int], Optional[int]]]):
+        """
+        按其他连接修改过的停车记录的当前状态 (id, 车牌号, 车位号, 入场时间, 出场时间) 增量更新索引，
+        已删除的记录车牌号等字段为None。先移除这些记录原有的状态再加入仍在场的，
+        同一批修改中车位或车牌换了主人时不会互相覆盖。
+        """
+        records = list(records)
+        for record in records:
+            plate_number = self._plates.get(record[0])
+            if plate_number is not None:
+                self.remove_session(plate_number)
+        for record_id, plate_number, spot_number, entry_time, exit_time in records:
+            if plate_number is None or exit_time is not None:
+                continue
+            if plate_number in self._sessions:
+                self.remove_session(plate_number)
+            self.add_session(plate_number, record_id, spot_number, entry_time)
+
+    def available(self) -> int:
+        return self.total_spots - len(self._occupied)
+
+    def occupied(self) -> int:
+        return len(self._sessions)
+
+    def is_inside(self, plate_number: str) -> bool:
+        return plate_number in self._sessions
+
+    def get_session(self, plate_number: str) -> Optional[Tuple[int, int, int]]:
+        return self._sessions.get(plate_number)
+
+    def take_spot(self) -> Optional[int]:
+        """取出编号最小的空闲车位并标记为已占用，没有空位时返回None"""
+        while self._free:
+            spot_number = heapq.heappop(self._free)
+            if spot_number not in self._occupied:
+                self._occupied.add(spot_number)
+                return spot_number
+        return None
+
+    def return_spot(self, spot_number: int):
+        """归还一个车位（车辆出场，或取出后写库失败时回滚）"""
+        if spot_number in self._occupied:
+            self._occupied.discard(spot_number)
+            heapq.heappush(self._free, spot_number)
+
+    def add_session(self, plate_number: str, record_id: int, spot_number: int, entry_time: int):
+        self._sessions[plate_number] = (record_id, spot_number, entry_time)
+        self._plates[record_id] = plate_number
+        if 1 <= spot_number <= self.total_spots:
+            self._occupied.add(spot_number)
+
+    def remove_session(self, plate_number: str) -> Optional[Tuple[int, int, int]]:
+        """车辆出场：删除记录并释放车位"""
+        session = self._sessions.pop(plate_number, None)
+        if session is not None:
+            self._plates.pop(session[0], None)
+            self.return_spot(session[1])
+        return session
@@ -0,0 +1,152 @@
+# core/ocr_batcher.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+import cv2
+
+from .ocr_model import OcrModel
+
+BUCKET = 32  # 整帧批处理前补边到该值的整数倍，尺寸相近的整帧才会合并为一批
+CROP_HEIGHT = 64  # 车牌裁剪图统一缩放到的高度（EasyOCR识别模型的输入高度同为64）
+MAX_WIDTH_RATIO = 2.0  # 同一批裁剪图中最宽与最窄之比的上限，超过时另起一批，避免补边过多
+
+
+def _bucket_shape(image):
+    h, w = image.shape[:2]
+    return -(-h // BUCKET) * BUCKET, -(-w // BUCKET) * BUCKET
+
+
+def _pad_to(image, height: int, width: int):
+    """只在右侧和下方补黑边，识别框坐标无需换算"""
+    h, w = image.shape[:2]
+    return cv2.copyMakeBorder(image, 0, height - h, 0, width - w, cv2.BORDER_CONSTANT, value=0)
+
+
+def _scale_result(result, scale: float):
+    """把缩放后图像上的识别框换算回原图坐标"""
+    return [([[float(x) / scale, float(y) / scale] for x, y in bbox], text, prob) for bbox, text, prob in result]
+
+
+def _crop_groups(images, indexes):
+    """
+    把裁剪图按宽高比缩放到统一高度后按宽度排序分组，返回 [[(下标, 缩放后的图像, 缩放比例)]]。
+    不同车道、不同距离的车牌裁剪图尺寸各异，统一高度后只需在右侧补到组内最大宽度即可合批。
+    """
+    scaled = []
+    for index in indexes:
+        h, w = images[index].shape[:2]
+        scale = CROP_HEIGHT / h
+        width = max(1, round(w * scale))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        scaled.append((index, cv2.resize(images[index], (width, CROP_HEIGHT), interpolation=interpolation), scale))
+    scaled.sort(key=lambda item: item[1].shape[1])
+
+    groups = []
+    for item in scaled:
+        if groups and item[1].shape[1] <= groups[-1][0][1].shape[1] * MAX_WIDTH_RATIO:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    return groups
+
+
+def readtext_batch(model: OcrModel, images: List, is_crop: List[bool] = None) -> List[list]:
+    """
+    一次性识别多张图像，返回与输入顺序一致的 readtext 结果列表（识别框为原图坐标）。
+    is_crop 与 images 一一对应，标明该图像是否为车牌裁剪图；省略时全部按整帧处理。
+    EasyOCR 的 readtext_batched 要求同一批图像尺寸相同：
+    车牌裁剪图缩放到统一高度、按宽度分组后补边到组内最大宽度；整帧不缩放，按补边后的尺寸分桶。
+    只有一张图像的组直接识别原图。
+    """
+    if is_crop is None:
+        is_crop = [False] * len(images)
+    outputs = [None] * len(images)
+    crops, buckets = [], {}
+    for index, (image, crop) in enumerate(zip(images, is_crop)):
+        if crop:
+            crops.append(index)
+        else:
+            buckets.setdefault(_bucket_shape(image), []).append(index)
+
+    for group in _crop_groups(images, crops):
+        if len(group) == 1:
+            outputs[group[0][0]] = model.readtext(images[group[0][0]])
+            continue
+        width = max(image.shape[1] for _, image, _ in group)
+        batch = [_pad_to(image, CROP_HEIGHT, width) for _, image, _ in group]
+        for (index, _, scale), result in zip(group, model.readtext_batched(batch)):
+            outputs[index] = _scale_result(result, scale)
+
+    for (bh, bw), indexes in buckets.items():
+        if len(indexes) == 1:
+            outputs[indexes[0]] = model.readtext(images[indexes[0]])
+            continue
+        padded = [_pad_to(images[index], bh, bw) for index in indexes]
+        for index, result in zip(indexes, model.readtext_batched(padded)):
+            outputs[index] = result
+    return outputs
+
+
+class MicroBatcher:
+    """
+    在限定的等待时间内收集多个线程提交的任务，合并后一次性交给 dispatch 处理。
+    批次在凑满 max_batch 个任务，或最早的任务已等待 max_wait 秒时立即发出，
+    因此合批带来的额外延迟不会超过 max_wait。
+    dispatch(batch) 接收 [(item, future), ...]，负责为每个 future 设置结果（可以异步完成）。
+    """
+    def __init__(self, dispatch: Callable, max_batch: int = 8, max_wait: float = 0.02, name: str = 'ocr-batcher'):
+        self.dispatch = dispatch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((time.monotonic(), item, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            submitted, item, future = first
+            batch = [(item, future)]
+            deadline = submitted + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry[1:])
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                self.dispatch(batch)
+            except Exception as e:
+                for _, pending in batch:
+                    if not pending.done():
+                        pending.set_exception(e)
+            if stop:
+                break
@@ -0,0 +1,88 @@
+# core/ocr_model.py
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class OcrModel:
+    """
+    进程内共享的EasyOCR模型。
+    在后台线程中导入easyocr、加载权重并做一次预热推理，
+    避免每次管理员登录都在GUI线程里重新加载模型。
+    """
+    def __init__(self, languages=('en',)):
+        self.languages = list(languages)  # 默认仅识别英文字符和数字
+        self.reader = None
+        self.error = None  # 加载失败时保存异常
+        self._ready = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # easyocr.Reader 不保证线程安全，多个识别器共享时需串行调用
+        self.lock = threading.Lock()
+
+    def start_loading(self):
+        """在后台线程中开始加载模型（重复调用无副作用）"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name='ocr-model-loader', daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        try:
+            import easyocr
+            # 修复某些easyocr版本可能出现的警告
+            if not hasattr(easyocr.easyocr, 'corrupt_msg'):
+                easyocr.easyocr.corrupt_msg = "图像文件损坏，无法打开。"
+
+            reader = easyocr.Reader(self.languages)
+            # 预热：首次推理会触发权重初始化和内存分配，提前在后台完成
+            reader.readtext(np.zeros((64, 256, 3), dtype=np.uint8))
+            self.reader = reader
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+
+    def is_ready(self) -> bool:
+        """模型是否已加载完成（成功或失败）"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """阻塞等待模型加载完成，超时返回False"""
+        self.start_loading()
+        return self._ready.wait(timeout)
+
+    def get_reader(self):
+        """获取已加载的easyocr.Reader，必要时阻塞等待；加载失败时抛出RuntimeError"""
+        self.wait_ready()
+        if self.reader is None:
+            raise RuntimeError(f"OCR模型加载失败: {self.error}")
+        return self.reader
+
+    def readtext(self, image, **kwargs):
+        """线程安全地调用 reader.readtext"""
+        reader = self.get_reader()
+        with self.lock:
+            return reader.readtext(image, **kwargs)
+
+    def readtext_batched(self, images, **kwargs):
+        """线程安全地批量识别尺寸相同的多张图像，旧版本easyocr没有批量接口时逐张识别"""
+        reader = self.get_reader()
+        with self.lock:
+            if hasattr(reader, 'readtext_batched'):
+                return reader.readtext_batched(images, **kwargs)
+            return [reader.readtext(image, **kwargs) for image in images]
+
+
+_shared_model = None
+_shared_lock = threading.Lock()
+
+def get_shared_model() -> OcrModel:
+    """获取进程级共享的OCR模型，首次调用时开始后台加载"""
+    global _shared_model
+    with _shared_lock:
+        if _shared_model is None:
+            _shared_model = OcrModel()
+        _shared_model.start_loading()
+        return _shared_model
@@ -1,106 +1,289 @@
 # core/parking_system.py
+import random
 import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
+
+from database import archive, plate_index, revenue
+from database.database_manager import DB_PATH, get_connection, get_pool
+from database.timestamps import now_ms, to_ms
+from . import metrics
+from .occupancy import OccupancyIndex
+from .tariff import Tariff, load_tariff
+
+CALL_SECONDS = metrics.histogram('parking_system_call_seconds', 'ParkingSystem 各方法的耗时（秒）', ('method',))
+LOCK_WAIT_SECONDS = metrics.histogram('parking_db_lock_wait_seconds', '写事务等待数据库写锁的时间（秒，含退避重试）')
+BUSY_RETRIES = metrics.counter('parking_db_busy_retries_total', '数据库繁忙、写事务退避重试的次数')
+
+# 在场记录变更日志（occupancy_changes）保留的条数，每入场 CHANGE_LOG_PRUNE_EVERY 次清理一次；
+# 落后超过保留条数的进程会发现日志已被清理，改为整体重建占用索引
+CHANGE_LOG_KEEP = 10000
+CHANGE_LOG_PRUNE_EVERY = 1000
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """数据库被其他连接锁住（SQLITE_BUSY / SQLITE_LOCKED）"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+def vehicle_history(plate_number: str, db_path: str = DB_PATH) -> List[tuple]:
+    """
+    特定车辆的所有历史停车记录 (入场时间, 出场时间, 费用, 车位号)，时间为纪元毫秒。
+    只读查询，不需要 ParkingSystem 的占用索引和独占连接，只查历史的界面直接调用即可。
+    """
+    with get_connection(db_path) as conn:
+        # 只挂载含有该车牌记录的归档库，没有归档记录时直接查主库
+        with archive.records_source(conn, archive.months_for_plate(conn, plate_number)) as records:
+            return conn.execute(
+                f"SELECT entry_time, exit_time, fee, spot_number FROM {records} WHERE plate_number = ? ORDER BY entry_time DESC",
+                (plate_number,)
+            ).fetchall()
 
 class ParkingSystem:
     """管理停车场的业务逻辑，如车辆进出、计费等"""
-    def __init__(self, total_spots: int = 100):
+    def __init__(self, total_spots: int = 100, db_path: str = DB_PATH, max_retries: int = 8,
+                 tariff: Optional[Tariff] = None):
+        if max_retries < 1:
+            raise ValueError(f"max_retries 至少为1（写事务至少尝试一次）: {max_retries}")
         self.total_spots = total_spots
-        self.db_path = 'parking.db'
+        self.db_path = db_path
+        self.max_retries = max_retries  # 数据库繁忙时写事务的最大尝试次数
+        # 收费规则，默认读取 tariff.json（不存在时为首小时15元、之后每小时10元）
+        self.tariff = tariff or load_tariff()
+        # 在场车辆与空闲车位的内存索引，启动时从数据库重建，之后与数据库同步写入
+        self.occupancy = OccupancyIndex(total_spots)
+        self._lock = threading.Lock()
+        # 入场/出场使用一个独占连接：它的 PRAGMA data_version 只在“其他”连接提交修改后才变化，
+        # 据此可以低成本地发现其他闸机进程或本进程其他模块对停车记录的修改
+        self._conn = get_pool(db_path).open_dedicated()
+        self._data_version = None
+        self._change_seq = 0  # 已应用到占用索引的最后一条变更日志
+        self.refresh()
 
     def _get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """从连接池借出一个数据库连接（上下文管理器，退出时归还）"""
+        return get_connection(self.db_path)
+
+    def refresh(self):
+        """从数据库重建占用索引"""
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        # 先记下版本号和日志位置再读取记录：期间提交的修改会在下次同步时再应用一遍，应用是幂等的
+        conn = self._conn
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        change_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM occupancy_changes").fetchone()[0]
+        rows = conn.execute(
+            "SELECT id, plate_number, spot_number, entry_time FROM parking_records WHERE exit_time IS NULL"
+        ).fetchall()
+        self.occupancy.load(rows)
+        self._data_version, self._change_seq = version, change_seq
+
+    def _sync(self):
+        """
+        其他连接提交过修改时，按变更日志只读取改动过的记录并增量更新占用索引（调用方需持有 self._lock）。
+        多台闸机并发时几乎每次写入前都会发现其他连接的修改，增量更新的开销只与新增的修改数有关。
+        """
+        conn = self._conn
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        first, last = conn.execute("SELECT MIN(seq), MAX(seq) FROM occupancy_changes").fetchone()
+        if last is not None and last > self._change_seq:
+            if first > self._change_seq + 1:
+                # 需要的日志已被清理
+                self._reload()
+                return
+            rows = conn.execute(
+                "SELECT c.record_id, r.plate_number, r.spot_number, r.entry_time, r.exit_time "
+                "FROM (SELECT DISTINCT record_id FROM occupancy_changes WHERE seq > ? AND seq <= ?) AS c "
+                "LEFT JOIN parking_records AS r ON r.id = c.record_id",
+                (self._change_seq, last)
+            ).fetchall()
+            self.occupancy.apply_changes(rows)
+            self._change_seq = last
+        self._data_version = version
+
+    def _write_transaction(self, work):
+        """
+        在 BEGIN IMMEDIATE 事务中执行 work(conn) 并提交，调用方需持有 self._lock。
+        IMMEDIATE 在事务开始时就取得写锁，读取与写入之间不会有其他闸机插入修改；
+        取不到写锁时按指数退避（带随机抖动）重试。work 或提交失败时回滚并抛出异常。
+        """
+        conn = self._conn
+        started = time.perf_counter() if metrics.enabled() else None
+        for attempt in range(self.max_retries):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == self.max_retries - 1:
+                    raise
+                BUSY_RETRIES.inc()
+                time.sleep(min(0.5, 0.01 * 2 ** attempt) * (0.5 + random.random()))
+                continue
+            if started is not None:
+                LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+            try:
+                result = work(conn)
+                conn.commit()
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
 
+    @metrics.timed(CALL_SECONDS, 'get_available_spots')
     def get_available_spots(self) -> int:
         """计算当前可用的停车位数量"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            occupied = cursor.execute(
-                "SELECT COUNT(*) FROM parking_records WHERE exit_time IS NULL"
-            ).fetchone()[0]
-        return self.total_spots - occupied
+        with self._lock:
+            self._sync()
+            return self.occupancy.available()
 
+    @metrics.timed(CALL_SECONDS, 'vehicle_entry')
     def vehicle_entry(self, plate_number: str) -> Optional[int]:
         """
         处理车辆入场，分配一个车位号。
         如果车位已满，返回None。
         """
-        if self.get_available_spots() <= 0:
-            return None
+        taken = []  # 本次事务中取出、尚未提交的车位
+
+        def work(conn):
+            # 已持有写锁，此时同步得到的占用情况是权威的
+            self._sync()
+            # 已在场的车辆不重复入场，直接返回其当前车位
+            session = self.occupancy.get_session(plate_number)
+            if session:
+                return session[1], None
 
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            # 查找所有已被占用的车位
-            occupied_spots = {row[0] for row in cursor.execute(
-                "SELECT spot_number FROM parking_records WHERE exit_time IS NULL"
-            ).fetchall()}
-            
             # 从1号车位开始，找到第一个未被占用的车位
-            spot_number = next((i for i in range(1, self.total_spots + 1) if i not in occupied_spots), None)
+            spot_number = self.occupancy.take_spot()
+            if spot_number is None:
+                return None, None
+            taken.append(spot_number)
+            entry_time = now_ms()
+            cursor = conn.execute(
+                "INSERT INTO parking_records (plate_number, entry_time, spot_number) VALUES (?, ?, ?)",
+                (plate_number, entry_time, spot_number)
+            )
+            if cursor.lastrowid % CHANGE_LOG_PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM occupancy_changes WHERE seq <= (SELECT MAX(seq) FROM occupancy_changes) - ?",
+                             (CHANGE_LOG_KEEP,))
+            return spot_number, (cursor.lastrowid, entry_time)
 
-            if spot_number:
-                cursor.execute(
-                    "INSERT INTO parking_records (plate_number, entry_time, spot_number) VALUES (?, ?, ?)",
-                    (plate_number, datetime.now(), spot_number)
-                )
-                conn.commit()
+        def attempt():
+            try:
+                return self._write_transaction(work)
+            except BaseException:
+                # 插入或提交失败时整个事务已回滚，取出的车位要归还，否则要等到下次重建索引才会恢复
+                while taken:
+                    self.occupancy.return_spot(taken.pop())
+                raise
+
+        with self._lock:
+            try:
+                spot_number, created = attempt()
+            except sqlite3.IntegrityError:
+                # 唯一约束兜底：内存索引与数据库不一致，重建后再试一次
+                self._reload()
+                spot_number, created = attempt()
+            if created:
+                # 提交成功后才更新内存索引
+                self.occupancy.add_session(plate_number, created[0], spot_number, created[1])
             return spot_number
 
-    def calculate_fee(self, minutes: float) -> float:
-        """根据停车分钟数计算费用"""
-        hours = minutes / 60
-        if hours <= 1:
-            return 15.0
-        # 超过1小时后，每小时10元
-        return 15.0 + (hours - 1) * 10.0
+    def calculate_fee(self, minutes: float, entry_ms: Optional[int] = None, plate_number: Optional[str] = None) -> float:
+        """
+        按收费规则计算费用。分时段费率需要知道停车的起止时刻，
+        省略 entry_ms 时按“停车到现在”计算；plate_number 用于匹配车牌分类规则。
+        """
+        if entry_ms is None:
+            entry_ms = now_ms() - round(minutes * 60000)
+        return self.tariff.fee(entry_ms, entry_ms + round(minutes * 60000), plate_number)
 
+    @metrics.timed(CALL_SECONDS, 'vehicle_exit')
     def vehicle_exit(self, plate_number: str) -> Optional[Dict[str, Any]]:
         """
         处理车辆出场，计算费用并更新数据库。
         返回包含费用和停车时长的字典，如果找不到车辆则返回None。
         """
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            record = cursor.execute(
-                "SELECT id, entry_time FROM parking_records WHERE plate_number = ? AND exit_time IS NULL",
-                (plate_number,)
-            ).fetchone()
-
-            if not record:
+        def work(conn):
+            self._sync()
+            session = self.occupancy.get_session(plate_number)
+            if not session:
                 return None
 
-            record_id, entry_time_str = record
-            entry_time = datetime.strptime(entry_time_str, '%Y-%m-%d %H:%M:%S.%f')
-            exit_time = datetime.now()
-            
-            duration_seconds = (exit_time - entry_time).total_seconds()
-            fee = self.calculate_fee(duration_seconds / 60)
+            record_id, _, entry_time = session
+            exit_time = now_ms()
 
-            cursor.execute(
-                "UPDATE parking_records SET exit_time = ?, fee = ? WHERE id = ?",
+            duration_seconds = (exit_time - entry_time) / 1000
+            fee = self.calculate_fee(duration_seconds / 60, entry_time, plate_number)
+
+            cursor = conn.execute(
+                "UPDATE parking_records SET exit_time = ?, fee = ? WHERE id = ? AND exit_time IS NULL",
                 (exit_time, fee, record_id)
             )
-            conn.commit()
-            
+            if cursor.rowcount == 0:
+                return None
+            # 与出场记录在同一事务中更新按日汇总，两者要么都生效要么都不生效
+            revenue.add_exit(conn, entry_time, duration_seconds / 60, fee)
             return {"fee": fee, "duration_minutes": duration_seconds / 60}
 
+        with self._lock:
+            result = self._write_transaction(work)
+            if result is not None:
+                # 数据库提交成功后再释放车位
+                self.occupancy.remove_session(plate_number)
+            return result
+
+    @metrics.timed(CALL_SECONDS, 'get_vehicle_history')
     def get_vehicle_history(self, plate_number: str) -> List[tuple]:
-        """获取特定车辆的所有历史停车记录"""
+        """获取特定车辆的所有历史停车记录 (入场时间, 出场时间, 费用, 车位号)，时间为纪元毫秒"""
+        return vehicle_history(plate_number, self.db_path)
+
+    @metrics.timed(CALL_SECONDS, 'get_records_between')
+    def get_records_between(self, start: Union[int, datetime], end: Union[int, datetime],
+                            plate_number: Optional[str] = None) -> List[tuple]:
+        """
+        入场时间在 [start, end] 内（两端都包含）的停车记录，按入场时间倒序。
+        start/end 为纪元毫秒或本地时间；按天、按月查询可配合 database.timestamps 的 day_range/month_range。
+        返回 (id, 车牌号, 入场时间, 出场时间, 费用, 车位号)，时间为纪元毫秒。
+        """
+        start_ms = to_ms(start) if isinstance(start, datetime) else start
+        end_ms = to_ms(end) if isinstance(end, datetime) else end
+        query = "SELECT id, plate_number, entry_time, exit_time, fee, spot_number FROM {} WHERE entry_time BETWEEN ? AND ?"
+        params = [start_ms, end_ms]
+        if plate_number:
+            # 命中 (plate_number, entry_time) 复合索引
+            query += " AND plate_number = ?"
+            params.append(plate_number)
+        query += " ORDER BY entry_time DESC"
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            return cursor.execute(
-                "SELECT entry_time, exit_time, fee, spot_number FROM parking_records WHERE plate_number = ? ORDER BY entry_time DESC",
-                (plate_number,)
-            ).fetchall()
+            # 只有时间范围涉及已归档的月份时才合并归档库
+            months = archive.months_in_range(conn, start_ms, end_ms)
+            if plate_number:
+                plate_months = {month for month, _ in archive.months_for_plate(conn, plate_number)}
+                months = [item for item in months if item[0] in plate_months]
+            with archive.records_source(conn, months, start_ms, end_ms) as records:
+                return conn.execute(query.format(records), params).fetchall()
+
+    @metrics.timed(CALL_SECONDS, 'search_plates')
+    def search_plates(self, text: str, limit: int = 20, max_distance: Optional[float] = None) -> List[tuple]:
+        """
+        按相似度检索车牌，返回按编辑距离升序的 [(车牌号, 距离, 记录数)]。
+        OCR易混淆的字符（如 8/B）之间的替换只计半个距离，因此识别有误的车牌也能排在前面。
+        """
+        with self._get_connection() as conn:
+            return plate_index.search(conn, text, limit=limit, max_distance=max_distance)
 
+    @metrics.timed(CALL_SECONDS, 'is_vehicle_inside')
     def is_vehicle_inside(self, plate_number: str) -> bool:
         """检查车辆当前是否在停车场内"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            record = cursor.execute(
-                "SELECT id FROM parking_records WHERE plate_number = ? AND exit_time IS NULL",
-                (plate_number,)
-            ).fetchone()
-        return record is not None
\ No newline at end of file
+        with self._lock:
+            self._sync()
+            return self.occupancy.is_inside(plate_number)
+
+    def close(self):
+        """关闭入场/出场使用的独占连接，持有 ParkingSystem 的窗口或服务退出时调用"""
+        with self._lock:
+            self._conn.close()
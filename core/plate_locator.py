@@ -0,0 +1,86 @@
+# core/plate_locator.py
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+Region = Tuple[int, int, int, int]  # x, y, w, h
+
+
+class PlateLocator:
+    """
+    基于边缘与轮廓的轻量级车牌候选区域定位。
+    车牌区域的特点是竖直边缘密集、外形为横向长条，
+    先用Sobel提取竖直边缘并二值化，再用横向的闭运算把字符连成块，
+    最后按宽高比和面积筛选轮廓，得到少量候选框供OCR使用。
+    """
+    def __init__(self, max_candidates: int = 3, min_aspect: float = 2.0, max_aspect: float = 6.5,
+                 min_area_ratio: float = 0.002, max_area_ratio: float = 0.25,
+                 work_width: int = 640, padding: float = 0.15):
+        self.max_candidates = max_candidates
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.min_area_ratio = min_area_ratio  # 候选框面积占整帧面积的下限
+        self.max_area_ratio = max_area_ratio  # 候选框面积占整帧面积的上限
+        self.work_width = work_width  # 超过该宽度的帧先缩小再定位
+        self.padding = padding  # 候选框向外扩展的比例，避免裁掉首尾字符
+
+    def locate(self, frame) -> List[Region]:
+        """返回按可信度排序的候选区域（原始帧坐标）"""
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.work_width / w)
+        small = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        # 竖直方向的边缘（字符笔画）是车牌最稳定的特征
+        grad = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3)
+        grad = cv2.convertScaleAbs(grad)
+        _, mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (17, 3))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        frame_area = small.shape[0] * small.shape[1]
+        scored = []
+        for contour in contours:
+            x, y, cw, ch = cv2.boundingRect(contour)
+            if ch == 0:
+                continue
+            aspect = cw / ch
+            area_ratio = (cw * ch) / frame_area
+            if not (self.min_aspect <= aspect <= self.max_aspect):
+                continue
+            if not (self.min_area_ratio <= area_ratio <= self.max_area_ratio):
+                continue
+            # 边缘填充率越高越像车牌
+            fill = cv2.countNonZero(mask[y:y + ch, x:x + cw]) / float(cw * ch)
+            scored.append((fill * cw * ch, (x, y, cw, ch)))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        regions = []
+        for _, (x, y, cw, ch) in scored[:self.max_candidates]:
+            regions.append(self._expand((x / scale, y / scale, cw / scale, ch / scale), w, h))
+        return regions
+
+    def _expand(self, region, frame_w: int, frame_h: int) -> Region:
+        x, y, cw, ch = region
+        pad_x, pad_y = cw * self.padding, ch * self.padding * 2
+        x0, y0 = max(0, int(x - pad_x)), max(0, int(y - pad_y))
+        x1, y1 = min(frame_w, int(x + cw + pad_x)), min(frame_h, int(y + ch + pad_y))
+        return x0, y0, x1 - x0, y1 - y0
+
+
+def offset_bbox(bbox, dx: int, dy: int):
+    """把裁剪图上的OCR边界框平移回原始帧坐标"""
+    return [[float(px) + dx, float(py) + dy] for px, py in bbox]
+
+
+def crop_regions(frame, regions: List[Region]):
+    """按候选区域裁剪图像，返回 (x, y, 裁剪图) 列表"""
+    crops = []
+    for x, y, w, h in regions:
+        if w > 0 and h > 0:
+            crops.append((x, y, np.ascontiguousarray(frame[y:y + h, x:x + w])))
+    return crops
@@ -1,33 +1,101 @@
 # core/plate_recognizer.py
 import cv2
-import easyocr
 import re
+import time
 import numpy as np
 
+from . import metrics, tracing
+from .frame_source import open_source
+from .motion_detector import MotionDetector
+from .ocr_batcher import readtext_batch
+from .ocr_model import OcrModel, get_shared_model
+from .plate_locator import PlateLocator, crop_regions, offset_bbox
+from .plate_tracker import PlateTracker
+
+STAGE_SECONDS = metrics.histogram('parking_recognizer_stage_seconds', '车牌识别各阶段耗时（秒）', ('stage',))
+
+
+def observe_stages(timings: dict):
+    """把一帧各阶段的耗时记入指标（指标关闭时什么也不做）"""
+    if metrics.enabled():
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def frame_samples(lane: str, stats: dict):
+    """把 get_stats() 形式的帧计数转换为指标采集函数的样本（见 core.metrics.register_collector）"""
+    for key, value in stats.items():
+        if key == 'dropped':
+            yield ('parking_frames_dropped_total', 'counter', '因识别跟不上而丢弃的帧数', {'lane': lane}, value)
+        else:
+            kind = key[len('frames_'):] if key.startswith('frames_') else key  # frames_gated -> gated
+            yield ('parking_frames_total', 'counter', '各环节处理的帧数', {'lane': lane, 'kind': kind}, value)
+
+
 class PlateRecognizer:
     """处理来自视频流的车牌识别任务"""
-    def __init__(self):
-        """初始化车牌识别器"""
-        # 修复某些easyocr版本可能出现的警告
-        if not hasattr(easyocr.easyocr, 'corrupt_msg'):
-            easyocr.easyocr.corrupt_msg = "图像文件损坏，无法打开。"
-            
-        self.reader = easyocr.Reader(['en'])  # 仅识别英文字符和数字
-        self.cap = None
-        self.recent_results = []  # 用于存储最近的识别结果，以提高稳定性
-
-    def start_camera(self):
-        """启动默认摄像头"""
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            raise IOError("无法打开摄像头")
-        self.recent_results.clear() # 每次启动时清空历史记录
+    ROI_MODES = ('auto', 'roi', 'full')
+
+    def __init__(self, model: OcrModel = None, roi_mode: str = 'auto', full_frame_interval: int = 15,
+                 motion_detector: MotionDetector = None, motion_gate: bool = True,
+                 vote_window: int = 10, min_votes: int = 3, min_confidence: float = 0.5):
+        """
+        初始化车牌识别器。
+        model 默认使用进程级共享的OCR模型，首次执行OCR时才获取，构造本身不会加载任何权重。
+        roi_mode: 'auto' 只对候选车牌区域做OCR，并每隔 full_frame_interval 帧做一次整帧兜底识别；
+                  'roi' 只识别候选区域；'full' 始终整帧识别（旧行为）。
+        motion_gate: 为True时画面无变化则跳过OCR，灵敏度与冷却时间由 motion_detector 配置。
+        vote_window / min_votes / min_confidence: 每条轨迹的投票窗口大小、判定稳定所需票数、单次结果的最低置信度。
+        """
+        if roi_mode not in self.ROI_MODES:
+            raise ValueError(f"未知的ROI模式: {roi_mode}")
+        self._model = model
+        self.locator = PlateLocator()
+        self.roi_mode = roi_mode
+        self.full_frame_interval = full_frame_interval
+        self.frame_index = 0
+        self.motion_gate = motion_gate
+        self.motion_detector = motion_detector or MotionDetector()
+        # 运行统计：送入识别的帧数 / 因画面静止被跳过的帧数 / 实际执行OCR的帧数
+        self.frames_seen = 0
+        self.frames_gated = 0
+        self.frames_ocr = 0
+        self.min_confidence = min_confidence
+        # 按位置跟踪画面中的每块车牌，每条轨迹独立投票，多辆车同框时互不干扰
+        self.tracker = PlateTracker(vote_window=vote_window, min_votes=min_votes)
+        # 最近一帧各阶段耗时（秒）：convert / gate / locate / readtext / vote / draw
+        self.stage_timings = {}
+        self.source = None  # 当前帧来源（摄像头、视频文件、图片目录或录制回放）
+        self.stable_tracks = []  # 最近一次 vote() 中新变为稳定的轨迹
+        self.last_traces = []    # 最近一次 recognize() 中每个稳定车牌的追踪（core.tracing.GateTrace），与返回的车牌一一对应
+
+    def start_camera(self, source=0):
+        """
+        打开帧来源，默认为0号摄像头。
+        source 可以是 FrameSource 实例、摄像头编号、视频文件、图片目录或录制会话目录，
+        具体规则见 core.frame_source.open_source。
+        """
+        self.stop_camera()
+        source = open_source(source)
+        source.open()
+        self.source = source
+        self.reset_state() # 每次启动时清空历史记录
+
+    def reset_state(self):
+        """清空跟踪轨迹、投票历史和运动检测的参考帧"""
+        self.tracker.reset()
+        self.frame_index = 0
+        self.motion_detector.reset()
 
     def stop_camera(self):
-        """释放并关闭摄像头"""
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        """释放并关闭帧来源"""
+        if self.source:
+            self.source.close()
+            self.source = None
+
+    def is_source_finished(self) -> bool:
+        """视频文件、图片目录等有限来源是否已经读完"""
+        return self.source is not None and self.source.finished
 
     def is_valid_plate(self, text: str) -> bool:
         """验证识别出的文本是否符合车牌格式（此处简化为6位字母/数字）"""
@@ -37,48 +105,182 @@ class PlateRecognizer:
         pattern = r'^[A-F0-9]{6}$'
         return bool(re.match(pattern, text))
 
-    def get_most_common_result(self) -> str:
-        """从最近的识别结果中找出出现次数最多的那个"""
-        if not self.recent_results:
+    @property
+    def model(self) -> OcrModel:
+        if self._model is None:
+            self._model = get_shared_model()
+        return self._model
+
+    def is_model_ready(self) -> bool:
+        """OCR模型是否已加载完成"""
+        return self.model.is_ready()
+
+    def get_stats(self) -> dict:
+        """返回运动门控的统计计数"""
+        return {
+            "frames_seen": self.frames_seen,
+            "frames_gated": self.frames_gated,
+            "frames_ocr": self.frames_ocr,
+        }
+
+    def reset_stats(self):
+        self.frames_seen = self.frames_gated = self.frames_ocr = 0
+
+    def gate(self, frame, timestamp: float = None) -> bool:
+        """
+        运动门控：返回本帧是否需要做OCR，并更新统计计数。
+        timestamp 为帧在来源时间轴上的时刻（FrameSource.timestamp），冷却期按它计算；省略时为当前时刻。
+        """
+        self.frames_seen += 1
+        # 车道空闲或车辆静止时画面几乎不变，直接跳过OCR
+        if self.motion_gate and not self.motion_detector.should_process(frame, timestamp):
+            self.frames_gated += 1
+            return False
+        self.frames_ocr += 1
+        return True
+
+    def read_frame(self):
+        """
+        从帧来源读取一帧原始BGR图像。
+        来源未打开、读取失败或已读完时返回None。
+        """
+        source = self.source
+        if source is None:
             return None
-        return max(set(self.recent_results), key=self.recent_results.count)
+        if not metrics.enabled():
+            return source.read()
+        t0 = time.perf_counter()
+        frame = source.read()
+        STAGE_SECONDS.labels('capture').observe(time.perf_counter() - t0)
+        return frame
 
-    def process_frame(self):
+    def source_timestamp(self):
+        """最近一次 read_frame() 读到的帧在来源时间轴上的时刻，应在读取帧的线程中调用"""
+        source = self.source
+        return source.timestamp if source is not None else None
+
+    def _regions_to_read(self, frame):
+        """决定本帧送去OCR的图像区域，返回 ((x偏移, y偏移, 图像) 列表, 是否为车牌裁剪图)"""
+        self.frame_index += 1
+        if self.roi_mode == 'full':
+            return [(0, 0, frame)], False
+        # 定位器可能漏检（逆光、倾斜等），auto模式下定期做一次整帧识别兜底
+        if self.roi_mode == 'auto' and self.frame_index % self.full_frame_interval == 0:
+            return [(0, 0, frame)], False
+        return crop_regions(frame, self.locator.locate(frame)), True
+
+    def read_plates(self, frame):
         """
-        捕获一帧图像，进行处理，并尝试识别车牌。
-        返回处理后的图像帧和稳定识别出的车牌号。
+        对一帧BGR图像执行OCR，返回原始帧坐标下的 (bbox, text, prob) 列表。
+        模型尚未加载完成时会在此等待。
+        """
+        return self.read_plates_many([frame])[0]
+
+    def read_plates_many(self, frames):
+        """
+        对多帧图像执行OCR，返回每帧的 (bbox, text, prob) 列表。
+        所有帧的候选区域合并为一次批量推理，用于多车道或多候选框场景。
         """
-        if not self.cap or not self.cap.isOpened():
-            return None, None
+        t0 = time.perf_counter()
+        owners, regions, is_crop = [], [], []
+        for index, frame in enumerate(frames):
+            frame_regions, crop = self._regions_to_read(frame)
+            for region in frame_regions:
+                owners.append(index)
+                regions.append(region)
+                is_crop.append(crop)
+        t1 = time.perf_counter()
+
+        images = [image for _, _, image in regions]
+        if len(images) > 1:
+            # 只有车牌裁剪图才会缩放到统一高度，整帧（即使分辨率很低）按原尺寸识别
+            outputs = readtext_batch(self.model, images, is_crop)
+        else:
+            outputs = [self.model.readtext(image) for image in images]
 
-        ret, frame = self.cap.read()
-        if not ret:
-            return None, None
+        results = [[] for _ in frames]
+        for owner, (dx, dy, _), output in zip(owners, regions, outputs):
+            for (bbox, text, prob) in output:
+                results[owner].append((offset_bbox(bbox, dx, dy) if (dx or dy) else bbox, text, prob))
+        self.stage_timings['locate'] = t1 - t0
+        self.stage_timings['readtext'] = time.perf_counter() - t1
+        return results
+
+    def recognize(self, frame, captured_at: float = None, timestamp: float = None):
+        """
+        对一帧BGR图像进行OCR识别，captured_at 为该帧的采集时刻（time.monotonic()，默认当前时刻），
+        timestamp 为帧在来源时间轴上的时刻，供运动门控使用（见 gate()）。
+        返回处理后的RGB显示帧和本帧新稳定识别出的车牌号列表（没有稳定结果时为空列表，同框的多辆车会一起返回）；
+        last_traces 为这些车牌各自的追踪，调用方在后续环节继续记录。
+        """
+        try:
+            return self._recognize(frame, time.monotonic() if captured_at is None else captured_at, timestamp)
+        finally:
+            observe_stages(self.stage_timings)
 
+    def _recognize(self, frame, captured_at, timestamp):
+        timings = self.stage_timings
+        timings.clear()
+        self.last_traces = []
+        t0 = time.perf_counter()
         # 将BGR格式的帧转换为RGB，以便在PyQt中正确显示
         display_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        t1 = time.perf_counter()
+        timings['convert'] = t1 - t0
 
-        # 在原始帧上进行OCR识别
-        results = self.reader.readtext(frame)
+        passed = self.gate(frame, timestamp)
+        timings['gate'] = time.perf_counter() - t1
+        if not passed:
+            return display_frame, []
 
+        # 只对候选车牌区域进行OCR识别
+        results = self.read_plates(frame)
+
+        t2 = time.perf_counter()
+        # 投票按帧的采集时刻计时，追踪的起点因此是第一次识别到车牌的那一帧被采集的时刻
+        events = self.vote(results, now=captured_at, frame_index=self.frames_seen)
+        t3 = time.perf_counter()
+        timings['vote'] = t3 - t2
+        if events:
+            source = repr(self.source) if self.source else 'frame'
+            for track in self.stable_tracks:
+                trace = tracing.trace_for_track(track, source, self.frames_seen)
+                trace.mark('captured', captured_at)
+                trace.mark('recognized')
+                self.last_traces.append(trace)
+            for bbox, plate_number in events:
+                # 在显示的帧上绘制边界框和文本
+                pts = np.array(bbox, np.int32).reshape((-1, 1, 2))
+                cv2.polylines(display_frame, [pts], True, (0, 255, 0), 2)
+                cv2.putText(display_frame, plate_number, (int(bbox[0][0]), int(bbox[0][1]) - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+            timings['draw'] = time.perf_counter() - t3
+            # 每条轨迹只会稳定一次，同一帧稳定的多辆车必须全部返回，否则之后再也不会上报
+            return display_frame, [plate_number for _, plate_number in events]
+
+        # 如果没有稳定的结果，只返回处理后的帧
+        return display_frame, []
+
+    def vote(self, results, now: float = None, frame_index: int = None):
+        """
+        把一帧的OCR结果交给跟踪器投票，now / frame_index 为该帧的采集时刻和序号（可省略）。
+        返回本帧新变为稳定的 [(bbox, 车牌号)]，每条轨迹（每辆车）只会返回一次；对应的轨迹保存在 stable_tracks。
+        """
+        detections = []
         for (bbox, text, prob) in results:
             cleaned_text = text.replace(' ', '').upper()
-            if self.is_valid_plate(cleaned_text) and prob > 0.5:
-                # 将有效结果添加到历史记录中
-                self.recent_results.append(cleaned_text)
-                if len(self.recent_results) > 10:  # 只保留最近10次结果
-                    self.recent_results.pop(0)
-
-                most_common = self.get_most_common_result()
-
-                # 如果一个结果是最多见的，并且在近期出现了至少3次，我们认为它是稳定的
-                if most_common == cleaned_text and self.recent_results.count(cleaned_text) >= 3:
-                    # 在显示的帧上绘制边界框和文本
-                    pts = np.array(bbox, np.int32).reshape((-1, 1, 2))
-                    cv2.polylines(display_frame, [pts], True, (0, 255, 0), 2)
-                    cv2.putText(display_frame, cleaned_text, (int(bbox[0][0]), int(bbox[0][1]) - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-                    return display_frame, cleaned_text
+            if self.is_valid_plate(cleaned_text) and prob > self.min_confidence:
+                detections.append((bbox, cleaned_text, prob))
+        self.stable_tracks = self.tracker.update(detections, now, frame_index)
+        return [(track.bbox, track.emitted) for track in self.stable_tracks]
 
-        # 如果没有稳定的结果，只返回处理后的帧
-        return display_frame, None
\ No newline at end of file
+    def process_frame(self):
+        """
+        捕获一帧图像，进行处理，并尝试识别车牌。
+        返回处理后的图像帧和本帧稳定识别出的车牌号列表。
+        （同步版本，GUI中请使用 gui/recognition_worker.py 中的后台流水线）
+        """
+        frame = self.read_frame()
+        if frame is None:
+            return None, []
+        return self.recognize(frame, time.monotonic(), self.source_timestamp())
@@ -0,0 +1,151 @@
+# core/plate_tracker.py
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+
+def to_box(bbox) -> Tuple[float, float, float, float]:
+    """把OCR返回的四点边界框转换为 (x0, y0, x1, y1)"""
+    xs = [float(p[0]) for p in bbox]
+    ys = [float(p[1]) for p in bbox]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def iou(a, b) -> float:
+    ix0, iy0 = max(a[0], b[0]), max(a[1], b[1])
+    ix1, iy1 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix1 - ix0) * max(0.0, iy1 - iy0)
+    if inter <= 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """画面中的一块车牌：位置、速度和该车牌自己的投票"""
+    def __init__(self, track_id: int, box, bbox, now: float, frame_index: Optional[int] = None):
+        self.id = track_id
+        self.box = box          # 最近一次的 (x0, y0, x1, y1)
+        self.bbox = bbox        # 最近一次的四点边界框，用于绘制
+        self.velocity = (0.0, 0.0)  # 每秒像素位移
+        self.first_seen = now
+        self.first_frame = frame_index  # 第一次识别到时的帧序号，用于统计投票稳定前经过的帧数
+        self.last_seen = now
+        self.hits = 0
+        self.votes = deque()    # (时间, 车牌号, 置信度)
+        self.tally = {}         # 车牌号 -> [票数, 置信度之和]
+        self.emitted = None     # 已发出的稳定车牌号，每条轨迹只发出一次
+
+    def predict(self, now: float):
+        """按匀速运动预测当前位置"""
+        dt = now - self.last_seen
+        dx, dy = self.velocity[0] * dt, self.velocity[1] * dt
+        x0, y0, x1, y1 = self.box
+        return x0 + dx, y0 + dy, x1 + dx, y1 + dy
+
+    def update(self, box, bbox, now: float):
+        dt = now - self.last_seen
+        if dt > 0 and self.hits:
+            cx = (box[0] + box[2] - self.box[0] - self.box[2]) / 2 / dt
+            cy = (box[1] + box[3] - self.box[1] - self.box[3]) / 2 / dt
+            # 指数平滑，避免单帧抖动把预测带偏
+            self.velocity = (0.5 * self.velocity[0] + 0.5 * cx, 0.5 * self.velocity[1] + 0.5 * cy)
+        self.box, self.bbox = box, bbox
+        self.last_seen = now
+        self.hits += 1
+
+    def add_vote(self, plate: str, weight: float, now: float, window: int):
+        self.votes.append((now, plate, weight))
+        entry = self.tally.setdefault(plate, [0, 0.0])
+        entry[0] += 1
+        entry[1] += weight
+        while len(self.votes) > window:
+            self._drop_oldest()
+
+    def expire_votes(self, now: float, ttl: float):
+        while self.votes and now - self.votes[0][0] > ttl:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, plate, weight = self.votes.popleft()
+        entry = self.tally[plate]
+        entry[0] -= 1
+        entry[1] -= weight
+        if entry[0] <= 0:
+            del self.tally[plate]
+
+    def leader(self) -> Optional[Tuple[str, int, float]]:
+        """置信度加权得分最高的车牌，返回 (车牌号, 票数, 权重和)"""
+        if not self.tally:
+            return None
+        plate, (count, weight) = max(self.tally.items(), key=lambda item: item[1][1])
+        return plate, count, weight
+
+
+class PlateTracker:
+    """
+    轻量级多车牌跟踪器。
+    按运动预测后的边界框IoU把每帧的检测关联到已有轨迹，每条轨迹独立做置信度加权投票，
+    投票随时间过期；某条轨迹的领先车牌达到 min_votes 票时发出一次稳定事件。
+    同一帧中的多块车牌各自成轨，互不干扰。
+    """
+    def __init__(self, iou_threshold: float = 0.1, max_age: float = 1.5, vote_ttl: float = 5.0,
+                 vote_window: int = 10, min_votes: int = 3):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age      # 轨迹超过该秒数没有匹配到检测即删除
+        self.vote_ttl = vote_ttl    # 投票的有效期（秒）
+        self.vote_window = vote_window
+        self.min_votes = min_votes
+        self.tracks: List[Track] = []
+        self._next_id = 1
+
+    def reset(self):
+        self.tracks.clear()
+
+    def update(self, detections, now: float = None, frame_index: Optional[int] = None) -> List[Track]:
+        """
+        detections: [(bbox, 车牌号, 置信度)]，应已过滤掉不合法的文本。
+        now 为该帧的时刻（monotonic，默认当前时刻），frame_index 为该帧的序号（可省略）。
+        返回本次新变为稳定的轨迹列表（其 emitted 为稳定车牌号）。
+        """
+        now = time.monotonic() if now is None else now
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+
+        boxes = [to_box(bbox) for bbox, _, _ in detections]
+        predicted = [t.predict(now) for t in self.tracks]
+        pairs = []
+        for di, box in enumerate(boxes):
+            for ti, pbox in enumerate(predicted):
+                overlap = iou(box, pbox)
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, di, ti))
+        # 贪心匹配：重叠度最高的先配对
+        pairs.sort(reverse=True)
+        assigned, used = {}, set()
+        for _, di, ti in pairs:
+            if di not in assigned and ti not in used:
+                assigned[di] = ti
+                used.add(ti)
+
+        touched = []
+        for di, (bbox, plate, prob) in enumerate(detections):
+            if di in assigned:
+                track = self.tracks[assigned[di]]
+            else:
+                track = Track(self._next_id, boxes[di], bbox, now, frame_index)
+                self._next_id += 1
+                self.tracks.append(track)
+            track.update(boxes[di], bbox, now)
+            track.add_vote(plate, float(prob), now, self.vote_window)
+            touched.append(track)
+
+        events = []
+        for track in touched:
+            track.expire_votes(now, self.vote_ttl)
+            if track.emitted is not None:
+                continue
+            leader = track.leader()
+            if leader and leader[1] >= self.min_votes:
+                track.emitted = leader[0]
+                events.append(track)
+        return events
@@ -0,0 +1,485 @@
+# core/recognition_service.py
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+from . import metrics, tracing
+from .frame_source import RecordingSource, open_source
+from .ocr_batcher import MicroBatcher
+from .ocr_model import OcrModel
+from .parking_system import ParkingSystem
+from .plate_recognizer import PlateRecognizer, frame_samples, observe_stages
+
+LANE_DIRECTIONS = ('entry', 'exit', 'auto')
+CAPTURE_ERROR_BACKOFF = 1.0  # 车道读取或提交帧出错后，等待多久（秒）再继续
+
+OCR_SECONDS = metrics.histogram('parking_lane_ocr_seconds', '车道提交一帧到OCR结果返回的耗时（秒，含排队和进程间传递）',
+                                ('lane',))
+
+
+class FrameRing:
+    """
+    基于共享内存的定长帧环形缓冲区。
+    采集线程把帧写入空闲槽位，OCR进程按槽位号直接映射同一块内存读取，
+    帧数据不经过pickle。槽位在OCR结果返回后才归还，保证读取期间不会被覆盖。
+    """
+    def __init__(self, slots: int = 2, max_shape=(720, 1280, 3)):
+        self.max_shape = tuple(max_shape)
+        self.slot_bytes = int(np.prod(self.max_shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * slots)
+        self.name = self.shm.name
+        self._free = list(range(slots))
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Optional[int]:
+        """获取一个空闲槽位，全部被占用时返回None（调用方应丢弃该帧）"""
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    def release(self, slot: int):
+        with self._lock:
+            self._free.append(slot)
+
+    def write(self, slot: int, frame) -> tuple:
+        """把帧写入槽位，超出最大尺寸时等比缩小，返回实际写入的形状"""
+        max_h, max_w = self.max_shape[:2]
+        h, w = frame.shape[:2]
+        if h > max_h or w > max_w:
+            scale = min(max_h / h, max_w / w)
+            frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        view[...] = frame
+        return frame.shape
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# ---- OCR工作进程 ----
+# 每个工作进程持有自己的模型和共享内存映射，只在进程初始化时创建一次
+_worker_state = {}
+
+def _init_worker(torch_threads: int, roi_mode: str):
+    """工作进程初始化：限制线程数并加载OCR模型"""
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        # 多个进程各自使用全部核心会互相争抢，按进程数分配intra-op线程
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    model = OcrModel()
+    model.get_reader()
+    _worker_state['recognizer'] = PlateRecognizer(model=model, roi_mode=roi_mode, motion_gate=False)
+    _worker_state['segments'] = {}
+
+def _attach_segment(name: str) -> shared_memory.SharedMemory:
+    """
+    在工作进程中映射已存在的共享内存。
+    共享内存由主进程创建并负责释放；附加方若也向resource_tracker登记，
+    工作进程退出时会把它提前unlink，因此这里临时跳过登记。
+    """
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _map_frame(shm_name: str, offset: int, shape: tuple):
+    """把共享内存中的一帧映射为numpy数组（不复制）"""
+    segments = _worker_state['segments']
+    shm = segments.get(shm_name)
+    if shm is None:
+        shm = segments[shm_name] = _attach_segment(shm_name)
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+def _serialize(results):
+    return [([[float(x), float(y)] for x, y in bbox], text, float(prob)) for bbox, text, prob in results]
+
+def _ocr_task(shm_name: str, offset: int, shape: tuple):
+    """
+    在工作进程中对共享内存中的一帧执行OCR，返回可序列化的 (bbox, text, prob) 列表和各阶段耗时，
+    耗时由主进程记入指标（工作进程自己的指标无人读取）
+    """
+    frame = _map_frame(shm_name, offset, shape)
+    recognizer = _worker_state['recognizer']
+    return _serialize(recognizer.read_plates(frame)), dict(recognizer.stage_timings)
+
+def _ocr_batch_task(jobs: list):
+    """对来自多条车道的一批帧执行一次合批OCR，返回每帧的结果列表和这一批的各阶段耗时"""
+    frames = [_map_frame(*job) for job in jobs]
+    recognizer = _worker_state['recognizer']
+    outputs = [_serialize(results) for results in recognizer.read_plates_many(frames)]
+    return outputs, dict(recognizer.stage_timings)
+
+
+class Lane:
+    """
+    一条出入口车道：一个视频源加一个方向。
+    source 支持 core.frame_source.open_source 接受的任意形式（摄像头编号、视频文件、图片目录、录制会话）。
+    direction: 'entry' 入口，'exit' 出口，'auto' 按车辆是否在场自动判断（与管理员界面一致）
+    """
+    def __init__(self, name: str, source, direction: str = 'auto', repeat_interval: float = 30.0):
+        if direction not in LANE_DIRECTIONS:
+            raise ValueError(f"未知的车道方向: {direction}")
+        self.name = name
+        self.source = source
+        self.direction = direction
+        self.repeat_interval = repeat_interval  # 同一车牌在该车道重复触发的最短间隔（秒）
+        # 车道本地只做运动检测和投票，不加载OCR模型
+        self.recognizer = PlateRecognizer(motion_gate=True)
+        self.ring = None
+        self.thread = None
+        self.frames_captured = 0
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.last_events = {}  # 车牌号 -> 最近一次触发时间，只保留 repeat_interval 内触发过的车牌
+        self.in_flight = {}  # 槽位 -> (采集时刻, 帧序号, 提交OCR的时刻)，时刻均为 time.monotonic()
+
+
+def print_event(lane: Lane, plate_number: str, action: str, result: str):
+    """默认的事件回调：输出到控制台"""
+    print(f"[{lane.name}] {plate_number} {action}: {result}")
+
+
+def print_error(lane: Lane, error: Exception):
+    """默认的错误回调：输出到控制台"""
+    print(f"[{lane.name}] 处理失败: {error}")
+
+
+class RecognitionService:
+    """
+    多车道车牌识别服务。
+    每条车道一个采集线程；OCR在 multiprocessing 进程池中执行，
+    避免GIL和torch线程池在单进程内互相争抢；帧通过共享内存环形缓冲区传递。
+    识别出的稳定车牌进入事件队列，由单独的分发线程按车道方向交给 ParkingSystem 处理，
+    数据库的慢提交或忙重试不会阻塞进程池的结果线程和其他车道的识别结果。
+    batch_window > 0 时，各车道在该时间窗口内提交的帧会合并为一次批量推理，
+    合批带来的额外延迟不超过 batch_window 秒。
+    record_dir 不为空时，每条车道的画面同时录制到 record_dir/车道名，可用 ReplaySource 回放。
+    """
+    def __init__(self, lanes: List[Lane], parking: ParkingSystem = None, workers: int = None,
+                 torch_threads: int = None, roi_mode: str = 'auto', ring_slots: int = 2,
+                 max_frame_shape=(720, 1280, 3), on_event: Callable = None,
+                 on_error: Callable = None, batch_window: float = 0.0, max_batch: int = 4,
+                 record_dir: str = None):
+        self.lanes = lanes
+        self.parking = parking or ParkingSystem(100)
+        self.workers = workers or max(1, min(len(lanes), (os.cpu_count() or 2) // 2))
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.roi_mode = roi_mode
+        self.ring_slots = ring_slots
+        self.max_frame_shape = max_frame_shape
+        self.on_event = on_event or print_event  # 回调 on_event(lane, plate_number, action, result)
+        self.on_error = on_error or print_error  # 回调 on_error(lane, error)，识别或出入场处理失败时调用
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.record_dir = record_dir
+        self.batcher = None
+        self.pool = None
+        self._running = False
+        self._events = queue.Queue()  # (车道, 车牌号, 追踪)，None 表示停止分发
+        self._dispatcher = None
+
+    def start(self):
+        """打开所有车道的视频源并启动服务；任一视频源打开失败时抛出IOError，不启动任何车道"""
+        sources = []
+        try:
+            for lane in self.lanes:
+                sources.append(self._open_source(lane))
+        except Exception:
+            for source in sources:
+                source.close()
+            raise
+        self.pool = mp.Pool(self.workers, initializer=_init_worker,
+                            initargs=(self.torch_threads, self.roi_mode))
+        if self.batch_window > 0:
+            self.batcher = MicroBatcher(self._dispatch_batch, max_batch=self.max_batch,
+                                        max_wait=self.batch_window, name='lane-batcher')
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='gate-dispatcher', daemon=True)
+        self._dispatcher.start()
+        for lane, source in zip(self.lanes, sources):
+            lane.ring = FrameRing(self.ring_slots, self.max_frame_shape)
+            lane.thread = threading.Thread(target=self._capture_loop, args=(lane, source),
+                                           name=f'lane-{lane.name}', daemon=True)
+            lane.thread.start()
+        metrics.register_collector(self._collect_metrics)
+
+    def stop(self):
+        metrics.unregister_collector(self._collect_metrics)
+        self._running = False
+        for lane in self.lanes:
+            if lane.thread:
+                lane.thread.join()
+                lane.thread = None
+        if self.batcher:
+            self.batcher.close()
+            self.batcher = None
+        if self.pool:
+            # 先等待在途任务结束，再释放共享内存
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self._dispatcher:
+            # 进程池结束后不会再有新事件，处理完队列中剩余的事件再退出
+            self._events.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
+        for lane in self.lanes:
+            if lane.ring:
+                lane.ring.close()
+                lane.ring = None
+
+    def get_stats(self) -> dict:
+        """各车道的采集/提交/丢弃帧数和运动门控统计"""
+        return {
+            lane.name: dict(lane.recognizer.get_stats(),
+                            captured=lane.frames_captured,
+                            submitted=lane.frames_submitted,
+                            dropped=lane.frames_dropped)
+            for lane in self.lanes
+        }
+
+    def _collect_metrics(self):
+        """指标采集函数：各车道的帧计数（含丢弃的帧）"""
+        for lane, stats in self.get_stats().items():
+            yield from frame_samples(lane, stats)
+
+    def _open_source(self, lane: Lane):
+        source = open_source(lane.source)
+        if self.record_dir:
+            source = RecordingSource(source, os.path.join(self.record_dir, lane.name))
+        try:
+            source.open()
+        except IOError as e:
+            raise IOError(f"车道 {lane.name} 无法打开视频源: {e}")
+        return source
+
+    def _capture_loop(self, lane: Lane, source):
+        try:
+            while self._running and not source.finished:
+                try:
+                    self._capture_once(lane, source)
+                except Exception as e:
+                    # 读取或提交失败时报告后稍等再继续，车道线程不能悄悄退出
+                    self._report_error(lane, e)
+                    time.sleep(CAPTURE_ERROR_BACKOFF)
+        finally:
+            source.close()
+
+    def _capture_once(self, lane: Lane, source):
+        """读取一帧，通过运动门控后写入共享内存并提交OCR"""
+        timing = metrics.enabled()
+        t0 = time.monotonic()
+        frame = source.read()
+        if frame is None:
+            time.sleep(0.01)
+            return
+        lane.frames_captured += 1
+        captured_at = time.monotonic()
+        passed = lane.recognizer.gate(frame, source.timestamp)
+        if timing:
+            observe_stages({'capture': captured_at - t0, 'gate': time.monotonic() - captured_at})
+        if not passed:
+            return
+        slot = lane.ring.acquire()
+        if slot is None:
+            # 该车道的槽位都在识别中，丢弃这一帧，始终只识别较新的帧
+            lane.frames_dropped += 1
+            return
+        try:
+            shape = lane.ring.write(slot, frame)
+            lane.in_flight[slot] = (captured_at, lane.recognizer.frames_seen, time.monotonic())
+            job = (lane.ring.name, slot * lane.ring.slot_bytes, shape)
+            if self.batcher:
+                future = self.batcher.submit(job)
+                future.add_done_callback(lambda f, lane=lane, slot=slot: self._on_future(lane, slot, f))
+            else:
+                self.pool.apply_async(
+                    _ocr_task, job,
+                    callback=lambda output, lane=lane, slot=slot: self._on_result(lane, slot, *output),
+                    error_callback=lambda error, lane=lane, slot=slot: self._on_error(lane, slot, error))
+        except BaseException:
+            # 没有提交成功，槽位不会再由结果回调归还
+            lane.in_flight.pop(slot, None)
+            lane.ring.release(slot)
+            raise
+        lane.frames_submitted += 1
+
+    def _dispatch_batch(self, batch):
+        """把一批帧作为一个任务交给进程池，结果返回后分发给各自的future"""
+        def done(output):
+            outputs, timings = output
+            observe_stages(timings)
+            for (_, future), results in zip(batch, outputs):
+                future.set_result(results)
+
+        def failed(error):
+            for _, future in batch:
+                future.set_exception(error)
+
+        self.pool.apply_async(_ocr_batch_task, ([job for job, _ in batch],),
+                              callback=done, error_callback=failed)
+
+    def _on_future(self, lane: Lane, slot: int, future):
+        error = future.exception()
+        if error is not None:
+            self._on_error(lane, slot, error)
+        else:
+            self._on_result(lane, slot, future.result())
+
+    def _on_error(self, lane: Lane, slot: int, error):
+        lane.in_flight.pop(slot, None)
+        lane.ring.release(slot)
+        self._report_error(lane, error)
+
+    def _report_error(self, lane: Lane, error: Exception):
+        try:
+            self.on_error(lane, error)
+        except Exception as e:
+            print(f"错误回调失败: {e}")
+
+    def _on_result(self, lane: Lane, slot: int, results, timings=None):
+        """
+        运行在进程池的结果线程中（合批时为其回调），只做投票并把稳定的车牌放入事件队列。
+        这里抛出的异常会终止结果线程、使所有车道再也收不到结果，因此全部捕获后报告。
+        合批时 timings 已在 _dispatch_batch 中按批记录。
+        """
+        received = time.monotonic()
+        captured_at, frame_index, submitted = lane.in_flight.pop(slot, (None, None, None))
+        if submitted is not None:
+            OCR_SECONDS.labels(lane.name).observe(received - submitted)
+        if timings:
+            observe_stages(timings)
+        lane.ring.release(slot)
+        try:
+            self._vote(lane, results, captured_at, frame_index, received)
+        except Exception as e:
+            self._report_error(lane, e)
+
+    def _vote(self, lane: Lane, results, captured_at, frame_index, received):
+        # 按帧的采集时刻投票，事件追踪的起点是第一次识别到车牌的那一帧
+        lane.recognizer.vote(results, now=captured_at, frame_index=frame_index)
+        for track in lane.recognizer.stable_tracks:
+            plate_number = track.emitted
+            # 跟踪器保证同一辆车只触发一次；车辆短暂离开画面再回来时再用时间间隔兜底
+            now = time.monotonic()
+            # last_events 按触发时间先后排列，先清掉已超过间隔的车牌，否则见过的每个车牌都会一直留在这里
+            while lane.last_events:
+                oldest, at = next(iter(lane.last_events.items()))
+                if now - at < lane.repeat_interval:
+                    break
+                del lane.last_events[oldest]
+            if plate_number in lane.last_events:
+                continue
+            lane.last_events[plate_number] = now
+            trace = tracing.trace_for_track(track, lane.name, frame_index)
+            if captured_at is not None:
+                trace.mark('captured', captured_at)
+            trace.mark('ocr_done', received)
+            trace.mark('recognized', now)
+            self._events.put((lane, plate_number, trace))
+
+    def _dispatch_loop(self):
+        """分发线程：依次处理事件队列中的出入场，只有这个线程调用 ParkingSystem"""
+        while True:
+            event = self._events.get()
+            if event is None:
+                break
+            lane, plate_number, trace = event
+            try:
+                self._dispatch(lane, plate_number, trace)
+            except Exception as e:
+                # on_event 回调本身出错，分发线程不能因此退出
+                self._report_error(lane, e)
+
+    def _dispatch(self, lane: Lane, plate_number: str, trace: tracing.GateTrace = None):
+        """办理一次出入场；数据库出错时结束追踪并报告给 on_error，不向外抛出"""
+        try:
+            if trace is not None:
+                trace.mark('db_start')
+            direction = lane.direction
+            if direction == 'auto':
+                direction = 'exit' if self.parking.is_vehicle_inside(plate_number) else 'entry'
+                if trace is not None:
+                    trace.mark('checked')
+            if direction == 'entry':
+                result = self.parking.vehicle_entry(plate_number)
+            else:
+                result = self.parking.vehicle_exit(plate_number)
+        except Exception as e:
+            if trace is not None:
+                trace.finish('failed', error=str(e))
+            self._report_error(lane, e)
+            return
+        if trace is not None:
+            trace.finish('committed', action=direction, result=result)
+        self.on_event(lane, plate_number, direction, result)
+
+
+def parse_lane(spec: str) -> Lane:
+    """解析 名称:方向:视频源 形式的车道参数，视频源为纯数字时视为摄像头编号"""
+    name, direction, source = spec.split(':', 2)
+    return Lane(name, int(source) if source.isdigit() else source, direction)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多车道车牌识别服务')
+    parser.add_argument('--lane', action='append', required=True,
+                        help='车道定义 名称:方向:视频源，例如 east-in:entry:0 或 west-out:exit:gate.mp4')
+    parser.add_argument('--workers', type=int, default=None, help='OCR进程数')
+    parser.add_argument('--total-spots', type=int, default=100)
+    parser.add_argument('--batch-window', type=float, default=0.0,
+                        help='跨车道合批的最长等待时间（秒），0为不合批')
+    parser.add_argument('--max-batch', type=int, default=4)
+    parser.add_argument('--record', metavar='DIR', default=None,
+                        help='把各车道的画面录制到 DIR/车道名，之后可作为视频源回放')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='在本机该端口的 /metrics 上提供运行指标（Prometheus文本格式）')
+    parser.add_argument('--metrics-file', default=None, help='定期把运行指标写入该文本文件')
+    parser.add_argument('--trace-log', nargs='?', const=tracing.TRACE_PATH, default=None,
+                        help=f'把闸机事件追踪写入该日志（JSON行），只写 --trace-log 时为 {tracing.TRACE_PATH}，默认不记录')
+    args = parser.parse_args()
+    tracing.set_trace_log(args.trace_log)
+    if args.metrics_port or args.metrics_file:
+        metrics.configure(http_port=args.metrics_port, textfile=args.metrics_file)
+
+    from database.database_manager import MigrationError, setup_database
+    try:
+        setup_database()
+    except MigrationError as e:
+        sys.exit(f"错误: {e}")
+
+    service = RecognitionService([parse_lane(spec) for spec in args.lane],
+                                 parking=ParkingSystem(args.total_spots), workers=args.workers,
+                                 batch_window=args.batch_window, max_batch=args.max_batch,
+                                 record_dir=args.record)
+    try:
+        service.start()
+    except IOError as e:
+        sys.exit(f"错误: {e}")
+    try:
+        while True:
+            time.sleep(10)
+            print(service.get_stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        metrics.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# core/report_export.py
+from contextlib import closing
+from typing import Callable, Optional
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+
+from database import archive
+from database.database_manager import DB_PATH, get_connection
+from database.timestamps import from_ms, month_range
+
+# 报表查询，{records} 为 archive.records_source() 给出的停车记录来源
+PLATE_COUNT_QUERY = "SELECT COUNT(DISTINCT plate_number) FROM {records} WHERE entry_time BETWEEN ? AND ?"
+PLATE_SUMMARY_QUERY = (
+    "SELECT plate_number, COUNT(*), "
+    "SUM(CASE WHEN exit_time IS NOT NULL THEN (exit_time - entry_time) / 3600000.0 ELSE 0 END), "
+    "SUM(COALESCE(fee, 0)) FROM {records} WHERE entry_time BETWEEN ? AND ? GROUP BY plate_number"
+)
+DAILY_QUERY = "SELECT day, vehicles, total_minutes, fee_total FROM daily_revenue WHERE day BETWEEN ? AND ? ORDER BY day"
+
+
+class ReportCancelled(Exception):
+    """报表生成被用户取消"""
+
+
+def period_range(start_year: int, start_month: int, end_year: int, end_month: int):
+    """从起始月份到结束月份（都包含）的 (起始毫秒, 结束毫秒)"""
+    return month_range(start_year, start_month)[0], month_range(end_year, end_month)[1]
+
+
+def period_title(start_year: int, start_month: int, end_year: int, end_month: int) -> str:
+    """报表名称：单月为月报，整年为年报，其余为多月报表"""
+    if (start_year, start_month) == (end_year, end_month):
+        return f"{start_year}年{start_month:02d}月停车场月报"
+    if start_year == end_year and start_month == 1 and end_month == 12:
+        return f"{start_year}年停车场年报"
+    return f"{start_year}年{start_month:02d}月-{end_year}年{end_month:02d}月停车场报表"
+
+
+class ReportExporter:
+    """
+    以流式方式生成Excel报表。
+    使用 openpyxl 的 write_only 工作簿：每写一行就序列化到临时文件，不在内存中保留单元格，
+    查询结果也按批从游标读取，内存占用不随记录数增长。
+    工作簿包含两张表：按车牌汇总，以及来自按日收费汇总表的每日明细。
+    """
+    HEADER_FONT = Font(bold=True)
+    HEADER_FILL = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
+    HEADER_ALIGN = Alignment(horizontal='center')
+
+    def __init__(self, db_path: str = DB_PATH, chunk_size: int = 500):
+        self.db_path = db_path
+        self.chunk_size = chunk_size  # 每次从游标读取的行数，也是进度回调和检查取消的间隔
+
+    def export(self, path: str, start_ms: int, end_ms: int, title: str,
+               progress: Optional[Callable[[int, int], None]] = None,
+               is_cancelled: Optional[Callable[[], bool]] = None) -> int:
+        """
+        生成 [start_ms, end_ms] 期间的报表并保存到 path，返回车牌行数；期间没有记录时返回0且不生成文件。
+        progress(已写行数, 总行数) 用于报告进度；is_cancelled() 返回True时抛出 ReportCancelled。
+        """
+        with get_connection(self.db_path) as conn, \
+                archive.records_source(conn, archive.months_in_range(conn, start_ms, end_ms), start_ms, end_ms) as records:
+            total = conn.execute(PLATE_COUNT_QUERY.format(records=records), (start_ms, end_ms)).fetchone()[0]
+            if total == 0:
+                return 0
+
+            wb = openpyxl.Workbook(write_only=True)
+            try:
+                self._write_plate_sheet(wb, conn, records, start_ms, end_ms, title, total, progress, is_cancelled)
+                self._write_daily_sheet(wb, conn, start_ms, end_ms)
+            except BaseException:
+                self._discard(wb)
+                raise
+        wb.save(path)
+        return total
+
+    def _discard(self, wb):
+        """放弃写了一半的工作簿：结束各工作表的流式写入，临时文件由 openpyxl 在退出时清理"""
+        for ws in wb.worksheets:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _header(self, ws, headers):
+        cells = []
+        for text in headers:
+            cell = WriteOnlyCell(ws, value=text)
+            cell.font, cell.fill, cell.alignment = self.HEADER_FONT, self.HEADER_FILL, self.HEADER_ALIGN
+            cells.append(cell)
+        ws.append(cells)
+
+    def _number(self, ws, value):
+        cell = WriteOnlyCell(ws, value=round(value or 0.0, 2))
+        cell.number_format = '0.00'
+        return cell
+
+    def _bold(self, ws, value):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = self.HEADER_FONT
+        return cell
+
+    def _write_plate_sheet(self, wb, conn, records, start_ms, end_ms, title, total, progress, is_cancelled):
+        ws = wb.create_sheet(title[:31])  # Excel 工作表名最长31个字符
+        # write_only 模式下列宽必须在写入第一行之前设置
+        for col_letter in ['A', 'B', 'C', 'D', 'E']:
+            ws.column_dimensions[col_letter].width = 20
+        self._header(ws, ['序号', '车牌号', '停车次数', '总停车时长(小时)', '总费用(元)'])
+
+        # records 为停车记录来源（可能合并了归档库），游标须在归档库 DETACH 之前关闭
+        cursor = conn.execute(PLATE_SUMMARY_QUERY.format(records=records), (start_ms, end_ms))
+        written = 0
+        total_fee_sum = 0.0
+        with closing(cursor):
+            while True:
+                if is_cancelled and is_cancelled():
+                    raise ReportCancelled()
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                for plate, count, hours, fee in rows:
+                    written += 1
+                    ws.append([written, plate, count, self._number(ws, hours), self._number(ws, fee)])
+                    total_fee_sum += fee
+                if progress:
+                    progress(written, total)
+
+        ws.append([])
+        ws.append([self._bold(ws, "总收入"), None, None, None, self._bold(ws, f"¥{total_fee_sum:.2f}")])
+
+    def _write_daily_sheet(self, wb, conn, start_ms, end_ms):
+        ws = wb.create_sheet("每日明细")
+        for col_letter in ['A', 'B', 'C', 'D']:
+            ws.column_dimensions[col_letter].width = 20
+        self._header(ws, ['日期', '出场车辆数', '总停车时长(小时)', '总收入(元)'])
+        cursor = conn.execute(DAILY_QUERY, (from_ms(start_ms).date().isoformat(), from_ms(end_ms).date().isoformat()))
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            for day, vehicles, minutes, fee_total in rows:
+                ws.append([day, vehicles, self._number(ws, minutes / 60), self._number(ws, fee_total)])
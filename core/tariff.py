@@ -0,0 +1,206 @@
+# core/tariff.py
+"""
+声明式收费规则。
+
+收费标准写在JSON文件中（默认读取当前目录下的 tariff.json，不存在时使用与原硬编码公式相同的 DEFAULT_TARIFF），
+调整收费只需修改文件。规则编译后既可以给单次出场计费，也可以用NumPy一次为成批的 (入场, 出场) 计费，
+供 utils.tariff_sim 用整年的历史记录模拟新收费标准的收入。
+
+字段（均可省略，取 DEFAULT_TARIFF 中的值）：
+    name            规则名称
+    grace_minutes   免费时长（分钟），停车不超过该时长不收费，0表示没有免费时长
+    first_minutes   首段时长（分钟），首段按 first_fee 一次性收费
+    first_fee       首段费用（元）
+    rate            首段之后的基础费率（元/小时）
+    bands           分时段费率 [{"start": "HH:MM", "end": "HH:MM", "rate": 元/小时}]，
+                    时段可以跨越午夜（如夜间 "20:00"-"08:00"），未覆盖的时间按 rate 计费，重叠时后面的时段优先
+    unit_minutes    计费单位（分钟），不足一个单位按一个单位计；0表示按实际时长折算
+    daily_cap       每24小时（从入场起算）的封顶费用，null表示不封顶
+    classes         车牌分类规则 [{"name": 名称, "pattern": 正则表达式, 其余字段: 覆盖的值}]，
+                    按顺序取第一个匹配车牌的分类，都不匹配时使用顶层规则
+
+示例（白天10元/小时、夜间3元/小时、15分钟内免费、每天封顶60元，新能源车半价）：
+    {
+        "name": "分时收费",
+        "grace_minutes": 15,
+        "first_minutes": 60, "first_fee": 10,
+        "rate": 10,
+        "bands": [{"start": "20:00", "end": "08:00", "rate": 3}],
+        "daily_cap": 60,
+        "classes": [{"name": "新能源车", "pattern": "^.{8}$", "first_fee": 5, "rate": 5,
+                     "bands": [{"start": "20:00", "end": "08:00", "rate": 1.5}], "daily_cap": 30}]
+    }
+"""
+import json
+import os
+import re
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+TARIFF_PATH = 'tariff.json'
+MINUTES_PER_DAY = 1440
+
+# 与原 calculate_fee 公式相同：首小时15元，之后每小时10元，按实际时长折算
+DEFAULT_TARIFF = {
+    "name": "标准收费",
+    "grace_minutes": 0,
+    "first_minutes": 60,
+    "first_fee": 15.0,
+    "rate": 10.0,
+    "bands": [],
+    "unit_minutes": 0,
+    "daily_cap": None,
+    "classes": [],
+}
+
+
+def _parse_clock(text: str) -> int:
+    """'HH:MM' -> 一天中的分钟数（'24:00' 表示午夜）"""
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})", str(text))
+    if not match or int(match.group(1)) > 24 or int(match.group(2)) >= 60:
+        raise ValueError(f"时间格式应为 HH:MM: {text}")
+    minutes = int(match.group(1)) * 60 + int(match.group(2))
+    if minutes > MINUTES_PER_DAY:
+        raise ValueError(f"时间超出一天范围: {text}")
+    return minutes
+
+
+def local_minutes(ms: np.ndarray) -> np.ndarray:
+    """纪元毫秒 -> 本地时间的纪元分钟数（浮点），用于按一天中的时段计费"""
+    ms = np.asarray(ms, dtype=np.int64)
+    # 时区偏移（含夏令时）按小时查一次：一年的记录也只有几千个不同的小时
+    hours, inverse = np.unique(ms // 3600000, return_inverse=True)
+    offsets = np.array([time.localtime(int(h) * 3600).tm_gmtoff // 60 for h in hours], dtype=np.float64)
+    return ms / 60000.0 + offsets[inverse]
+
+
+class _Schedule:
+    """一个分类的收费规则编译结果：一天内的累计费用曲线加上首段、封顶等参数"""
+    def __init__(self, spec: dict):
+        self.grace_minutes = float(spec["grace_minutes"])
+        self.first_minutes = float(spec["first_minutes"])
+        self.first_fee = float(spec["first_fee"])
+        self.unit_minutes = float(spec["unit_minutes"])
+        self.daily_cap = None if spec["daily_cap"] is None else float(spec["daily_cap"])
+        if not 0 <= self.first_minutes < MINUTES_PER_DAY:
+            raise ValueError("first_minutes 应在 0 到 1440 分钟之间")
+        if min(self.grace_minutes, self.first_fee, self.unit_minutes, float(spec["rate"])) < 0:
+            raise ValueError("收费规则中的时长和金额不能为负数")
+
+        # 每分钟的费率（元/分钟），时段边界都是整分钟，累计费用在整分钟之间线性变化
+        per_minute = np.full(MINUTES_PER_DAY, float(spec["rate"]) / 60)
+        for band in spec["bands"]:
+            start, end = _parse_clock(band["start"]), _parse_clock(band["end"])
+            rate = float(band["rate"]) / 60
+            if rate < 0:
+                raise ValueError("时段费率不能为负数")
+            if start < end:
+                per_minute[start:end] = rate
+            else:  # 跨越午夜；start == end 表示全天
+                per_minute[start:] = rate
+                per_minute[:end] = rate
+        self.cumulative = np.concatenate(([0.0], np.cumsum(per_minute)))
+        self.day_total = self.cumulative[-1]
+        self._grid = np.arange(MINUTES_PER_DAY + 1, dtype=np.float64)
+
+    def _accrued(self, t):
+        """从本地纪元零点到本地时刻 t（分钟）按时段费率累计的费用"""
+        days = np.floor(t / MINUTES_PER_DAY)
+        return days * self.day_total + np.interp(t - days * MINUTES_PER_DAY, self._grid, self.cumulative)
+
+    def _cost(self, start, end):
+        return self._accrued(np.maximum(end, start)) - self._accrued(start)
+
+    def price(self, entry_ms: np.ndarray, exit_ms: np.ndarray) -> np.ndarray:
+        minutes = np.maximum((exit_ms - entry_ms) / 60000.0, 0.0)
+        billed = minutes
+        if self.unit_minutes > 0:
+            # 微小的浮点误差不应多算一个单位
+            billed = np.ceil(minutes / self.unit_minutes - 1e-9) * self.unit_minutes
+        start = local_minutes(entry_ms)
+        end = start + billed
+        cap = np.inf if self.daily_cap is None else self.daily_cap
+
+        # 从入场起每24小时为一个封顶周期：第一个周期含首段费用，中间的整周期费用与起点无关，最后一个为不足24小时的部分
+        periods = np.floor(billed / MINUTES_PER_DAY)
+        first = self.first_fee + self._cost(start + self.first_minutes, np.minimum(end, start + MINUTES_PER_DAY))
+        middle = np.maximum(periods - 1, 0) * min(self.day_total, cap)
+        last = np.where(periods >= 1, self._cost(start + periods * MINUTES_PER_DAY, end), 0.0)
+        fees = np.minimum(first, cap) + middle + np.minimum(last, cap)
+        if self.grace_minutes > 0:
+            fees = np.where(minutes <= self.grace_minutes, 0.0, fees)
+        return fees
+
+
+class Tariff:
+    """编译后的收费规则"""
+    def __init__(self, spec: Optional[dict] = None):
+        spec = dict(spec or {})
+        unknown = set(spec) - set(DEFAULT_TARIFF)
+        if unknown:
+            raise ValueError(f"未知的收费规则字段: {', '.join(sorted(unknown))}")
+        base = {**DEFAULT_TARIFF, **spec}
+        self.name = base["name"]
+        self.spec = base
+        self._base = _Schedule(base)
+        self._classes = []  # [(名称, 正则, _Schedule)]
+        for rule in base["classes"]:
+            rule = dict(rule)
+            name, pattern = rule.pop("name", None), rule.pop("pattern", None)
+            if not name or not pattern:
+                raise ValueError("车牌分类规则需要 name 和 pattern")
+            unknown = set(rule) - (set(DEFAULT_TARIFF) - {"name", "classes"})
+            if unknown:
+                raise ValueError(f"车牌分类 {name} 中有未知字段: {', '.join(sorted(unknown))}")
+            self._classes.append((name, re.compile(pattern), _Schedule({**base, **rule})))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Tariff':
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @property
+    def class_names(self) -> List[str]:
+        """分类名称，下标与 classify() 的结果对应（0为顶层规则）"""
+        return [self.name] + [name for name, _, _ in self._classes]
+
+    def classify(self, plates: Sequence[str]) -> np.ndarray:
+        """每个车牌所属分类的下标（0为顶层规则）"""
+        if not self._classes:
+            return np.zeros(len(plates), dtype=np.int64)
+        unique, inverse = np.unique(np.asarray(plates, dtype=object).astype(str), return_inverse=True)
+        classes = np.zeros(len(unique), dtype=np.int64)
+        for i, plate in enumerate(unique):
+            for k, (_, regex, _) in enumerate(self._classes, 1):
+                if regex.search(plate):
+                    classes[i] = k
+                    break
+        return classes[inverse]
+
+    def price(self, entry_ms, exit_ms, plates: Optional[Sequence[str]] = None) -> np.ndarray:
+        """为成批的停车记录计费：entry_ms/exit_ms 为纪元毫秒数组，plates 为对应车牌（省略时都按顶层规则）"""
+        entry_ms = np.asarray(entry_ms, dtype=np.int64)
+        exit_ms = np.asarray(exit_ms, dtype=np.int64)
+        if plates is None or not self._classes:
+            return self._base.price(entry_ms, exit_ms)
+        classes = self.classify(plates)
+        fees = np.empty(len(entry_ms), dtype=np.float64)
+        for k, schedule in enumerate([self._base] + [s for _, _, s in self._classes]):
+            mask = classes == k
+            if mask.any():
+                fees[mask] = schedule.price(entry_ms[mask], exit_ms[mask])
+        return fees
+
+    def fee(self, entry_ms: int, exit_ms: int, plate_number: Optional[str] = None) -> float:
+        """单次停车的费用"""
+        plates = None if plate_number is None else [plate_number]
+        return float(self.price([entry_ms], [exit_ms], plates)[0])
+
+
+def load_tariff(path: str = TARIFF_PATH) -> Tariff:
+    """读取收费规则文件，文件不存在时使用默认规则"""
+    if path and os.path.exists(path):
+        return Tariff.from_file(path)
+    return Tariff(DEFAULT_TARIFF)
@@ -0,0 +1,125 @@
+# core/tracing.py
+"""
+闸机事件的端到端追踪。
+
+每次稳定识别出一块车牌都生成一个带追踪ID的 GateTrace，从这块车牌第一次被识别到的那一帧开始，
+沿途在各环节记下时间点（采集、识别、投票稳定、送达界面、数据库开始处理、出入场提交……），
+事件处理完后作为一行JSON追加到追踪日志，由 utils.trace_report 汇总分析。
+追踪日志默认关闭：图形界面设置环境变量 PARKING_TRACE_LOG，识别服务使用 --trace-log 开启。
+
+时间点统一用 time.monotonic()，跨线程可以直接相减；日志中记录的是相对第一帧的毫秒数。
+追踪日志超过 max_bytes 时改名为 .1 备份后重新开始，只保留一个备份。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+TRACE_PATH = 'gate_traces.jsonl'
+
+
+class GateTrace:
+    """
+    一次闸机事件的追踪。
+    started 为这块车牌第一次被识别到的帧的采集时刻（monotonic），之后的各环节用 mark() 记录；
+    frames 为从该帧到投票稳定共经过的帧数，votes 为稳定时投票窗口内该车牌得到的票数。
+    """
+    def __init__(self, plate_number: str, source: str, started: Optional[float] = None,
+                 frames: Optional[int] = None, votes: Optional[int] = None):
+        now = time.monotonic()
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.plate_number = plate_number
+        self.source = source
+        self.started = now if started is None else started
+        # 把单调时钟的起点换算为墙上时间，仅用于在日志中标注事件发生的时刻
+        self.started_at = time.time() - (now - self.started)
+        self.frames = frames
+        self.votes = votes
+        self.hops = [('first_seen', self.started)]
+        self.info = {}
+        self.finished = False
+
+    def mark(self, hop: str, at: Optional[float] = None):
+        """记录到达某个环节的时刻，at 省略时为当前时刻"""
+        self.hops.append((hop, time.monotonic() if at is None else at))
+
+    def elapsed_ms(self) -> float:
+        return (self.hops[-1][1] - self.started) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "plate_number": self.plate_number,
+            "source": self.source,
+            "time": datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            "frames": self.frames,
+            "votes": self.votes,
+            "hops": {hop: round((at - self.started) * 1000, 3) for hop, at in self.hops},
+            "total_ms": round(self.elapsed_ms(), 3),
+            **self.info,
+        }
+
+    def finish(self, hop: Optional[str] = None, **info):
+        """记录最后一个环节和结果（如 action、result、error），并写入追踪日志；重复调用只写一次"""
+        if self.finished:
+            return
+        self.finished = True
+        if hop:
+            self.mark(hop)
+        self.info.update(info)
+        log = get_trace_log()
+        if log is not None:
+            log.write(self)
+
+
+def trace_for_track(track, source: str, frame_index: Optional[int] = None) -> GateTrace:
+    """为刚变为稳定的跟踪轨迹（core.plate_tracker.Track）创建追踪，起点为轨迹第一次被识别到的时刻"""
+    frames = None
+    if frame_index is not None and track.first_frame is not None:
+        frames = frame_index - track.first_frame + 1
+    # 轨迹的 hits 还包括投给其他候选车牌的帧，这里只记稳定结果本身的票数
+    votes = track.tally.get(track.emitted, [0])[0]
+    return GateTrace(track.emitted, source, started=track.first_seen, frames=frames, votes=votes)
+
+
+class TraceLog:
+    """追加写入的JSON行追踪日志（线程安全）"""
+    def __init__(self, path: str = TRACE_PATH, max_bytes: int = 20 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def write(self, trace: GateTrace):
+        line = json.dumps(trace.to_dict(), ensure_ascii=False) + '\n'
+        with self._lock:
+            try:
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                # 追踪只用于分析，写入失败不能影响闸机
+                print(f"写入追踪日志失败: {e}")
+
+
+_log = None
+
+
+def get_trace_log() -> Optional[TraceLog]:
+    return _log
+
+
+def configure_from_env() -> bool:
+    """按环境变量 PARKING_TRACE_LOG（追踪日志路径）开启追踪日志，返回是否开启"""
+    path = os.environ.get('PARKING_TRACE_LOG')
+    set_trace_log(path)
+    return bool(path)
+
+
+def set_trace_log(path: Optional[str], max_bytes: int = 20 * 1024 * 1024):
+    """更换追踪日志文件，path 为 None 或空字符串时不再记录"""
+    global _log
+    _log = TraceLog(path, max_bytes) if path else None
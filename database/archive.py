@@ -0,0 +1,261 @@
+# database/archive.py
+"""
+已结束停车记录的冷热分离归档。
+
+出场时间早于指定天数的停车记录按入场月份移到独立的归档库 archive/parking_YYYY-MM.db，
+主库只保留近期和在场的记录，体积小到可以整个留在页缓存中。
+主库中的 archive_months 记录每个归档库覆盖的入场时间范围，archived_plates 记录每个车牌出现在哪些月份，
+查询历史或生成报表时只在请求的范围确实涉及归档月份时才 ATTACH 对应的归档库并与主库 UNION ALL。
+按日收费汇总 daily_revenue 不随归档删除，收费报表仍包含已归档的收入。
+
+执行归档（默认归档180天前结束的停车记录）：
+    python -m database.archive --older-than-days 180
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+from .database_manager import get_connection, setup_database
+from .timestamps import now_ms
+
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_DIR = 'archive'
+RECORD_COLUMNS = "id, plate_number, entry_time, exit_time, fee, spot_number"
+# SQLite 默认最多同时 ATTACH 10 个数据库，超过时改为把归档记录复制到临时表
+MAX_ATTACHED = 10
+
+# 停车记录的入场本地月份，与 revenue.DAY_EXPR 的日期口径一致
+MONTH_EXPR = "strftime('%Y-%m', entry_time / 1000, 'unixepoch', 'localtime')"
+
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.parking_records (
+        id INTEGER PRIMARY KEY,       -- 与主库中的id相同
+        plate_number TEXT NOT NULL,
+        entry_time INTEGER NOT NULL,  -- 纪元毫秒
+        exit_time INTEGER,
+        fee REAL,
+        spot_number INTEGER NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_records_plate_entry ON parking_records (plate_number, entry_time)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_records_entry_time ON parking_records (entry_time)",
+)
+
+
+def _has_catalog(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'archive_months'").fetchone() is not None
+
+
+def _resolve(conn, file: str) -> str:
+    """归档库的绝对路径（相对于主库文件所在目录）"""
+    main_file = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+    return os.path.join(os.path.dirname(main_file), file)
+
+
+def months_in_range(conn, start_ms: int, end_ms: int) -> List[Tuple[str, str]]:
+    """与入场时间 [start_ms, end_ms] 有交集的归档月份 [(月份, 归档库路径)]"""
+    if not _has_catalog(conn):
+        return []
+    rows = conn.execute(
+        "SELECT month, file FROM archive_months WHERE start_ms <= ? AND end_ms >= ? ORDER BY month",
+        (end_ms, start_ms)
+    ).fetchall()
+    return [(month, _resolve(conn, file)) for month, file in rows]
+
+
+def months_for_plate(conn, plate_number: str) -> List[Tuple[str, str]]:
+    """含有该车牌记录的归档月份 [(月份, 归档库路径)]"""
+    if not _has_catalog(conn):
+        return []
+    rows = conn.execute(
+        "SELECT m.month, m.file FROM archived_plates p JOIN archive_months m ON m.month = p.month "
+        "WHERE p.plate_number = ? ORDER BY m.month",
+        (plate_number,)
+    ).fetchall()
+    return [(month, _resolve(conn, file)) for month, file in rows]
+
+
+def months_matching(conn, plate_filter: Tuple[str, list] = None, start_ms: int = None,
+                    end_ms: int = None) -> List[Tuple[str, str]]:
+    """
+    可能含有符合条件记录的归档月份 [(月份, 归档库路径)]：与入场时间 [start_ms, end_ms] 有交集（省略时不限），
+    且含有满足 plate_filter 的车牌。plate_filter 为针对 plate_number 列的 (条件, 参数)，
+    例如 plate_index.substring_filter() 的结果。
+    """
+    if not _has_catalog(conn):
+        return []
+    query, params = "SELECT month, file FROM archive_months WHERE 1=1", []
+    if start_ms is not None and end_ms is not None:
+        query += " AND start_ms <= ? AND end_ms >= ?"
+        params += [end_ms, start_ms]
+    if plate_filter:
+        clause, clause_params = plate_filter
+        query += f" AND month IN (SELECT month FROM archived_plates WHERE {clause})"
+        params += list(clause_params)
+    rows = conn.execute(query + " ORDER BY month", params).fetchall()
+    return [(month, _resolve(conn, file)) for month, file in rows]
+
+
+def archive_files(conn) -> List[str]:
+    """所有归档库的路径"""
+    if not _has_catalog(conn):
+        return []
+    return [_resolve(conn, file) for file, in conn.execute("SELECT file FROM archive_months ORDER BY month")]
+
+
+def _attach(conn, path: str, schema: str):
+    if not os.path.exists(path):
+        # ATTACH 不存在的文件会静默创建一个空库，这里明确报错
+        raise sqlite3.OperationalError(f"归档库不存在: {path}")
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+
+
+@contextmanager
+def records_source(conn, months: List[Tuple[str, str]], start_ms: int = None, end_ms: int = None) -> Iterator[str]:
+    """
+    返回可放在 FROM 之后的停车记录来源：没有涉及归档月份时就是 parking_records，
+    否则为主库与各归档库的 UNION ALL 子查询（WHERE 条件会被下推到各个分支，仍然走各自的索引）。
+    归档月份超过 ATTACH 上限时，把 [start_ms, end_ms] 内的归档记录复制到临时表再合并。
+    退出时 DETACH 归档库，连接可以安全归还连接池；调用方须在退出前读完或关闭游标。
+    """
+    if not months:
+        yield "parking_records"
+        return
+
+    select = f"SELECT {RECORD_COLUMNS} FROM {{}}.parking_records"
+    if len(months) <= MAX_ATTACHED:
+        schemas = []
+        try:
+            for i, (_, path) in enumerate(months):
+                _attach(conn, path, f"archive_{i}")
+                schemas.append(f"archive_{i}")
+            yield "(" + " UNION ALL ".join(select.format(schema) for schema in ['main'] + schemas) + ")"
+        finally:
+            for schema in schemas:
+                conn.execute(f"DETACH DATABASE {schema}")
+        return
+
+    where, params = "", []
+    if start_ms is not None and end_ms is not None:
+        where, params = " WHERE entry_time BETWEEN ? AND ?", [start_ms, end_ms]
+    conn.execute("DROP TABLE IF EXISTS temp.archived_records")
+    conn.execute(f"CREATE TEMP TABLE archived_records AS {select.format('main')} WHERE 0")
+    try:
+        for _, path in months:
+            _attach(conn, path, "archive_copy")
+            try:
+                conn.execute(f"INSERT INTO temp.archived_records {select.format('archive_copy')}{where}", params)
+                conn.commit()  # 事务中不能 DETACH
+            finally:
+                conn.execute("DETACH DATABASE archive_copy")
+        yield f"({select.format('main')} UNION ALL SELECT {RECORD_COLUMNS} FROM temp.archived_records)"
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.archived_records")
+
+
+def archive_closed(conn, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = 1000) -> List[Tuple[str, int]]:
+    """
+    把出场时间早于 older_than_days 天前的停车记录移到按入场月份划分的归档库，返回 [(月份, 归档条数)]。
+    每批记录先在一个事务中写入归档库，再在另一个事务中从主库删除已确认写入归档库的记录：
+    中途中断时最多留下已复制但未删除的记录，重新执行会跳过它们，不会丢失数据。
+    批次较小，每个写事务只短暂持有主库写锁，不会长时间阻塞闸机入场/出场。
+    """
+    cutoff = now_ms() - older_than_days * 86400000
+    # 已出场记录的入场时间一定早于出场时间，加上 entry_time 条件才能走入场时间索引
+    candidates = "entry_time < ? AND exit_time IS NOT NULL AND exit_time < ?"
+    months = conn.execute(
+        f"SELECT {MONTH_EXPR} AS month, MIN(entry_time), MAX(entry_time) FROM parking_records "
+        f"WHERE {candidates} GROUP BY month ORDER BY month",
+        (cutoff, cutoff)
+    ).fetchall()
+
+    archived = []
+    for month, first_ms, last_ms in months:
+        file = os.path.join(ARCHIVE_DIR, f"parking_{month}.db")
+        path = _resolve(conn, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            for statement in ARCHIVE_SCHEMA:
+                conn.execute(statement.format(schema='archive'))
+            moved = 0
+            while True:
+                ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM main.parking_records WHERE entry_time BETWEEN ? AND ? AND {candidates} "
+                    f"AND {MONTH_EXPR} = ? ORDER BY id LIMIT ?",
+                    (first_ms, last_ms, cutoff, cutoff, month, batch_size)
+                )]
+                if not ids:
+                    break
+                in_ids = f"id IN ({','.join('?' * len(ids))})"
+                with conn:
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.parking_records ({RECORD_COLUMNS}) "
+                        f"SELECT {RECORD_COLUMNS} FROM main.parking_records WHERE {in_ids}", ids
+                    )
+                with conn:
+                    conn.execute(
+                        "INSERT INTO archive_months (month, file, start_ms, end_ms, records) "
+                        f"SELECT ?, ?, MIN(entry_time), MAX(entry_time), COUNT(*) FROM main.parking_records WHERE {in_ids} "
+                        "ON CONFLICT(month) DO UPDATE SET start_ms = MIN(start_ms, excluded.start_ms), "
+                        "end_ms = MAX(end_ms, excluded.end_ms), records = records + excluded.records",
+                        [month, file] + ids
+                    )
+                    conn.execute(
+                        "INSERT OR IGNORE INTO archived_plates (plate_number, month) "
+                        f"SELECT DISTINCT plate_number, ? FROM main.parking_records WHERE {in_ids}",
+                        [month] + ids
+                    )
+                    # 只删除已经确认在归档库中的记录
+                    confirmed = [row[0] for row in conn.execute(
+                        f"SELECT id FROM archive.parking_records WHERE {in_ids}", ids)]
+                    in_confirmed = f"id IN ({','.join('?' * len(confirmed))})"
+                    # 删除会触发 plates 的计数减一、减到0时移出车牌检索索引；归档的记录仍然可以检索，
+                    # 先把它们计入 plates.records，删除后计数不变
+                    conn.execute(
+                        "UPDATE plates SET records = records + (SELECT COUNT(*) FROM main.parking_records AS r "
+                        f"WHERE r.plate_number = plates.plate_number AND r.{in_confirmed}) "
+                        f"WHERE plate_number IN (SELECT plate_number FROM main.parking_records WHERE {in_confirmed})",
+                        confirmed + confirmed
+                    )
+                    cursor = conn.execute(f"DELETE FROM main.parking_records WHERE {in_confirmed}", confirmed)
+                moved += cursor.rowcount
+            if moved:
+                # 中断后重新执行时，批次中可能有之前已复制过的记录，以归档库中的实际条数为准
+                with conn:
+                    conn.execute("UPDATE archive_months SET records = (SELECT COUNT(*) FROM archive.parking_records) "
+                                 "WHERE month = ?", (month,))
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        archived.append((month, moved))
+    return archived
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='把已结束的历史停车记录归档到按月划分的归档库')
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f'归档出场时间早于多少天前的记录（默认 {ARCHIVE_AFTER_DAYS}）')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每个事务移动的记录数')
+    parser.add_argument('--vacuum', action='store_true', help='归档后执行 VACUUM 收缩主库文件')
+    parser.add_argument('--db', default='parking.db', help='数据库文件路径')
+    args = parser.parse_args(argv)
+
+    setup_database(args.db)
+    with get_connection(args.db) as conn:
+        archived = archive_closed(conn, args.older_than_days, args.batch_size)
+        for month, moved in archived:
+            print(f"{month}\t归档 {moved} 条记录")
+        if not archived:
+            print("没有需要归档的记录。")
+        if args.vacuum:
+            conn.execute("VACUUM")
+            print("主库已收缩。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
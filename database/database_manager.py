@@ -1,10 +1,396 @@
 # database/database_manager.py
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import closing, contextmanager
 
-def setup_database():
-    """初始化数据库并创建所需的表结构"""
+from .timestamps import parse_legacy
+
+DB_PATH = 'parking.db'
+
+# 每个连接打开时执行的PRAGMA：
+# WAL 让读写互不阻塞；synchronous=NORMAL 在WAL下仍能保证崩溃后数据库一致，且每次提交不必刷盘；
+# 负数 cache_size 表示KB（约20MB页缓存）；mmap 让读取直接走内存映射；临时表与排序放在内存中
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+class ConnectionPool:
+    """
+    SQLite连接池。
+    连接长期复用，避免每次操作都重新打开文件、解析schema；
+    sqlite3 会按连接缓存预编译语句（cached_statements），复用连接后缓存才能真正命中。
+    """
+    def __init__(self, db_path: str = DB_PATH, size: int = 4, cached_statements: int = 256):
+        self.db_path = db_path
+        self.size = size
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()  # 后进先出，优先复用最热的连接
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def open_dedicated(self) -> sqlite3.Connection:
+        """
+        打开一个不进入连接池、由调用方独占的连接（同样应用上述PRAGMA）。
+        用于需要长期持有同一连接的场景，例如依赖 PRAGMA data_version 感知其他连接的修改。
+        """
+        return self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self, timeout: float = 10.0) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("数据库连接池已耗尽")
+
+    def release(self, conn: sqlite3.Connection):
+        # 归还前回滚未提交的事务，避免把半截事务留给下一个使用者
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，用完自动归还（不会关闭连接）"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str = DB_PATH) -> ConnectionPool:
+    """获取指定数据库文件的进程级连接池"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+def get_connection(db_path: str = DB_PATH):
+    """
+    从连接池借出一个连接的上下文管理器，所有模块都应通过它访问数据库：
+        with get_connection() as conn:
+            conn.execute(...)
+    注意它不会自动提交，写操作仍需 conn.commit() 或使用 `with conn:` 事务块。
+    """
+    return get_pool(db_path).connection()
+
+
+# 停车记录表索引的定义。重建表（迁移3）后需要全部重新创建
+RECORD_INDEXES = (
+    # 在场车辆（部分索引，只包含未出场记录）：启动时重建占用索引、按车牌查找在场记录
+    "CREATE INDEX IF NOT EXISTS idx_open_sessions ON parking_records (plate_number, spot_number, entry_time) "
+    "WHERE exit_time IS NULL",
+    # 按车牌查询历史记录，并按入场时间排序
+    "CREATE INDEX IF NOT EXISTS idx_records_plate_entry ON parking_records (plate_number, entry_time)",
+    # 按入场时间范围查询（记录搜索、月度报表）
+    "CREATE INDEX IF NOT EXISTS idx_records_entry_time ON parking_records (entry_time)",
+)
+OPEN_UNIQUE_INDEXES = (
+    # 同一车牌最多一条未出场记录，同一车位最多被一条未出场记录占用。
+    # 多台闸机并发写入时，即使应用层判断出错，数据库也会拒绝重复占用
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_open_plate ON parking_records (plate_number) WHERE exit_time IS NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_open_spot ON parking_records (spot_number) WHERE exit_time IS NULL",
+)
+
+# 在场记录的变更日志：插入停车记录、出场（或改动车牌、车位）、删除未出场记录时由触发器追加一行。
+# ParkingSystem 发现其他连接提交过修改后只读取新增的变更，按这些记录的当前状态增量更新占用索引，
+# 不必每次都重新读取全部在场记录；seq 按提交顺序递增
+OCCUPANCY_CHANGES = (
+    "CREATE TABLE IF NOT EXISTS occupancy_changes ("
+    "seq INTEGER PRIMARY KEY AUTOINCREMENT, record_id INTEGER NOT NULL)",
+    "CREATE TRIGGER IF NOT EXISTS trg_occupancy_insert AFTER INSERT ON parking_records "
+    "BEGIN INSERT INTO occupancy_changes (record_id) VALUES (NEW.id); END",
+    "CREATE TRIGGER IF NOT EXISTS trg_occupancy_update AFTER UPDATE OF plate_number, spot_number, exit_time "
+    "ON parking_records BEGIN INSERT INTO occupancy_changes (record_id) VALUES (NEW.id); END",
+    # 归档时删除的都是已出场记录，与占用无关，不记日志
+    "CREATE TRIGGER IF NOT EXISTS trg_occupancy_delete AFTER DELETE ON parking_records WHEN OLD.exit_time IS NULL "
+    "BEGIN INSERT INTO occupancy_changes (record_id) VALUES (OLD.id); END",
+)
+
+
+def _epoch_timestamps(conn):
+    """
+    把 entry_time/exit_time 从 datetime 字符串改为纪元毫秒整数。
+    SQLite 不能修改列类型，按官方推荐的方式新建表、整表转换复制后替换旧表。
+    """
+    conn.create_function("parse_legacy", 1, parse_legacy, deterministic=True)
+    conn.execute('''
+    CREATE TABLE parking_records_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        plate_number TEXT NOT NULL,
+        entry_time INTEGER NOT NULL,  -- 纪元毫秒
+        exit_time INTEGER,            -- 纪元毫秒，未出场为NULL
+        fee REAL,
+        spot_number INTEGER NOT NULL
+    )
+    ''')
+    conn.execute(
+        "INSERT INTO parking_records_new (id, plate_number, entry_time, exit_time, fee, spot_number) "
+        "SELECT id, plate_number, parse_legacy(entry_time), parse_legacy(exit_time), fee, spot_number "
+        "FROM parking_records"
+    )
+    # 保留自增计数，已删除记录的id不会被重新使用
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'parking_records_new'")
+    conn.execute(
+        "INSERT INTO sqlite_sequence (name, seq) "
+        "SELECT 'parking_records_new', seq FROM sqlite_sequence WHERE name = 'parking_records'"
+    )
+    conn.execute("DROP TABLE parking_records")
+    conn.execute("ALTER TABLE parking_records_new RENAME TO parking_records")
+    for statement in RECORD_INDEXES + OPEN_UNIQUE_INDEXES:
+        conn.execute(statement)
+
+
+# 按日收费汇总表（迁移4建表，迁移8含归档记录重建）。以下迁移内容都是发布时的原样副本，
+# 与 revenue / plate_index / archive 中仍在演进的实现分开，日后修改这些模块不会改变老数据库的迁移结果
+DAILY_REVENUE_TABLE = (
+    "CREATE TABLE IF NOT EXISTS daily_revenue ("
+    "day TEXT PRIMARY KEY, vehicles INTEGER NOT NULL, fee_total REAL NOT NULL, total_minutes REAL NOT NULL"
+    ") WITHOUT ROWID"
+)
+DAILY_REVENUE_TOTALS = (
+    "SELECT DATE(entry_time / 1000, 'unixepoch', 'localtime') AS day, COUNT(*), SUM(fee), "
+    "SUM((exit_time - entry_time) / 60000.0) FROM parking_records WHERE fee IS NOT NULL GROUP BY day"
+)
+DAILY_REVENUE_V4 = (
+    DAILY_REVENUE_TABLE,
+    "DELETE FROM daily_revenue",
+    f"INSERT INTO daily_revenue (day, vehicles, fee_total, total_minutes) {DAILY_REVENUE_TOTALS}",
+)
+
+# 迁移5时 OCR 易混淆字符的归一映射，与 plate_index.canonical() 当时的结果一致
+PLATE_KEY_V5 = (('8', 'B'), ('0', 'D'), ('O', 'D'), ('Q', 'D'), ('1', 'I'), ('L', 'I'), ('5', 'S'), ('2', 'Z'), ('6', 'G'))
+
+
+def _plate_key_v5(expr):
+    sql = f"UPPER({expr})"
+    for src, dst in PLATE_KEY_V5:
+        sql = f"REPLACE({sql}, '{src}', '{dst}')"
+    return sql
+
+
+def _plate_index_v5(conn):
+    """创建 plates 表、FTS5 trigram 索引和同步触发器，并从已有记录回填"""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS plates ("
+        "id INTEGER PRIMARY KEY, plate_number TEXT NOT NULL UNIQUE, plate_key TEXT NOT NULL, records INTEGER NOT NULL)"
+    )
+    new_key = _plate_key_v5("NEW.plate_number")
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_records_plate_insert AFTER INSERT ON parking_records BEGIN
+        INSERT INTO plates (plate_number, plate_key, records) VALUES (NEW.plate_number, {new_key}, 1)
+        ON CONFLICT(plate_number) DO UPDATE SET records = records + 1;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_records_plate_delete AFTER DELETE ON parking_records BEGIN
+        UPDATE plates SET records = records - 1 WHERE plate_number = OLD.plate_number;
+        DELETE FROM plates WHERE plate_number = OLD.plate_number AND records <= 0;
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_records_plate_update AFTER UPDATE OF plate_number ON parking_records
+    WHEN NEW.plate_number IS NOT OLD.plate_number BEGIN
+        UPDATE plates SET records = records - 1 WHERE plate_number = OLD.plate_number;
+        DELETE FROM plates WHERE plate_number = OLD.plate_number AND records <= 0;
+        INSERT INTO plates (plate_number, plate_key, records) VALUES (NEW.plate_number, {new_key}, 1)
+        ON CONFLICT(plate_number) DO UPDATE SET records = records + 1;
+    END
+    ''')
+    conn.execute("DELETE FROM plates")
+    conn.execute(
+        f"INSERT INTO plates (plate_number, plate_key, records) "
+        f"SELECT plate_number, {_plate_key_v5('plate_number')}, COUNT(*) FROM parking_records GROUP BY plate_number"
+    )
+
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS plates_fts USING fts5("
+            "plate_number, plate_key, content='plates', content_rowid='id', tokenize='trigram')"
+        )
+    except sqlite3.OperationalError as e:
+        # SQLite 3.34 之前没有 trigram 分词器：仍可使用，只是子串查询退回对 plates 表做 LIKE
+        print(f"警告: 当前SQLite不支持FTS5 trigram索引，车牌检索将使用普通子串匹配: {e}")
+        return
+    # 外部内容索引需要在 plates 变化时手工同步
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_plates_fts_insert AFTER INSERT ON plates BEGIN
+        INSERT INTO plates_fts (rowid, plate_number, plate_key) VALUES (NEW.id, NEW.plate_number, NEW.plate_key);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_plates_fts_delete AFTER DELETE ON plates BEGIN
+        INSERT INTO plates_fts (plates_fts, rowid, plate_number, plate_key)
+        VALUES ('delete', OLD.id, OLD.plate_number, OLD.plate_key);
+    END
+    ''')
+    conn.execute("INSERT INTO plates_fts (plates_fts) VALUES ('rebuild')")
+
+
+# 历史记录归档目录：archive_months 为各月归档库的文件（相对于主库所在目录）与入场时间范围，
+# archived_plates 记录每个车牌出现在哪些月份的归档库中
+ARCHIVE_CATALOG_V6 = (
+    "CREATE TABLE IF NOT EXISTS archive_months ("
+    "month TEXT PRIMARY KEY, file TEXT NOT NULL, start_ms INTEGER NOT NULL, end_ms INTEGER NOT NULL, "
+    "records INTEGER NOT NULL) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS archived_plates ("
+    "plate_number TEXT NOT NULL, month TEXT NOT NULL, PRIMARY KEY (plate_number, month)) WITHOUT ROWID",
+)
+
+
+def _daily_revenue_v8(conn):
+    """
+    从主库和所有归档库的停车记录重建按日收费汇总表。
+    归档库用独立连接读取：迁移在事务中执行，事务中不能 ATTACH
+    """
+    for statement in DAILY_REVENUE_V4:
+        conn.execute(statement)
+    main_file = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+    for file, in conn.execute("SELECT file FROM archive_months ORDER BY month").fetchall():
+        with closing(sqlite3.connect(os.path.join(os.path.dirname(main_file), file))) as source:
+            rows = source.execute(DAILY_REVENUE_TOTALS).fetchall()
+        conn.executemany(
+            "INSERT INTO daily_revenue (day, vehicles, fee_total, total_minutes) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(day) DO UPDATE SET vehicles = vehicles + excluded.vehicles, "
+            "fee_total = fee_total + excluded.fee_total, total_minutes = total_minutes + excluded.total_minutes",
+            rows
+        )
+
+
+def _archived_plates_v9(conn):
+    """
+    把已归档的记录计入车牌检索索引 plates。
+    此前归档删除主库记录时触发器会把计数减掉，只剩归档记录的车牌被移出索引，检索不到
+    """
+    main_file = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+    for file, in conn.execute("SELECT file FROM archive_months ORDER BY month").fetchall():
+        path = os.path.join(os.path.dirname(main_file), file)
+        if not os.path.exists(path):
+            continue
+        with closing(sqlite3.connect(path)) as source:
+            rows = source.execute("SELECT plate_number, COUNT(*) FROM parking_records GROUP BY plate_number").fetchall()
+        conn.executemany(
+            f"INSERT INTO plates (plate_number, plate_key, records) VALUES (?1, {_plate_key_v5('?1')}, ?2) "
+            "ON CONFLICT(plate_number) DO UPDATE SET records = records + excluded.records",
+            rows
+        )
+
+
+# 数据库结构迁移，按版本号顺序执行，已执行到的版本记录在 PRAGMA user_version 中。
+# 每项为 (版本号, 说明, [SQL语句或 接收连接的函数])；已发布的迁移不要修改，结构变化一律追加新版本。
+# 迁移内容只写在本模块中，不调用其他模块中会随版本变化的函数
+MIGRATIONS = (
+    (1, "停车记录热点查询索引", RECORD_INDEXES),
+    (2, "在场记录唯一约束", OPEN_UNIQUE_INDEXES),
+    (3, "停车时间改为纪元毫秒整数", [_epoch_timestamps]),
+    # 建表并从已有停车记录回填
+    (4, "按日收费汇总表", DAILY_REVENUE_V4),
+    (5, "车牌子串检索索引", [_plate_index_v5]),
+    (6, "历史记录归档目录", ARCHIVE_CATALOG_V6),
+    (7, "在场记录变更日志", OCCUPANCY_CHANGES),
+    # 汇总表改为包含已归档的记录
+    (8, "按日收费汇总表重建（含归档记录）", [_daily_revenue_v8]),
+    (9, "车牌检索索引补回已归档的车牌", [_archived_plates_v9]),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+class MigrationError(RuntimeError):
+    """数据库结构迁移失败，数据库停留在上一个版本，程序不应继续启动"""
+
+
+def get_schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """
+    依次执行尚未执行的迁移，返回迁移后的版本号。
+    每个迁移在独立的 IMMEDIATE 事务中执行并同时更新 user_version，
+    多个进程同时启动时只有一个会真正执行，失败的迁移整体回滚并抛出 MigrationError，
+    之后的迁移不再执行，下次启动时重试。
+    """
+    for version, description, statements in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 取得写锁后再确认一次，其他进程可能刚刚执行完同一个迁移
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            message = f"数据库迁移 {version}（{description}）失败: {e}"
+            if isinstance(e, sqlite3.IntegrityError):
+                message += "\n存在重复的在场记录（同一车牌或车位有多条未出场记录），请清理后重新启动。"
+            raise MigrationError(message) from e
+        print(f"数据库已迁移到版本 {version}: {description}")
+    return get_schema_version(conn)
+
+
+def setup_database(db_path: str = DB_PATH):
+    """初始化数据库并创建所需的表结构，然后执行结构迁移；迁移失败时抛出 MigrationError"""
     # 连接到SQLite数据库，如果文件不存在，则会自动创建
-    conn = sqlite3.connect('parking.db')
+    with get_connection(db_path) as conn:
+        _create_schema(conn)
+        migrate(conn)
+    print("数据库初始化完成。")
+
+
+def _create_schema(conn):
     cursor = conn.cursor()
 
     # 创建用户表 (users)
@@ -50,7 +436,5 @@ def setup_database():
         # 如果用户名已存在，则会抛出此异常，我们直接忽略即可
         pass
 
-    # 提交事务并关闭连接
+    # 提交事务
     conn.commit()
-    conn.close()
-    print("数据库初始化完成。")
\ No newline at end of file
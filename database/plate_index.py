@@ -0,0 +1,101 @@
+# database/plate_index.py
+"""
+车牌子串检索索引。
+
+plates 表保存出现过的每个不同车牌（及其记录数，包括已归档的记录），由 parking_records 上的触发器自动维护；
+plates_fts 是 plates 的 FTS5 trigram（三字母组）外部内容索引，子串查询只需查索引而不必扫描全部停车记录。
+plate_key 列是把OCR容易混淆的字符（如 8/B、0/D）归一后的车牌，用于查找识别有误的近似车牌。
+"""
+from typing import List, Optional, Tuple
+
+# OCR容易混淆的字符 -> 归一后的字符。
+# 该映射也写进了 plates 表的触发器（database_manager 中的迁移5），修改时需要追加新迁移重建触发器和 plate_key
+CONFUSABLE = {
+    '8': 'B', '0': 'D', 'O': 'D', 'Q': 'D', '1': 'I', 'L': 'I', '5': 'S', '2': 'Z', '6': 'G',
+}
+
+MIN_TRIGRAM = 3  # trigram 索引只能检索长度不少于3的子串，更短的查询退回对 plates 表做 LIKE
+
+
+def canonical(plate: str) -> str:
+    return ''.join(CONFUSABLE.get(ch, ch) for ch in plate.upper())
+
+
+def _phrase(text: str) -> str:
+    """FTS5 查询中的短语字面量"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _like_pattern(text: str) -> str:
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def has_fts(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'plates_fts'").fetchone() is not None
+
+
+def substring_filter(conn, text: str) -> Tuple[str, list]:
+    """
+    返回可拼入 parking_records 查询 WHERE 子句的 (条件, 参数)，匹配车牌中包含 text 的记录。
+    先在 plates 上定位匹配的车牌，再按 (plate_number, entry_time) 索引取记录。
+    """
+    text = text.strip().upper()
+    if len(text) >= MIN_TRIGRAM and has_fts(conn):
+        return ("plate_number IN (SELECT plate_number FROM plates WHERE id IN "
+                "(SELECT rowid FROM plates_fts WHERE plates_fts MATCH ?))",
+                [f"plate_number : {_phrase(text)}"])
+    return ("plate_number IN (SELECT plate_number FROM plates WHERE plate_number LIKE ? ESCAPE '\\')",
+            [_like_pattern(text)])
+
+
+def edit_distance(a: str, b: str, confusion_cost: float = 0.5) -> float:
+    """Levenshtein 编辑距离；OCR易混淆字符之间的替换只计 confusion_cost"""
+    a, b = a.upper(), b.upper()
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        current = [float(i)]
+        ka = CONFUSABLE.get(ca, ca)
+        for j, cb in enumerate(b, 1):
+            if ca == cb:
+                cost = 0.0
+            elif ka == CONFUSABLE.get(cb, cb):
+                cost = confusion_cost
+            else:
+                cost = 1.0
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost))
+        previous = current
+    return previous[-1]
+
+
+def search(conn, text: str, limit: int = 20, max_distance: Optional[float] = None,
+           candidates: int = 500) -> List[Tuple[str, float, int]]:
+    """
+    检索与 text 相近的车牌，返回按编辑距离升序的 [(车牌号, 距离, 记录数)]。
+    候选集来自归一化车牌 plate_key 的 trigram 索引：与查询共享任一三字母组（或包含查询子串）的车牌，
+    因此 8/B 这类识别误差、以及缺字/多字的车牌都能被找到，再在Python中精确计算距离排序。
+    """
+    text = text.strip().upper()
+    if not text:
+        return []
+    key = canonical(text)
+    if len(key) >= MIN_TRIGRAM and has_fts(conn):
+        grams = sorted({key[i:i + 3] for i in range(len(key) - 2)})
+        match = "plate_key : (" + " OR ".join(_phrase(g) for g in grams) + ")"
+        rows = conn.execute(
+            "SELECT p.plate_number, p.records FROM plates_fts f JOIN plates p ON p.id = f.rowid "
+            "WHERE plates_fts MATCH ? ORDER BY f.rank LIMIT ?",
+            (match, candidates)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT plate_number, records FROM plates WHERE plate_key LIKE ? ESCAPE '\\' LIMIT ?",
+            (_like_pattern(key), candidates)
+        ).fetchall()
+
+    results = []
+    for plate, records in rows:
+        distance = edit_distance(text, plate)
+        if max_distance is None or distance <= max_distance:
+            results.append((plate, distance, records))
+    results.sort(key=lambda item: (item[1], -item[2], item[0]))
+    return results[:limit]
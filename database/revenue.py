@@ -0,0 +1,118 @@
+# database/revenue.py
+"""
+按日汇总的收费统计（daily_revenue）。
+车辆出场时在同一事务中累加当天的汇总行，收费报表只读汇总表，耗时与历史记录的多少无关。
+日期按入场时间的本地日期划分，与原来的 GROUP BY DATE(entry_time) 报表口径一致。
+
+重建汇总表（例如手工修改过停车记录之后）：
+    python -m database.revenue --rebuild
+"""
+import argparse
+import sqlite3
+import sys
+from contextlib import closing
+from typing import Iterable, List
+
+from . import archive
+from .database_manager import get_connection, setup_database
+from .timestamps import from_ms
+
+# 停车记录的入场本地日期，与 Python 端 day_key 的结果一致
+DAY_EXPR = "DATE(entry_time / 1000, 'unixepoch', 'localtime')"
+
+CREATE_TABLE = '''
+CREATE TABLE IF NOT EXISTS daily_revenue (
+    day TEXT PRIMARY KEY,           -- 入场日期 YYYY-MM-DD
+    vehicles INTEGER NOT NULL,      -- 已出场（已收费）的车辆数
+    fee_total REAL NOT NULL,        -- 总收入（元）
+    total_minutes REAL NOT NULL     -- 总停车时长（分钟）
+) WITHOUT ROWID
+'''
+
+# 按入场日期汇总已收费的记录，主库和归档库通用
+_DAILY_TOTALS = (
+    f"SELECT {DAY_EXPR} AS day, COUNT(*), SUM(fee), SUM((exit_time - entry_time) / 60000.0) "
+    f"FROM parking_records WHERE fee IS NOT NULL GROUP BY day"
+)
+
+
+def day_key(entry_ms: int) -> str:
+    return from_ms(entry_ms).date().isoformat()
+
+
+def add_exit(conn, entry_ms: int, minutes: float, fee: float):
+    """记入一次出场，调用方负责在出场的同一事务中执行并提交"""
+    conn.execute(
+        "INSERT INTO daily_revenue (day, vehicles, fee_total, total_minutes) VALUES (?, 1, ?, ?) "
+        "ON CONFLICT(day) DO UPDATE SET vehicles = vehicles + 1, "
+        "fee_total = fee_total + excluded.fee_total, total_minutes = total_minutes + excluded.total_minutes",
+        (day_key(entry_ms), fee, minutes)
+    )
+
+
+def subtract_records(conn, record_ids: Iterable[int]):
+    """从汇总中扣除即将删除的停车记录，须在删除记录之前、同一事务中调用"""
+    record_ids = list(record_ids)
+    for start in range(0, len(record_ids), 500):  # 分批，避免超过SQL参数个数上限
+        chunk = record_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT {DAY_EXPR} AS day, COUNT(*), SUM(fee), SUM((exit_time - entry_time) / 60000.0) "
+            f"FROM parking_records WHERE id IN ({placeholders}) AND fee IS NOT NULL GROUP BY day",
+            chunk
+        ).fetchall()
+        conn.executemany(
+            "UPDATE daily_revenue SET vehicles = vehicles - ?, fee_total = fee_total - ?, "
+            "total_minutes = total_minutes - ? WHERE day = ?",
+            [(count, fee, minutes, day) for day, count, fee, minutes in rows]
+        )
+    conn.execute("DELETE FROM daily_revenue WHERE vehicles <= 0")
+
+
+def rebuild(conn) -> int:
+    """从停车记录（包括已归档的记录）重新计算整张汇总表（不提交），返回汇总的天数"""
+    conn.execute(CREATE_TABLE)
+    conn.execute("DELETE FROM daily_revenue")
+    conn.execute(
+        f"INSERT INTO daily_revenue (day, vehicles, fee_total, total_minutes) {_DAILY_TOTALS}"
+    )
+    # 归档库用独立连接读取：调用方通常已开启事务，事务中不能 ATTACH
+    for path in archive.archive_files(conn):
+        with closing(sqlite3.connect(path)) as source:
+            rows = source.execute(_DAILY_TOTALS).fetchall()
+        conn.executemany(
+            "INSERT INTO daily_revenue (day, vehicles, fee_total, total_minutes) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(day) DO UPDATE SET vehicles = vehicles + excluded.vehicles, "
+            "fee_total = fee_total + excluded.fee_total, total_minutes = total_minutes + excluded.total_minutes",
+            rows
+        )
+    return conn.execute("SELECT COUNT(*) FROM daily_revenue").fetchone()[0]
+
+
+def get_daily_revenue(conn) -> List[tuple]:
+    """按日期倒序返回 (日期, 车辆数, 总收入, 总停车分钟数)"""
+    return conn.execute(
+        "SELECT day, vehicles, fee_total, total_minutes FROM daily_revenue ORDER BY day DESC"
+    ).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按日收费汇总表维护')
+    parser.add_argument('--rebuild', action='store_true', help='根据停车记录重建汇总表')
+    parser.add_argument('--db', default='parking.db', help='数据库文件路径')
+    args = parser.parse_args(argv)
+
+    setup_database(args.db)
+    with get_connection(args.db) as conn:
+        if args.rebuild:
+            conn.execute("BEGIN IMMEDIATE")
+            days = rebuild(conn)
+            conn.commit()
+            print(f"汇总表已重建，共 {days} 天。")
+        for day, vehicles, fee_total, minutes in get_daily_revenue(conn):
+            print(f"{day}\t{vehicles}\t¥{fee_total:.2f}\t{minutes / 60:.1f}小时")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
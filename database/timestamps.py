@@ -0,0 +1,50 @@
+# database/timestamps.py
+"""
+停车记录的时间统一保存为 Unix 纪元毫秒整数（INTEGER）。
+整数比较和范围查询可以直接走索引，计算时长也不必再解析字符串；
+与本地时间的换算只在显示和按日期/月份划分范围时进行。
+"""
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def to_ms(value: datetime) -> int:
+    """本地时间（naive datetime）转换为纪元毫秒"""
+    return round(value.timestamp() * 1000)
+
+
+def from_ms(ms: int) -> datetime:
+    """纪元毫秒转换为本地时间"""
+    return datetime.fromtimestamp(ms / 1000)
+
+
+def parse_legacy(value) -> Optional[int]:
+    """把旧版本保存的时间字符串（'YYYY-MM-DD HH:MM:SS[.ffffff]'）转换为纪元毫秒，已是整数的原样返回"""
+    if value is None or isinstance(value, int):
+        return value
+    return to_ms(datetime.fromisoformat(str(value)))
+
+
+def format_ms(ms: Optional[int], fmt: str = TIME_FORMAT) -> str:
+    """显示用的本地时间字符串，空值返回空字符串"""
+    return from_ms(ms).strftime(fmt) if ms is not None else ""
+
+
+def day_range(day: date) -> Tuple[int, int]:
+    """某一天的 (起始毫秒, 结束毫秒)，两端都包含，可直接用于 BETWEEN"""
+    start = datetime(day.year, day.month, day.day)
+    return to_ms(start), to_ms(start + timedelta(days=1)) - 1
+
+
+def month_range(year: int, month: int) -> Tuple[int, int]:
+    """某个月的 (起始毫秒, 结束毫秒)，两端都包含，可直接用于 BETWEEN"""
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return to_ms(start), to_ms(end) - 1
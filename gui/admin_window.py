@@ -1,16 +1,21 @@
 # gui/admin_window.py
-import sqlite3
-import calendar
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
 from PyQt5.QtWidgets import (QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, 
-                             QMessageBox, QGroupBox, QDesktopWidget, QDialog, QDateEdit)
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import Qt, QTimer
+                             QMessageBox, QGroupBox, QDesktopWidget, QDialog, QDateEdit, QFileDialog,
+                             QProgressDialog, QCheckBox)
+from PyQt5.QtGui import QImage, QPixmap, QDesktopServices
+from PyQt5.QtCore import Qt, QTimer, QUrl
 import os
+from datetime import datetime
 
+from core.frame_source import (IMAGE_EXTENSIONS, REPLAY_INDEX, ImageFolderSource, RecordingSource, ReplaySource,
+                               VideoFileSource)
 from core.parking_system import ParkingSystem
+from database import revenue
 from core.plate_recognizer import PlateRecognizer
+from core.report_export import period_range, period_title
+from .async_db import get_executor
+from .recognition_worker import RecognitionPipeline
+from .report_worker import ReportWorker
 # from .login_window import LoginWindow  # <--- 删除此处的导入
 from .dialogs import AddUserDialog, SearchDialog, BindVehicleDialog, DeleteUserDialog, MonthSelectionDialog
 
@@ -19,15 +24,27 @@ class AdminWindow(QWidget):
         super().__init__()
         self.username = username
         self.parking = ParkingSystem(100)
+        # 识别器使用main.py启动时已在后台加载的共享OCR模型，此处不会阻塞
         self.recognizer = PlateRecognizer()
         
         self.is_recognizing = False
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_frame)
+        self.report_worker = None  # 正在运行的报表生成线程
+        # 采集与识别在后台线程中进行，结果通过信号送回GUI线程
+        self.pipeline = RecognitionPipeline(self.recognizer, self)
+        self.pipeline.frame_ready.connect(self.update_frame)
+        self.pipeline.plates_recognized.connect(self.on_plates_recognized)
+        self.pipeline.stats_updated.connect(self.update_stats)
+        self.pipeline.error_occurred.connect(self.on_recognition_error)
+        self.pipeline.source_finished.connect(self.on_source_finished)
+        self.model_timer = QTimer(self)
+        self.model_timer.timeout.connect(self.check_model_state)
         self.login_window_instance = None # 用于持有新登录窗口的引用
         self.exit_window = None 
         
         self.init_ui()
+        self.check_model_state()
+        if not self.recognizer.is_model_ready():
+            self.model_timer.start(200)
         
     def init_ui(self):
         self.setMinimumSize(1200, 700)
@@ -102,11 +119,30 @@ class AdminWindow(QWidget):
         self.result_label.setAlignment(Qt.AlignCenter)
         self.result_label.setStyleSheet("font-size: 18px; color: #2c3e50; background-color: #ffffff; border-radius: 5px; padding: 10px; border: 1px solid #bdc3c7;")
         recognition_layout.addWidget(self.result_label)
+
+        status_layout = QHBoxLayout()
+        self.model_label = QLabel('')
+        self.model_label.setStyleSheet("font-size: 12px; color: #7f8c8d;")
+        status_layout.addWidget(self.model_label)
+        self.stats_label = QLabel('')
+        self.stats_label.setAlignment(Qt.AlignRight)
+        self.stats_label.setStyleSheet("font-size: 12px; color: #7f8c8d;")
+        status_layout.addWidget(self.stats_label)
+        recognition_layout.addLayout(status_layout)
         
         self.camera_btn = QPushButton('启动摄像头识别')
         self.camera_btn.setStyleSheet("background-color: #27ae60; color: white; padding: 12px; font-size: 16px; font-weight: bold;")
         self.camera_btn.clicked.connect(self.toggle_camera)
-        recognition_layout.addWidget(self.camera_btn)
+        self.file_btn = QPushButton('从文件识别')
+        self.file_btn.setStyleSheet("background-color: #2980b9; color: white; padding: 12px; font-size: 16px; font-weight: bold;")
+        self.file_btn.clicked.connect(self.open_file_source)
+        self.record_check = QCheckBox('同时录制')
+        self.record_check.setToolTip('识别的同时把画面录制为会话目录，之后可通过“从文件识别”选择其中的 timestamps.csv 回放')
+        camera_btn_layout = QHBoxLayout()
+        camera_btn_layout.addWidget(self.camera_btn, 3)
+        camera_btn_layout.addWidget(self.file_btn, 1)
+        camera_btn_layout.addWidget(self.record_check)
+        recognition_layout.addLayout(camera_btn_layout)
         
         recognition_group.setLayout(recognition_layout)
         right_layout.addWidget(recognition_group)
@@ -135,17 +171,16 @@ class AdminWindow(QWidget):
         dialog.exec_()
         
     def show_fee_report(self):
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT DATE(entry_time), COUNT(*), SUM(fee) FROM parking_records WHERE fee IS NOT NULL GROUP BY DATE(entry_time) ORDER BY DATE(entry_time) DESC")
-        results = cursor.fetchall()
-        conn.close()
-        
+        # 只读取按日汇总表，不再扫描全部停车记录
+        get_executor().call(revenue.get_daily_revenue, key=('fee-report', id(self)), owner=self,
+                            on_result=self.show_fee_summary, on_error=self.on_db_error)
+
+    def show_fee_summary(self, results):
         report_text = "收费统计日报表\n" + "="*40 + "\n"
         report_text += "日期\t\t车辆数\t总收入(元)\n" + "-"*40 + "\n"
         
         total_income = 0
-        for date, count, fee_sum in results:
+        for date, count, fee_sum, _ in results:
             report_text += f"{date}\t{count}\t¥{fee_sum:.2f}\n"
             total_income += fee_sum
         
@@ -154,54 +189,155 @@ class AdminWindow(QWidget):
         
     def toggle_camera(self):
         if not self.is_recognizing:
-            try:
-                self.recognizer.start_camera()
-                self.timer.start(30)
-                self.camera_btn.setText('停止识别')
-                self.camera_btn.setStyleSheet("background-color: #e74c3c; color: white; padding: 12px; font-size: 16px; font-weight: bold;")
-                self.is_recognizing = True
-                self.result_label.setText('正在启动摄像头...')
-            except Exception as e:
-                QMessageBox.critical(self, "摄像头错误", f"无法启动摄像头: {e}")
+            self.start_recognition(0)
+        else:
+            self.stop_recognition()
+
+    def start_recognition(self, source):
+        """从指定帧来源（摄像头编号或 FrameSource）开始识别，勾选“同时录制”时先选择录制目录"""
+        if self.record_check.isChecked():
+            folder = QFileDialog.getExistingDirectory(self, '选择录制目录')
+            if not folder:
+                return
+            source = RecordingSource(source, os.path.join(folder, datetime.now().strftime('session-%Y%m%d-%H%M%S')))
+        try:
+            self.pipeline.start(source)
+            self.camera_btn.setText('停止识别')
+            self.camera_btn.setStyleSheet("background-color: #e74c3c; color: white; padding: 12px; font-size: 16px; font-weight: bold;")
+            self.is_recognizing = True
+            self.result_label.setText('正在启动摄像头...')
+        except Exception as e:
+            QMessageBox.critical(self, "摄像头错误", f"无法启动摄像头: {e}")
+
+    def open_file_source(self):
+        """
+        选择离线帧来源：视频文件；目录中的任意一张图片（按顺序识别整个目录）；
+        或录制会话中的 timestamps.csv（按原始节奏回放）。
+        """
+        path, _ = QFileDialog.getOpenFileName(
+            self, '选择视频、图片或录制会话', '',
+            '视频/图片/录制会话 (*.mp4 *.avi *.mkv *.mov *.jpg *.jpeg *.png *.bmp timestamps.csv);;所有文件 (*)')
+        if not path:
+            return
+        if os.path.basename(path) == REPLAY_INDEX:
+            source = ReplaySource(os.path.dirname(path))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            source = ImageFolderSource(os.path.dirname(path))
         else:
-            self.timer.stop()
-            self.recognizer.stop_camera()
+            source = VideoFileSource(path)
+        if self.is_recognizing:
+            self.stop_recognition()
+        self.start_recognition(source)
+
+    def on_source_finished(self):
+        if self.is_recognizing:
+            self.stop_recognition()
+            self.result_label.setText('文件已识别完毕')
+
+    def stop_recognition(self):
+        if self.is_recognizing:
+            self.pipeline.stop()
             self.camera_btn.setText('启动摄像头识别')
             self.camera_btn.setStyleSheet("background-color: #27ae60; color: white; padding: 12px; font-size: 16px; font-weight: bold;")
             self.is_recognizing = False
             self.camera_label.setText("摄像头已关闭")
             self.camera_label.setStyleSheet("border: 2px dashed #bdc3c7; background-color: #ffffff; font-size: 20px; color: #7f8c8d;")
             self.result_label.setText('识别结果将显示在这里')
+            self.stats_label.setText('')
             
-    def update_frame(self):
-        frame, plate_number = self.recognizer.process_frame()
-        if frame is not None:
-            h, w, ch = frame.shape
-            bytes_per_line = ch * w
-            q_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_image)
-            self.camera_label.setPixmap(pixmap.scaled(self.camera_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
-            
-            if plate_number:
-                self.result_label.setText(f'稳定识别结果: {plate_number}')
-                self.handle_plate_recognition(plate_number)
-            else:
-                 self.result_label.setText('正在识别中...')
-    
-    def handle_plate_recognition(self, plate_number):
+    def show_frame(self, frame):
+        h, w, ch = frame.shape
+        bytes_per_line = ch * w
+        q_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(q_image)
+        self.camera_label.setPixmap(pixmap.scaled(self.camera_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def update_frame(self, frame):
+        if not self.is_recognizing:
+            return
+        self.show_frame(frame)
+        if self.recognizer.is_model_ready():
+            self.result_label.setText('正在识别中...')
+        else:
+            self.result_label.setText('识别模型加载中，请稍候...')
+
+    def on_plates_recognized(self, plates, frame):
+        """plates 为同一帧中稳定识别出的 [(车牌号, 追踪)]，多辆车同框时逐辆办理"""
+        # 停止后仍可能收到排队中的结果，直接忽略
+        if not self.is_recognizing:
+            return
+        for _, trace in plates:
+            if trace is not None:
+                trace.mark('dispatched')
+        self.show_frame(frame)
+        self.result_label.setText(f'稳定识别结果: {", ".join(plate for plate, _ in plates)}')
         self.toggle_camera()
-        if self.parking.is_vehicle_inside(plate_number):
-            exit_info = self.parking.vehicle_exit(plate_number)
-            if exit_info:
-                fee = exit_info["fee"]
+        for plate_number, trace in plates:
+            self.handle_plate_recognition(plate_number, trace)
+
+    def check_model_state(self):
+        """显示OCR模型的加载状态，加载完成后停止轮询"""
+        model = self.recognizer.model
+        if not model.is_ready():
+            self.model_label.setText('识别模型加载中...')
+            return
+        self.model_timer.stop()
+        if model.error is not None:
+            self.model_label.setText('识别模型加载失败')
+        else:
+            self.model_label.setText('识别模型已就绪')
+
+    def on_recognition_error(self, message):
+        if self.is_recognizing:
+            self.toggle_camera()
+        QMessageBox.critical(self, "识别错误", message)
+
+    def update_stats(self, capture_fps, ocr_fps, dropped):
+        stats = self.recognizer.get_stats()
+        self.stats_label.setText(f'采集: {capture_fps:.1f} fps | 识别: {ocr_fps:.1f} fps | 丢弃帧: {dropped} | '
+                                 f'静止跳过: {stats["frames_gated"]}/{stats["frames_seen"]}')
+    
+    def handle_plate_recognition(self, plate_number, trace=None):
+        """trace 为识别流水线创建的追踪（core.tracing.GateTrace），手动触发时为None"""
+        # 出入场在后台串行执行，保证同一辆车的入场、出场按识别顺序处理
+        get_executor().submit(self._pass_gate, plate_number, trace, serial=True, owner=self,
+                              on_result=lambda result: self.on_gate_result(plate_number, result, trace),
+                              on_error=lambda error: self.on_db_error(error, trace))
+
+    def _pass_gate(self, plate_number, trace=None):
+        """后台线程中执行：在场则办理出场，否则入场。返回 ('exit', 出场信息) 或 ('entry', 车位号)"""
+        if trace is not None:
+            trace.mark('db_start')
+        inside = self.parking.is_vehicle_inside(plate_number)
+        if trace is not None:
+            trace.mark('checked')
+        if inside:
+            result = 'exit', self.parking.vehicle_exit(plate_number)
+        else:
+            result = 'entry', self.parking.vehicle_entry(plate_number)
+        if trace is not None:
+            trace.mark('committed')
+        return result
+
+    def on_gate_result(self, plate_number, result, trace=None):
+        action, value = result
+        if trace is not None:
+            # 在弹出提示之前结束追踪，提示框等待操作员点击的时间不计入
+            trace.finish('notified', action=action, result=value)
+        if action == 'exit':
+            if value:
+                fee = value["fee"]
                 QMessageBox.information(self, '出场成功', f'车辆 {plate_number} 成功离场。\n应缴费用: ¥{fee:.2f}')
                 self.show_exit_image()
+        elif value:
+            QMessageBox.information(self, '入场成功', f'欢迎车辆 {plate_number}！\n已为您分配车位: {value}号')
         else:
-            spot = self.parking.vehicle_entry(plate_number)
-            if spot:
-                QMessageBox.information(self, '入场成功', f'欢迎车辆 {plate_number}！\n已为您分配车位: {spot}号')
-            else:
-                QMessageBox.warning(self, '车位已满', '抱歉，当前停车场已无可用车位。')
+            QMessageBox.warning(self, '车位已满', '抱歉，当前停车场已无可用车位。')
+
+    def on_db_error(self, error, trace=None):
+        if trace is not None:
+            trace.finish('failed', error=str(error))
+        QMessageBox.critical(self, '数据库错误', f'数据库操作失败：{error}')
     
     def show_exit_image(self):
         self.exit_window = QDialog(self)
@@ -228,59 +364,65 @@ class AdminWindow(QWidget):
         self.login_window_instance.show()
 
     def generate_monthly_report(self):
+        if self.report_worker is not None:
+            QMessageBox.information(self, '提示', '已有报表正在生成，请稍候。')
+            return
         dialog = MonthSelectionDialog(self)
         if dialog.exec_() == QDialog.Accepted:
-            selected_date = dialog.get_selected_date()
-            year, month = selected_date.year(), selected_date.month()
-            self.create_excel_report(year, month)
+            self.create_excel_report(*dialog.get_selected_period())
+
+    def create_excel_report(self, start_year, start_month, end_year=None, end_month=None):
+        """在后台线程中生成从起始月份到结束月份（默认与起始月份相同）的Excel报表"""
+        end_year, end_month = end_year or start_year, end_month or start_month
+        start_ms, end_ms = period_range(start_year, start_month, end_year, end_month)
+        title = period_title(start_year, start_month, end_year, end_month)
+        filename = os.path.abspath(f"{title}.xlsx")
+
+        self.report_progress = QProgressDialog('正在生成报表...', '取消', 0, 0, self)
+        self.report_progress.setWindowTitle(title)
+        self.report_progress.setMinimumDuration(500)  # 很快完成的报表不弹出进度框
+        self.report_worker = ReportWorker(filename, start_ms, end_ms, title, parent=self)
+        self.report_progress.canceled.connect(self.report_worker.cancel)
+        self.report_worker.progress.connect(self.on_report_progress)
+        self.report_worker.report_ready.connect(self.on_report_ready)
+        self.report_worker.report_failed.connect(self.on_report_failed)
+        self.report_worker.report_cancelled.connect(self.on_report_cancelled)
+        self.report_worker.finished.connect(self.on_report_finished)
+        self.report_worker.start()
+
+    def on_report_progress(self, written, total):
+        self.report_progress.setMaximum(total)
+        self.report_progress.setValue(written)
+        self.report_progress.setLabelText(f'正在生成报表... {written}/{total}')
 
-    def create_excel_report(self, year, month):
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        _, last_day = calendar.monthrange(year, month)
-        start_date = f"{year}-{month:02d}-01"
-        end_date = f"{year}-{month:02d}-{last_day}"
-        cursor.execute("""
-            SELECT plate_number, COUNT(*), SUM(CASE WHEN exit_time IS NOT NULL THEN ROUND((julianday(exit_time) - julianday(entry_time)) * 24, 2) ELSE 0 END), SUM(COALESCE(fee, 0))
-            FROM parking_records
-            WHERE DATE(entry_time) BETWEEN ? AND ?
-            GROUP BY plate_number
-        """, (start_date, end_date))
-        results = cursor.fetchall()
-        conn.close()
-        if not results:
-            QMessageBox.information(self, "提示", f"{year}年{month}月无停车记录。")
+    def on_report_ready(self, filename, rows):
+        self.report_progress.reset()
+        if rows == 0:
+            QMessageBox.information(self, "提示", "所选期间无停车记录。")
             return
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = f"{year}年{month}月停车场月报"
-        headers = ['序号', '车牌号', '停车次数', '总停车时长(小时)', '总费用(元)']
-        ws.append(headers)
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
-        header_align = Alignment(horizontal='center')
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_align
-        total_fee_sum = 0
-        for i, (plate, count, hours, fee) in enumerate(results, 1):
-            ws.append([i, plate, count, f"{hours:.2f}", f"{fee:.2f}"])
-            total_fee_sum += fee
-        summary_row = len(results) + 3
-        ws.cell(row=summary_row, column=1, value="月度总收入").font = Font(bold=True)
-        ws.cell(row=summary_row, column=5, value=f"¥{total_fee_sum:.2f}").font = Font(bold=True)
-        for col_letter in ['A', 'B', 'C', 'D', 'E']:
-            ws.column_dimensions[col_letter].width = 20
-        filename = f"停车场月报_{year}年{month:02d}月.xlsx"
-        try:
-            wb.save(filename)
-            QMessageBox.information(self, '成功', f'月报已生成：{os.path.abspath(filename)}')
-            os.startfile(os.path.abspath(filename))
-        except Exception as e:
-            QMessageBox.critical(self, "保存失败", f"无法保存Excel文件：{e}")
+        QMessageBox.information(self, '成功', f'报表已生成：{filename}')
+        # 用系统默认程序打开（跨平台，替代仅Windows可用的 os.startfile）
+        QDesktopServices.openUrl(QUrl.fromLocalFile(filename))
+
+    def on_report_failed(self, message):
+        self.report_progress.reset()
+        QMessageBox.critical(self, "保存失败", f"无法生成Excel报表：{message}")
+
+    def on_report_cancelled(self):
+        self.report_progress.reset()
+
+    def on_report_finished(self):
+        self.report_worker.deleteLater()
+        self.report_worker = None
             
     def closeEvent(self, event):
-        self.timer.stop()
-        self.recognizer.stop_camera()
+        self.model_timer.stop()
+        if self.report_worker is not None:
+            self.report_worker.cancel()
+            self.report_worker.wait()
+        self.pipeline.stop(wait_inference=True)
+        # 已识别车辆的出入场登记不能丢，等待后台写入完成
+        get_executor().wait_serial()
+        # 每个 ParkingSystem 持有一个独占连接，登出或关闭窗口时归还
+        self.parking.close()
         event.accept()
\ No newline at end of file
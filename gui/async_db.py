@@ -0,0 +1,241 @@
+# gui/async_db.py
+import threading
+import time
+from typing import Callable, Optional
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from core import metrics
+from database.database_manager import DB_PATH, get_pool
+
+QUERY_SECONDS = metrics.histogram('parking_gui_query_seconds', '界面后台数据库调用的执行耗时（秒）', ('query',))
+QUEUE_SECONDS = metrics.histogram('parking_gui_query_queue_seconds', '界面后台数据库调用在线程池中排队的时间（秒）', ('query',))
+
+
+class QueryFuture(QObject):
+    """
+    一次异步数据库调用的结果。
+    结果和异常通过信号送回GUI线程；取消后即使后台已经算完，也不会再发出任何信号。
+    """
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(object)  # 异常对象
+    finished = pyqtSignal()      # 无论成功、失败或取消都会发出，供执行器清理
+    _completed = pyqtSignal(bool, object)  # 后台线程 -> GUI线程
+
+    def __init__(self, key=None):
+        super().__init__()
+        self.key = key
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._done = False
+        self._conn = None  # 正在执行查询的连接，取消时用于中断
+        # future 属于GUI线程，后台线程发出的信号会排队到GUI线程执行
+        self._completed.connect(self._on_completed)
+
+    def cancel(self):
+        """取消：尚未开始的不再执行，正在执行的SQL查询会被 interrupt() 中断"""
+        with self._lock:
+            self._cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def _attach(self, conn):
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._conn = conn
+            return True
+
+    def _detach(self):
+        # 必须在连接归还连接池之前调用，避免 interrupt() 打断下一个使用者的查询
+        with self._lock:
+            self._conn = None
+
+    def _deliver(self, ok, value):
+        """在后台线程中调用"""
+        self._done = True
+        self._completed.emit(ok, value)
+
+    def _on_completed(self, ok, value):
+        # 在GUI线程中再检查一次：结果排队期间也可能被取消
+        if not self._cancelled:
+            (self.succeeded if ok else self.failed).emit(value)
+        self.finished.emit()
+
+
+class _Task(QRunnable):
+    def __init__(self, future: QueryFuture, fn: Callable, args, kwargs, name: str):
+        super().__init__()
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name  # 指标中的 query 标签
+        self.queued = time.perf_counter() if metrics.enabled() else None
+
+    def run(self):
+        if self.future.is_cancelled():
+            self.future._deliver(True, None)
+            return
+        started = None
+        if self.queued is not None:
+            started = time.perf_counter()
+            QUEUE_SECONDS.labels(self.name).observe(started - self.queued)
+        try:
+            value = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.future._deliver(False, e)
+        else:
+            self.future._deliver(True, value)
+        finally:
+            if started is not None:
+                QUERY_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+
+
+def _task_name(fn: Callable, key, name: Optional[str]) -> str:
+    """指标标签：显式给出的 name，否则取 key 的第一项（如 'record-page'），再否则取函数名"""
+    if name:
+        return name
+    if isinstance(key, tuple) and key:
+        return str(key[0])
+    return getattr(fn, '__name__', 'call')
+
+
+class DbExecutor(QObject):
+    """
+    GUI使用的异步数据访问层。
+    submit() 把任意函数放到后台线程池执行并立即返回 QueryFuture，结果通过信号回到GUI线程；
+    query() 在连接池的连接上执行SQL。同一个 key 的新任务会取消仍未完成的旧任务（例如随输入实时刷新的搜索）。
+    serial=True 的任务在单独的单线程池中按提交顺序执行，用于必须保持先后顺序的车辆出入场。
+    开启指标时按 name（省略时取 key 或函数名）记录每次调用的排队和执行耗时。
+    """
+    def __init__(self, max_threads: int = 4, db_path: str = DB_PATH, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)  # 不超过连接池大小
+        self.serial_pool = QThreadPool(self)
+        self.serial_pool.setMaxThreadCount(1)
+        self._latest = {}  # key -> 最近提交的 QueryFuture
+        self._pending = set()  # 持有未完成的 future，避免结果送达前被垃圾回收
+
+    def submit(self, fn: Callable, *args, on_result: Optional[Callable] = None,
+               on_error: Optional[Callable] = None, key=None, owner: Optional[QObject] = None,
+               serial: bool = False, name: Optional[str] = None, **kwargs) -> QueryFuture:
+        """
+        在后台执行 fn(*args, **kwargs)。
+        on_result(结果) / on_error(异常) 在GUI线程中调用；owner 被销毁时自动取消，回调不会落到已关闭的窗口上。
+        """
+        future = self._new_future(on_result, on_error, key, owner)
+        task = _Task(future, fn, args, kwargs, _task_name(fn, key, name))
+        (self.serial_pool if serial else self.pool).start(task)
+        return future
+
+    def _new_future(self, on_result, on_error, key, owner):
+        future = QueryFuture(key)
+        self._pending.add(future)
+        future.finished.connect(lambda: self._forget(future))
+        if on_result is not None:
+            future.succeeded.connect(on_result)
+        if on_error is not None:
+            future.failed.connect(on_error)
+        if owner is not None:
+            owner.destroyed.connect(future.cancel)
+        if key is not None:
+            previous = self._latest.get(key)
+            if previous is not None and not previous.is_done():
+                previous.cancel()
+            self._latest[key] = future
+        return future
+
+    def query(self, sql: str, params=(), fetch: str = 'all', commit: bool = False, **options) -> QueryFuture:
+        """
+        异步执行一条SQL。fetch 为 'all'、'one' 或 None（返回受影响的行数）；commit=True 时执行后提交。
+        其余参数（on_result、key 等）同 submit()。
+        """
+        if options.get('key') is None:
+            options.setdefault('name', 'sql')
+        return self._submit_with_connection(_run_sql, sql, params, fetch, commit, **options)
+
+    def call(self, fn: Callable, *args, **options) -> QueryFuture:
+        """在连接池的连接上异步执行 fn(conn, *args)，用于需要多条查询的只读操作"""
+        return self._submit_with_connection(fn, *args, **options)
+
+    def transaction(self, work: Callable, *args, **options) -> QueryFuture:
+        """在一个事务中异步执行 work(conn, *args)，正常返回则提交，抛出异常则回滚"""
+        if options.get('key') is None:
+            options.setdefault('name', getattr(work, '__name__', None))
+        return self._submit_with_connection(_run_transaction, work, *args, **options)
+
+    def _submit_with_connection(self, fn, *args, on_result=None, on_error=None, key=None, owner=None, serial=False,
+                                name=None):
+        future = self._new_future(on_result, on_error, key, owner)
+        task = _Task(future, _with_connection, (get_pool(self.db_path), future, fn, args), {},
+                     _task_name(fn, key, name))
+        (self.serial_pool if serial else self.pool).start(task)
+        return future
+
+    def _forget(self, future):
+        self._pending.discard(future)
+        if self._latest.get(future.key) is future:
+            del self._latest[future.key]
+
+    def cancel(self, key):
+        future = self._latest.get(key)
+        if future is not None:
+            future.cancel()
+
+    def wait_serial(self, timeout_ms: int = 5000):
+        """等待已提交的串行任务（车辆出入场）全部执行完"""
+        return self.serial_pool.waitForDone(timeout_ms)
+
+    def shutdown(self, timeout_ms: int = 5000):
+        """取消所有按 key 跟踪的任务，并等待正在执行的任务结束"""
+        for future in list(self._latest.values()):
+            future.cancel()
+        self.pool.waitForDone(timeout_ms)
+        self.serial_pool.waitForDone(timeout_ms)
+
+
+def _with_connection(pool, future, fn, args):
+    with pool.connection() as conn:
+        if not future._attach(conn):
+            return None
+        try:
+            return fn(conn, *args)
+        finally:
+            future._detach()
+
+
+def _run_sql(conn, sql, params, fetch, commit):
+    cursor = conn.execute(sql, params)
+    if fetch == 'all':
+        result = cursor.fetchall()
+    elif fetch == 'one':
+        result = cursor.fetchone()
+    else:
+        result = cursor.rowcount
+    if commit:
+        conn.commit()
+    return result
+
+
+def _run_transaction(conn, work, *args):
+    with conn:
+        return work(conn, *args)
+
+
+_executor = None
+
+def get_executor() -> DbExecutor:
+    """获取进程级共享的数据访问执行器（须在创建 QApplication 之后、在GUI线程中调用）"""
+    global _executor
+    if _executor is None:
+        _executor = DbExecutor()
+    return _executor
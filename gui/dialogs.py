@@ -1,13 +1,13 @@
 # gui/dialogs.py
 import sqlite3
-import calendar
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QLineEdit, QComboBox, QPushButton, 
-                             QMessageBox, QFormLayout, QDateEdit, QTableWidget, 
-                             QTableWidgetItem, QListWidget, QListWidgetItem, QLabel, QDialogButtonBox)
-from PyQt5.QtCore import QDate, Qt
-import os
+                             QMessageBox, QFormLayout, QDateEdit, QTableView, QListWidget, QLabel, QDialogButtonBox)
+from PyQt5.QtCore import QDate, QTimer
+
+from database import revenue
+from database.timestamps import day_range
+from .async_db import get_executor
+from .record_model import RecordTableModel
 
 class AddUserDialog(QDialog):
     def __init__(self, parent=None):
@@ -29,7 +29,7 @@ class AddUserDialog(QDialog):
         form_layout.addRow('角色:', self.role_combo)
         layout.addLayout(form_layout)
 
-        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.button_box = button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
@@ -43,17 +43,21 @@ class AddUserDialog(QDialog):
             QMessageBox.warning(self, '错误', '请填写所有字段！')
             return
 
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, password, role))
-            conn.commit()
-            QMessageBox.information(self, '成功', f'用户 {username} 添加成功！')
-            super().accept()
-        except sqlite3.IntegrityError:
+        self.button_box.setEnabled(False)
+        get_executor().query("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, password, role),
+                             fetch=None, commit=True, owner=self, name='add-user',
+                             on_result=lambda _: self.on_added(username), on_error=self.on_add_failed)
+
+    def on_added(self, username):
+        QMessageBox.information(self, '成功', f'用户 {username} 添加成功！')
+        super().accept()
+
+    def on_add_failed(self, error):
+        self.button_box.setEnabled(True)
+        if isinstance(error, sqlite3.IntegrityError):
             QMessageBox.warning(self, '错误', '用户名已存在！')
-        finally:
-            conn.close()
+        else:
+            QMessageBox.critical(self, '数据库错误', f'添加用户时发生错误：{error}')
 
 class SearchDialog(QDialog):
     def __init__(self, parent=None):
@@ -70,91 +74,100 @@ class SearchDialog(QDialog):
         self.date_input.setCalendarPopup(True)
         
         # --- 修正部分 ---
-        # 允许一个特殊的“空”值，并设置其显示文本
+        # 允许一个特殊的“空”值，并设置其显示文本（日期等于最小日期时显示）
         self.date_input.setSpecialValueText(" ") 
-        # 将日期清空到这个特殊值状态
-        self.date_input.clear()
+        # 将日期设为最小日期，即这个特殊值状态（clear() 只清空文本，date() 仍是一个具体日期）
+        self.date_input.setMinimumDate(QDate(2000, 1, 1))
+        self.date_input.setDate(self.date_input.minimumDate())
         # --- 修正结束 ---
 
         form_layout.addRow('车牌号 (模糊搜索):', self.plate_input)
         form_layout.addRow('入场日期 (可选):', self.date_input)
         layout.addLayout(form_layout)
+
+        # 输入时自动搜索：停止输入一小段时间后才发起查询，上一次尚未完成的查询由模型取消
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.search)
+        self.plate_input.textChanged.connect(self.search_timer.start)
+        self.date_input.dateChanged.connect(self.search_timer.start)
         
         search_btn = QPushButton('搜索')
         search_btn.clicked.connect(self.search)
         layout.addWidget(search_btn)
         
-        # 结果显示
-        self.result_table = QTableWidget()
-        self.result_table.setColumnCount(6)
-        self.result_table.setHorizontalHeaderLabels(['ID', '车牌号', '入场时间', '出场时间', '费用', '车位号'])
-        self.result_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.result_table.setSelectionBehavior(QTableWidget.SelectRows)
+        # 结果显示：分页加载的表格模型，滚动到底部时自动加载下一页
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        self.record_model = RecordTableModel(parent=self)
+        self.record_model.count_ready.connect(self.update_count)
+        self.record_model.load_failed.connect(self.on_load_failed)
+        self.result_table = QTableView()
+        self.result_table.setModel(self.record_model)
+        self.result_table.setEditTriggers(QTableView.NoEditTriggers)
+        self.result_table.setSelectionBehavior(QTableView.SelectRows)
         layout.addWidget(self.result_table)
         
-        delete_btn = QPushButton('删除选中记录')
+        self.delete_btn = delete_btn = QPushButton('删除选中记录')
         delete_btn.setStyleSheet("background-color: #e74c3c; color: white;")
         delete_btn.clicked.connect(self.delete_selected)
         layout.addWidget(delete_btn)
 
-        self.search() # 初始加载所有记录
+        self.search() # 初始加载第一页记录
         
     def search(self):
+        self.search_timer.stop()
         plate_number = self.plate_input.text()
-        date_str = self.date_input.text().strip() # 获取文本并去除前后空格
-        
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        
-        query = "SELECT id, plate_number, entry_time, exit_time, fee, spot_number FROM parking_records WHERE 1=1"
-        params = []
-        
-        if plate_number:
-            query += " AND plate_number LIKE ?"
-            params.append(f"%{plate_number}%")
-            
-        # 只有当日期框不是空的特殊值时，才添加日期条件
-        if date_str:
-            query += " AND DATE(entry_time) = ?"
-            params.append(self.date_input.date().toString("yyyy-MM-dd"))
-        
-        query += " ORDER BY entry_time DESC"
-        
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
-        
-        self.result_table.setRowCount(len(results))
-        for i, record in enumerate(results):
-            for j, value in enumerate(record):
-                display_value = str(value) if value is not None else ""
-                self.result_table.setItem(i, j, QTableWidgetItem(display_value))
+        entry_range = None
+        # 只有当日期框不是空的特殊值（最小日期）时，才添加日期条件
+        if self.date_input.date() != self.date_input.minimumDate():
+            # 用当天的毫秒范围代替 DATE(entry_time) = ?，才能走 entry_time 索引
+            entry_range = day_range(self.date_input.date().toPyDate())
+        self.count_label.setText('正在统计记录数...')
+        self.record_model.set_filter(plate_number, entry_range)
+
+    def update_count(self, count):
+        self.count_label.setText(f'共 {count} 条记录')
+
+    def on_load_failed(self, message):
+        self.count_label.setText(f'查询失败：{message}')
 
     def delete_selected(self):
-        selected_items = self.result_table.selectedItems()
-        if not selected_items:
+        selected_rows = sorted(index.row() for index in self.result_table.selectionModel().selectedRows())
+        if not selected_rows:
             QMessageBox.warning(self, '提示', '请先选择要删除的记录。')
             return
-            
-        selected_rows = sorted(list(set(item.row() for item in selected_items)))
         
         reply = QMessageBox.question(self, '确认删除', f'确定要删除选中的 {len(selected_rows)} 条记录吗？\n此操作不可撤销！',
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
                                    
         if reply == QMessageBox.Yes:
-            record_ids_to_delete = []
-            for row in selected_rows:
-                record_id = self.result_table.item(row, 0).text()
-                record_ids_to_delete.append((int(record_id),))
-
-            conn = sqlite3.connect('parking.db')
-            cursor = conn.cursor()
-            cursor.executemany("DELETE FROM parking_records WHERE id = ?", record_ids_to_delete)
-            conn.commit()
-            conn.close()
-            
-            QMessageBox.information(self, '成功', '选中的记录已删除。')
-            self.search()
+            record_ids_to_delete = [self.record_model.record_id(row) for row in selected_rows]
+            self.delete_btn.setEnabled(False)
+            get_executor().transaction(_delete_records, record_ids_to_delete, owner=self,
+                                       on_result=self.on_deleted, on_error=self.on_delete_failed)
+
+    def on_deleted(self, _):
+        self.delete_btn.setEnabled(True)
+        QMessageBox.information(self, '成功', '选中的记录已删除。')
+        self.record_model.refresh()
+
+    def on_delete_failed(self, error):
+        self.delete_btn.setEnabled(True)
+        QMessageBox.critical(self, '数据库错误', f'删除记录时发生错误：{error}')
+
+    def done(self, result):
+        # 关闭时取消仍在进行的查询，结果不会再送回已关闭的对话框
+        self.search_timer.stop()
+        self.record_model.cancel_pending()
+        super().done(result)
+
+
+def _delete_records(conn, record_ids):
+    # 先从按日收费汇总中扣除这些记录，再删除，两步在同一事务中完成
+    revenue.subtract_records(conn, record_ids)
+    conn.executemany("DELETE FROM parking_records WHERE id = ?", [(record_id,) for record_id in record_ids])
 
 # ... BindVehicleDialog, DeleteUserDialog, MonthSelectionDialog 保持不变 ...
 class BindVehicleDialog(QDialog):
@@ -172,7 +185,7 @@ class BindVehicleDialog(QDialog):
         form_layout.addRow('车牌号:', self.plate_input)
         layout.addLayout(form_layout)
 
-        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.button_box = button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
@@ -184,25 +197,35 @@ class BindVehicleDialog(QDialog):
         if not username or not plate_number:
             QMessageBox.warning(self, '错误', '用户名和车牌号均不能为空！')
             return
-            
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT 1 FROM users WHERE username = ?", (username,))
-        if not cursor.fetchone():
+
+        self.button_box.setEnabled(False)
+        get_executor().transaction(_bind_vehicle, username, plate_number, owner=self,
+                                   on_result=lambda bound: self.on_bound(username, bound),
+                                   on_error=self.on_bind_failed)
+
+    def on_bound(self, username, bound):
+        self.button_box.setEnabled(True)
+        if not bound:
             QMessageBox.warning(self, '错误', f'用户 "{username}" 不存在！')
-            conn.close()
             return
-            
-        try:
-            cursor.execute("INSERT INTO user_vehicles (username, plate_number) VALUES (?, ?)", (username, plate_number))
-            conn.commit()
-            QMessageBox.information(self, '成功', '车辆绑定成功！')
-            super().accept()
-        except sqlite3.IntegrityError:
+        QMessageBox.information(self, '成功', '车辆绑定成功！')
+        super().accept()
+
+    def on_bind_failed(self, error):
+        self.button_box.setEnabled(True)
+        if isinstance(error, sqlite3.IntegrityError):
             QMessageBox.warning(self, '错误', '该车辆已经绑定，请勿重复操作！')
-        finally:
-            conn.close()
+        else:
+            QMessageBox.critical(self, '数据库错误', f'绑定车辆时发生错误：{error}')
+
+
+def _bind_vehicle(conn, username, plate_number):
+    """用户不存在时返回False"""
+    if not conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+        return False
+    conn.execute("INSERT INTO user_vehicles (username, plate_number) VALUES (?, ?)", (username, plate_number))
+    return True
+
 
 class DeleteUserDialog(QDialog):
     def __init__(self, parent=None):
@@ -225,13 +248,12 @@ class DeleteUserDialog(QDialog):
         self.load_users()
         
     def load_users(self):
+        get_executor().query("SELECT username FROM users WHERE role != 'admin' ORDER BY username",
+                             key=('user-list', id(self)), owner=self, on_result=self.show_users,
+                             on_error=lambda e: QMessageBox.critical(self, '数据库错误', f'读取用户列表时发生错误：{e}'))
+
+    def show_users(self, users):
         self.user_list.clear()
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT username FROM users WHERE role != 'admin' ORDER BY username")
-        users = cursor.fetchall()
-        conn.close()
-        
         for user in users:
             self.user_list.addItem(user[0])
             
@@ -248,37 +270,83 @@ class DeleteUserDialog(QDialog):
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            conn = sqlite3.connect('parking.db')
-            cursor = conn.cursor()
-            try:
-                cursor.execute("DELETE FROM user_vehicles WHERE username = ?", (username,))
-                cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-                conn.commit()
-                QMessageBox.information(self, '成功', f'用户 {username} 已被成功删除！')
-                self.load_users()
-            except sqlite3.Error as e:
-                conn.rollback()
-                QMessageBox.critical(self, '数据库错误', f'删除用户时发生错误：{e}')
-            finally:
-                conn.close()
+            get_executor().transaction(_delete_user, username, owner=self,
+                                       on_result=lambda _: self.on_user_deleted(username),
+                                       on_error=lambda e: QMessageBox.critical(self, '数据库错误', f'删除用户时发生错误：{e}'))
+
+    def on_user_deleted(self, username):
+        QMessageBox.information(self, '成功', f'用户 {username} 已被成功删除！')
+        self.load_users()
+
+
+def _delete_user(conn, username):
+    conn.execute("DELETE FROM user_vehicles WHERE username = ?", (username,))
+    conn.execute("DELETE FROM users WHERE username = ?", (username,))
+
 
 class MonthSelectionDialog(QDialog):
+    REPORT_TYPES = ('月报', '多月报表', '年报')
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle('选择报表月份')
         layout = QVBoxLayout(self)
         
+        self.type_combo = QComboBox(self)
+        self.type_combo.addItems(self.REPORT_TYPES)
+        self.type_combo.currentIndexChanged.connect(self.update_inputs)
+        layout.addWidget(QLabel("报表类型:"))
+        layout.addWidget(self.type_combo)
+
         self.date_edit = QDateEdit(self)
         self.date_edit.setDisplayFormat('yyyy-MM')
         self.date_edit.setDate(QDate.currentDate())
         self.date_edit.setCalendarPopup(True)
-        layout.addWidget(QLabel("请选择要生成报表的年份和月份:"))
+        self.date_label = QLabel("请选择要生成报表的年份和月份:")
+        layout.addWidget(self.date_label)
         layout.addWidget(self.date_edit)
+
+        # 多月报表的结束月份
+        self.end_date_edit = QDateEdit(self)
+        self.end_date_edit.setDisplayFormat('yyyy-MM')
+        self.end_date_edit.setDate(QDate.currentDate())
+        self.end_date_edit.setCalendarPopup(True)
+        self.end_label = QLabel("结束月份:")
+        layout.addWidget(self.end_label)
+        layout.addWidget(self.end_date_edit)
         
         button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
+        self.update_inputs()
+
+    def update_inputs(self):
+        report_type = self.type_combo.currentText()
+        self.date_edit.setDisplayFormat('yyyy' if report_type == '年报' else 'yyyy-MM')
+        self.date_label.setText("请选择年份:" if report_type == '年报' else
+                                "起始月份:" if report_type == '多月报表' else "请选择要生成报表的年份和月份:")
+        self.end_label.setVisible(report_type == '多月报表')
+        self.end_date_edit.setVisible(report_type == '多月报表')
+
+    def accept(self):
+        if self.type_combo.currentText() == '多月报表':
+            start, end = self.date_edit.date(), self.end_date_edit.date()
+            if (end.year(), end.month()) < (start.year(), start.month()):
+                QMessageBox.warning(self, '提示', '结束月份不能早于起始月份。')
+                return
+        super().accept()
     
     def get_selected_date(self):
-        return self.date_edit.date()
\ No newline at end of file
+        return self.date_edit.date()
+
+    def get_selected_period(self):
+        """返回 (起始年, 起始月, 结束年, 结束月)，两端都包含"""
+        start = self.date_edit.date()
+        report_type = self.type_combo.currentText()
+        if report_type == '年报':
+            return start.year(), 1, start.year(), 12
+        if report_type == '多月报表':
+            end = self.end_date_edit.date()
+            return start.year(), start.month(), end.year(), end.month()
+        return start.year(), start.month(), start.year(), start.month()
@@ -1,11 +1,12 @@
 # gui/login_window.py
-import sqlite3
 import sys
 from PyQt5.QtWidgets import (QWidget, QLabel, QPushButton, QVBoxLayout, QLineEdit, 
                              QHBoxLayout, QMessageBox, QApplication, QDesktopWidget)
 from PyQt5.QtGui import QPainter, QPixmap
 from PyQt5.QtCore import Qt
 
+from .async_db import get_executor
+
 class LoginWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -67,7 +68,7 @@ class LoginWindow(QWidget):
         main_layout.addLayout(password_layout)
         main_layout.addStretch(1)
 
-        login_btn = QPushButton('登 录')
+        self.login_btn = login_btn = QPushButton('登 录')
         login_btn.setFixedSize(150, 45)
         login_btn.clicked.connect(self.login)
         login_btn.setStyleSheet("""
@@ -139,18 +140,26 @@ class LoginWindow(QWidget):
         self.move(qr.topLeft())
         
     def login(self):
-        from .admin_window import AdminWindow
-        from .user_window import UserWindow
         username = self.username_input.text()
         password = self.password_input.text()
         if not username or not password:
             QMessageBox.warning(self, '提示', '用户名和密码不能为空！')
             return
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT role FROM users WHERE username = ? AND password = ?", (username, password))
-        result = cursor.fetchone()
-        conn.close()
+        # 查询在后台线程中执行，期间禁用登录按钮防止重复提交
+        self.login_btn.setEnabled(False)
+        get_executor().query("SELECT role FROM users WHERE username = ? AND password = ?", (username, password),
+                             fetch='one', owner=self, name='login',
+                             on_result=lambda result: self.on_login_result(username, result),
+                             on_error=self.on_login_error)
+
+    def on_login_error(self, error):
+        self.login_btn.setEnabled(True)
+        QMessageBox.critical(self, '数据库错误', f'登录时发生错误：{error}')
+
+    def on_login_result(self, username, result):
+        from .admin_window import AdminWindow
+        from .user_window import UserWindow
+        self.login_btn.setEnabled(True)
         if result:
             self.hide()
             role = result[0]
@@ -167,4 +176,4 @@ class LoginWindow(QWidget):
                 self.password_input.clear()
             else:
                 QMessageBox.critical(self, '登录锁定', '登录失败次数过多，应用程序将退出！')
-                QApplication.quit()
\ No newline at end of file
+                QApplication.quit()
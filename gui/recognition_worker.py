@@ -0,0 +1,248 @@
+# gui/recognition_worker.py
+import threading
+import time
+from collections import deque
+
+import cv2
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+
+from core import metrics
+from core.plate_recognizer import frame_samples
+
+
+class FpsMeter:
+    """基于滑动时间窗口的帧率统计（线程安全）"""
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self._ticks = deque()
+        self._lock = threading.Lock()
+
+    def tick(self):
+        now = time.perf_counter()
+        with self._lock:
+            self._ticks.append(now)
+            while self._ticks and now - self._ticks[0] > self.window:
+                self._ticks.popleft()
+
+    def fps(self) -> float:
+        now = time.perf_counter()
+        with self._lock:
+            while self._ticks and now - self._ticks[0] > self.window:
+                self._ticks.popleft()
+            if len(self._ticks) < 2:
+                return 0.0
+            return (len(self._ticks) - 1) / (self._ticks[-1] - self._ticks[0])
+
+    def reset(self):
+        with self._lock:
+            self._ticks.clear()
+
+
+class LatestFrameSlot:
+    """
+    只保存最新一帧的单槽缓冲区。
+    采集线程不断覆盖写入，推理线程每次只取最新帧，未被取走的旧帧直接丢弃。
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._captured_at = None  # 最新帧的采集时刻（time.monotonic()）
+        self._timestamp = None    # 最新帧在来源时间轴上的时刻（FrameSource.timestamp）
+        self._seq = 0
+        self._closed = False
+        self.dropped = 0  # 被新帧覆盖、从未送去识别的帧数
+
+    def put(self, frame, captured_at: float = None, timestamp: float = None):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._captured_at = time.monotonic() if captured_at is None else captured_at
+            self._timestamp = timestamp
+            self._seq += 1
+            self._cond.notify()
+
+    def take(self, timeout: float = 0.5):
+        """取走最新帧；超时或已关闭时返回None"""
+        return self.take_timed(timeout)[0]
+
+    def take_timed(self, timeout: float = 0.5):
+        """取走最新帧及其时刻 (帧, 采集时刻, 来源时间轴上的时刻)；超时或已关闭时返回 (None, None, None)"""
+        with self._cond:
+            if self._frame is None and not self._closed:
+                self._cond.wait(timeout)
+            frame, self._frame = self._frame, None
+            if frame is None:
+                return None, None, None
+            return frame, self._captured_at, self._timestamp
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._frame = None
+            self._cond.notify_all()
+
+    def reopen(self):
+        with self._cond:
+            self._closed = False
+            self._frame = None
+            self.dropped = 0
+
+
+class CaptureThread(QThread):
+    """采集线程：持续读取帧来源，把最新帧放入缓冲槽，并发出用于显示的RGB帧"""
+    frame_captured = pyqtSignal(object)
+    source_finished = pyqtSignal()
+
+    def __init__(self, recognizer, slot: LatestFrameSlot, meter: FpsMeter, parent=None):
+        super().__init__(parent)
+        self.recognizer = recognizer
+        self.slot = slot
+        self.meter = meter
+        self._running = False
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        while self._running:
+            frame = self.recognizer.read_frame()
+            if frame is None:
+                if self.recognizer.is_source_finished():
+                    # 视频文件或图片目录已读完
+                    self.source_finished.emit()
+                    break
+                self.msleep(10)
+                continue
+            self.meter.tick()
+            self.slot.put(frame, time.monotonic(), self.recognizer.source_timestamp())
+            self.frame_captured.emit(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+class InferenceThread(QThread):
+    """推理线程：从缓冲槽取最新帧做OCR，识别到稳定车牌时发出信号"""
+    plates_recognized = pyqtSignal(object, object)  # 本帧稳定的 [(车牌号, 追踪GateTrace)], 标注后的RGB帧
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, recognizer, slot: LatestFrameSlot, meter: FpsMeter, parent=None):
+        super().__init__(parent)
+        self.recognizer = recognizer
+        self.slot = slot
+        self.meter = meter
+        self._running = False
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        while self._running:
+            frame, captured_at, timestamp = self.slot.take_timed()
+            if frame is None:
+                continue
+            try:
+                display_frame, plate_numbers = self.recognizer.recognize(frame, captured_at, timestamp)
+            except RuntimeError as e:
+                # 例如OCR模型加载失败，继续循环没有意义
+                self._running = False
+                self.error_occurred.emit(str(e))
+                break
+            except Exception as e:
+                # 其他异常（OpenCV、OCR内部错误等）通常每一帧都会重复出现，同样停止并通知界面，
+                # 否则线程悄悄退出，界面上看起来只是不再识别
+                self._running = False
+                self.error_occurred.emit(f"识别失败: {type(e).__name__}: {e}")
+                break
+            self.meter.tick()
+            # 停止后才完成的识别结果不再上报，避免重复处理
+            # 同一帧稳定的多辆车一起发出，界面据此逐辆办理
+            if plate_numbers and self._running:
+                self.plates_recognized.emit(list(zip(plate_numbers, self.recognizer.last_traces)), display_frame)
+
+
+class RecognitionPipeline(QObject):
+    """
+    摄像头采集 / OCR推理 双线程流水线。
+    所有结果通过Qt信号在GUI线程中送达，GUI线程本身不再执行任何采集或识别工作。
+    """
+    frame_ready = pyqtSignal(object)                 # 实时RGB显示帧
+    plates_recognized = pyqtSignal(object, object)   # 本帧稳定的 [(车牌号, 追踪GateTrace)], 标注后的RGB帧
+    stats_updated = pyqtSignal(float, float, int)    # 采集fps, 识别fps, 累计丢弃帧数
+    error_occurred = pyqtSignal(str)
+    source_finished = pyqtSignal()                   # 有限帧来源已读完
+
+    def __init__(self, recognizer, parent=None):
+        super().__init__(parent)
+        self.recognizer = recognizer
+        self.slot = LatestFrameSlot()
+        self.capture_meter = FpsMeter()
+        self.ocr_meter = FpsMeter()
+        self._capture_thread = None
+        self._inference_thread = None
+
+        self._stats_timer = QTimer(self)
+        self._stats_timer.timeout.connect(self._emit_stats)
+
+    def is_running(self) -> bool:
+        return self._capture_thread is not None
+
+    def start(self, source=0):
+        """打开帧来源（默认摄像头）并启动采集与推理线程，打开失败时抛出IOError"""
+        if self.is_running():
+            return
+        # 上一次停止时可能仍有一帧在推理，等待其结束，避免两个推理线程同时使用识别器
+        if self._inference_thread is not None:
+            self._inference_thread.wait()
+            self._inference_thread = None
+
+        self.recognizer.start_camera(source)
+        self.slot.reopen()
+        self.capture_meter.reset()
+        self.ocr_meter.reset()
+
+        self._capture_thread = CaptureThread(self.recognizer, self.slot, self.capture_meter)
+        self._capture_thread.frame_captured.connect(self.frame_ready)
+        self._capture_thread.source_finished.connect(self.source_finished)
+        self._inference_thread = InferenceThread(self.recognizer, self.slot, self.ocr_meter)
+        self._inference_thread.plates_recognized.connect(self.plates_recognized)
+        self._inference_thread.error_occurred.connect(self.error_occurred)
+
+        self._capture_thread.start()
+        self._inference_thread.start()
+        self._stats_timer.start(1000)
+        metrics.register_collector(self._collect_metrics)
+
+    def stop(self, wait_inference: bool = False):
+        """
+        停止流水线并关闭帧来源。
+        默认不等待正在进行的OCR完成，以免阻塞GUI线程；下次start()前会自动等待。
+        """
+        if not self.is_running():
+            return
+        metrics.unregister_collector(self._collect_metrics)
+        self._stats_timer.stop()
+        self._capture_thread.stop()
+        self._inference_thread.stop()
+        self.slot.close()
+
+        self._capture_thread.wait()
+        self._capture_thread.frame_captured.disconnect(self.frame_ready)
+        self._capture_thread.source_finished.disconnect(self.source_finished)
+        self._inference_thread.plates_recognized.disconnect(self.plates_recognized)
+        self._inference_thread.error_occurred.disconnect(self.error_occurred)
+        self._capture_thread = None
+        self.recognizer.stop_camera()
+
+        if wait_inference:
+            self._inference_thread.wait()
+            self._inference_thread = None
+
+    def _emit_stats(self):
+        self.stats_updated.emit(self.capture_meter.fps(), self.ocr_meter.fps(), self.slot.dropped)
+
+    def _collect_metrics(self):
+        """指标采集函数：帧计数（含丢弃的帧）和采集、识别帧率"""
+        yield from frame_samples('gui', dict(self.recognizer.get_stats(), dropped=self.slot.dropped))
+        for stage, meter in (('capture', self.capture_meter), ('ocr', self.ocr_meter)):
+            yield ('parking_fps', 'gauge', '最近几秒的帧率', {'lane': 'gui', 'stage': stage}, meter.fps())
@@ -0,0 +1,173 @@
+# gui/record_model.py
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+
+from database import archive, plate_index
+from database.timestamps import format_ms
+from .async_db import get_executor
+
+# 键集分页查询：{records} 为停车记录来源（见 archive.records_source），{where} 为过滤条件，
+# {after} 为空或 KEYSET_AFTER（从上一页最后一行的键之后继续）
+PAGE_QUERY = ("SELECT id, plate_number, entry_time, exit_time, fee, spot_number FROM {records} "
+              "WHERE {where}{after} ORDER BY entry_time DESC, id DESC LIMIT ?")
+KEYSET_AFTER = " AND (entry_time, id) < (?, ?)"
+COUNT_QUERY = "SELECT COUNT(*) FROM {records} WHERE {where}"
+
+
+def _filters(conn, plate_number, entry_range):
+    """返回 (WHERE 条件, 参数, 车牌条件)；车牌条件用于挑选含有匹配车牌的归档月份"""
+    where, params, plate_filter = ["1=1"], [], None
+    if plate_number:
+        # 子串匹配走车牌 trigram 索引，而不是对全部记录做 LIKE '%...%'
+        plate_filter = plate_index.substring_filter(conn, plate_number)
+        where.append(plate_filter[0])
+        params += plate_filter[1]
+    if entry_range:
+        where.append("entry_time BETWEEN ? AND ?")
+        params += list(entry_range)
+    return " AND ".join(where), params, plate_filter
+
+
+def _records_source(conn, plate_filter, entry_range, after=None):
+    """与 ParkingSystem.get_records_between 一样，只合并时间范围和车牌可能命中的归档月份"""
+    start_ms, end_ms = entry_range or (0, None)
+    if after:
+        # 键集分页只取入场时间不晚于上一页末行的记录，归档记录过多需要复制到临时表时也只复制这一段
+        end_ms = after[0] if end_ms is None else min(end_ms, after[0])
+    months = archive.months_matching(conn, plate_filter, start_ms, end_ms)
+    return archive.records_source(conn, months, start_ms, end_ms)
+
+
+def _load_page(conn, plate_number, entry_range, after, page_size):
+    """后台线程中执行：取 after=(entry_time, id) 之后的一页记录，包括已归档的记录"""
+    where, params, plate_filter = _filters(conn, plate_number, entry_range)
+    if after:
+        params += list(after)
+    params.append(page_size)
+    with _records_source(conn, plate_filter, entry_range, after) as records:
+        query = PAGE_QUERY.format(records=records, where=where, after=KEYSET_AFTER if after else "")
+        return conn.execute(query, params).fetchall()
+
+
+def _count_records(conn, plate_number, entry_range):
+    where, params, plate_filter = _filters(conn, plate_number, entry_range)
+    with _records_source(conn, plate_filter, entry_range) as records:
+        return conn.execute(COUNT_QUERY.format(records=records, where=where), params).fetchone()[0]
+
+
+class RecordTableModel(QAbstractTableModel):
+    """
+    停车记录的分页表格模型。
+    按 (entry_time, id) 倒序做键集分页：每页从上一页最后一行的键继续往后取，
+    无论翻到多深，每次都只是一次索引范围查询；视图滚动到底部时通过 canFetchMore/fetchMore 加载下一页。
+    模型只保存已加载行的原始元组，单元格文本在视图绘制可见区域时才生成。
+    翻页和统计总数都在数据访问执行器的后台线程中进行，条件改变时仍在进行的旧查询会被取消。
+    """
+    HEADERS = ['ID', '车牌号', '入场时间', '出场时间', '费用', '车位号']
+    count_ready = pyqtSignal(int)
+    load_failed = pyqtSignal(str)
+
+    def __init__(self, page_size=200, executor=None, parent=None):
+        super().__init__(parent)
+        self.page_size = page_size
+        self.executor = executor or get_executor()
+        self._rows = []
+        self._plate_number = None
+        self._entry_range = None
+        self._exhausted = True
+        self._loading = False
+        self._generation = 0
+        # 每个模型实例独立的任务 key，新查询会取消同一 key 下未完成的旧查询
+        self._page_key = ('record-page', id(self))
+        self._count_key = ('record-count', id(self))
+        self.total_count = None  # 后台统计完成前为None
+
+    def set_filter(self, plate_number=None, entry_range=None):
+        """设置过滤条件并从第一页重新加载；entry_range 为入场时间的 (起始毫秒, 结束毫秒)，两端都包含"""
+        self._plate_number = plate_number or None
+        self._entry_range = tuple(entry_range) if entry_range else None
+        self.refresh()
+
+    def refresh(self):
+        """按当前条件重新加载第一页，并在后台重新统计总数"""
+        self._generation += 1
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = False
+        self._loading = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+        self.total_count = None
+        generation = self._generation
+        self.executor.call(_count_records, self._plate_number, self._entry_range,
+                           key=self._count_key, owner=self,
+                           on_result=lambda count: self._on_counted(generation, count),
+                           on_error=lambda error: self._on_failed(generation, error))
+
+    def _on_counted(self, generation, count):
+        if generation == self._generation:  # 忽略过期条件的统计结果
+            self.total_count = count
+            self.count_ready.emit(count)
+
+    def cancel_pending(self):
+        """取消仍在进行的翻页和统计查询（关闭对话框前调用）"""
+        self.executor.cancel(self._page_key)
+        self.executor.cancel(self._count_key)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        # 上一页还在加载时不重复请求
+        return not parent.isValid() and not self._exhausted and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._loading = True
+        after = (self._rows[-1][2], self._rows[-1][0]) if self._rows else None
+        generation = self._generation
+        self.executor.call(_load_page, self._plate_number, self._entry_range, after, self.page_size,
+                           key=self._page_key, owner=self,
+                           on_result=lambda page: self._on_page(generation, page),
+                           on_error=lambda error: self._on_failed(generation, error))
+
+    def _on_page(self, generation, page):
+        if generation != self._generation:
+            return
+        self._loading = False
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+            self._rows.extend(page)
+            self.endInsertRows()
+
+    def _on_failed(self, generation, error):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self._exhausted = True
+        self.load_failed.emit(str(error))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        value = self._rows[index.row()][index.column()]
+        if index.column() in (2, 3):  # 入场、出场时间为纪元毫秒
+            return format_ms(value)
+        return str(value) if value is not None else ""
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def record_id(self, row):
+        return self._rows[row][0]
+
+    def loaded_count(self):
+        return len(self._rows)
@@ -0,0 +1,37 @@
+# gui/report_worker.py
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from core.report_export import ReportCancelled, ReportExporter
+
+
+class ReportWorker(QThread):
+    """在后台线程中生成Excel报表，避免大报表冻结界面"""
+    progress = pyqtSignal(int, int)       # 已写行数, 总行数
+    report_ready = pyqtSignal(str, int)   # 文件路径, 车牌行数（0表示期间无记录，未生成文件）
+    report_failed = pyqtSignal(str)
+    report_cancelled = pyqtSignal()
+
+    def __init__(self, path, start_ms, end_ms, title, exporter=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.title = title
+        self.exporter = exporter or ReportExporter()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        try:
+            rows = self.exporter.export(self.path, self.start_ms, self.end_ms, self.title,
+                                        progress=self.progress.emit, is_cancelled=self._cancel.is_set)
+        except ReportCancelled:
+            self.report_cancelled.emit()
+        except Exception as e:
+            self.report_failed.emit(str(e))
+        else:
+            self.report_ready.emit(self.path, rows)
@@ -1,18 +1,18 @@
 # gui/user_window.py
-import sqlite3
 from PyQt5.QtWidgets import (QWidget, QLabel, QPushButton, QVBoxLayout, QLineEdit, 
                              QHBoxLayout, QGroupBox, QDesktopWidget, QMessageBox, 
                              QTableWidget, QTableWidgetItem, QListWidget)
 from PyQt5.QtCore import Qt
 
-from core.parking_system import ParkingSystem
+from core.parking_system import vehicle_history
+from database.timestamps import format_ms
+from .async_db import get_executor
 # from .login_window import LoginWindow # <--- 删除此处的导入
 
 class UserWindow(QWidget):
     def __init__(self, username):
         super().__init__()
         self.username = username
-        self.parking = ParkingSystem()
         self.login_window_instance = None # 用于持有新登录窗口的引用
         self.init_ui()
         self.load_user_vehicles()
@@ -66,13 +66,12 @@ class UserWindow(QWidget):
         self.move(qr.topLeft())
 
     def load_user_vehicles(self):
+        get_executor().query("SELECT plate_number FROM user_vehicles WHERE username = ? ORDER BY plate_number", (self.username,),
+                             owner=self, name='user-vehicles', on_result=self.show_user_vehicles,
+                             on_error=self.on_query_failed)
+
+    def show_user_vehicles(self, vehicles):
         self.vehicle_list.clear()
-        conn = sqlite3.connect('parking.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT plate_number FROM user_vehicles WHERE username = ? ORDER BY plate_number", (self.username,))
-        vehicles = cursor.fetchall()
-        conn.close()
-        
         if vehicles:
             for v in vehicles:
                 self.vehicle_list.addItem(v[0])
@@ -85,19 +84,25 @@ class UserWindow(QWidget):
             self.history_table.setRowCount(0)
             return
 
-        records = self.parking.get_vehicle_history(plate_number)
-        
+        # 连续点击不同车辆时，只显示最后一次点击的查询结果
+        get_executor().submit(vehicle_history, plate_number, key=('user-history', id(self)),
+                              owner=self, on_result=self.show_history, on_error=self.on_query_failed)
+
+    def show_history(self, records):
         self.history_table.setRowCount(len(records))
         if records:
             for i, record in enumerate(records):
                 entry_time, exit_time, fee, spot = record
-                self.history_table.setItem(i, 0, QTableWidgetItem(str(entry_time)))
-                self.history_table.setItem(i, 1, QTableWidgetItem(str(exit_time) if exit_time else "在场"))
+                self.history_table.setItem(i, 0, QTableWidgetItem(format_ms(entry_time)))
+                self.history_table.setItem(i, 1, QTableWidgetItem(format_ms(exit_time) if exit_time else "在场"))
                 self.history_table.setItem(i, 2, QTableWidgetItem(f"{fee:.2f}" if fee is not None else "-"))
                 self.history_table.setItem(i, 3, QTableWidgetItem(str(spot)))
         else:
             self.history_table.setRowCount(0)
 
+    def on_query_failed(self, error):
+        QMessageBox.critical(self, '数据库错误', f'查询时发生错误：{error}')
+
     def logout(self):
         # <--- 修改在这里
         # 在需要时才导入 LoginWindow，打破循环
@@ -1,7 +1,10 @@
 # main.py
 import sys
-from PyQt5.QtWidgets import QApplication
-from database.database_manager import setup_database
+from PyQt5.QtWidgets import QApplication, QMessageBox
+from core import metrics, tracing
+from core.ocr_model import get_shared_model
+from database.database_manager import MigrationError, setup_database
+from gui.async_db import get_executor
 from gui.login_window import LoginWindow
 
 def main():
@@ -11,9 +14,26 @@ def main():
     # 1. 创建Qt应用程序实例
     app = QApplication(sys.argv)
 
+    # 在后台线程中提前加载并预热OCR模型，登录期间即可完成
+    get_shared_model()
+
     # 2. 初始化数据库和表结构
     # 这个函数只会在第一次运行时创建表，之后运行则无操作
-    setup_database()
+    try:
+        setup_database()
+    except MigrationError as e:
+        # 数据库结构不完整时继续运行只会在之后的查询中出错
+        QMessageBox.critical(None, '数据库错误', str(e))
+        sys.exit(1)
+
+    # 退出前取消未完成的查询并等待后台数据库线程结束
+    app.aboutToQuit.connect(get_executor().shutdown)
+
+    # 设置了 PARKING_METRICS_PORT / PARKING_METRICS_FILE 时开启运行指标
+    if metrics.configure_from_env():
+        app.aboutToQuit.connect(metrics.shutdown)
+    # 设置了 PARKING_TRACE_LOG 时记录闸机事件追踪
+    tracing.configure_from_env()
 
     # 3. 创建并显示登录窗口
     login_win = LoginWindow()
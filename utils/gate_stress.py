@@ -0,0 +1,153 @@
+# utils/gate_stress.py
+"""
+多闸机并发压力测试。
+
+启动多个进程，每个进程模拟一台闸机，用各自的 ParkingSystem 对同一个数据库反复随机执行入场、出场和在场查询，
+结束后检查是否出现重复占用：同一车牌或同一车位同时存在多条未出场记录，
+以及同一车位或同一车牌的 [入场时间, 出场时间) 区间互相重叠。
+
+用法示例：
+    python -m utils.gate_stress --processes 8 --seconds 10 --spots 20 --plates 60
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from core.parking_system import ParkingSystem
+from database.database_manager import setup_database
+
+
+def _gate(db_path, total_spots, plates, seconds, seed, start_event, results):
+    """单台闸机：在限定时间内随机执行入场/出场/查询"""
+    rng = random.Random(seed)
+    parking = ParkingSystem(total_spots, db_path=db_path)
+    counts = {"entry": 0, "exit": 0, "query": 0, "full": 0, "errors": 0}
+    start_event.wait()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        plate = rng.choice(plates)
+        action = rng.random()
+        try:
+            if action < 0.45:
+                if parking.vehicle_entry(plate) is None:
+                    counts["full"] += 1
+                counts["entry"] += 1
+            elif action < 0.9:
+                parking.vehicle_exit(plate)
+                counts["exit"] += 1
+            else:
+                parking.is_vehicle_inside(plate)
+                counts["query"] += 1
+        except sqlite3.Error as e:
+            counts["errors"] += 1
+            print(f"[闸机 {seed}] 数据库错误: {e}")
+    parking.close()
+    results.put(counts)
+
+
+def _overlaps(rows):
+    """rows: 按 (键, 入场时间) 排序的 (键, 入场, 出场)，返回相邻区间重叠的键"""
+    bad = []
+    previous = None
+    for key, entry_time, exit_time in rows:
+        end = exit_time if exit_time is not None else float('inf')
+        start = entry_time
+        if previous and previous[0] == key and start < previous[1]:
+            bad.append(key)
+        if not previous or previous[0] != key or end > previous[1]:
+            previous = (key, end)
+    return bad
+
+
+def check_consistency(db_path):
+    """返回发现的问题列表，为空表示没有重复占用"""
+    problems = []
+    conn = sqlite3.connect(db_path)
+    try:
+        for column, label in (("plate_number", "车牌"), ("spot_number", "车位")):
+            for key, count in conn.execute(
+                    f"SELECT {column}, COUNT(*) FROM parking_records WHERE exit_time IS NULL "
+                    f"GROUP BY {column} HAVING COUNT(*) > 1"):
+                problems.append(f"{label} {key} 有 {count} 条未出场记录")
+            rows = conn.execute(
+                f"SELECT {column}, entry_time, exit_time FROM parking_records ORDER BY {column}, entry_time").fetchall()
+            for key in sorted(set(_overlaps(rows))):
+                problems.append(f"{label} {key} 的停车区间存在重叠")
+    finally:
+        conn.close()
+    return problems
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='多闸机并发入场/出场压力测试')
+    parser.add_argument('--processes', type=int, default=8, help='模拟的闸机进程数')
+    parser.add_argument('--seconds', type=float, default=10.0, help='每个进程的运行时间')
+    parser.add_argument('--spots', type=int, default=20, help='车位总数（设得小一些更容易触发争用）')
+    parser.add_argument('--plates', type=int, default=60, help='参与测试的车牌数量')
+    parser.add_argument('--db', help='测试数据库路径，默认在临时目录中新建（不要指向正式数据库）')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    workdir = None
+    db_path = args.db
+    if not db_path:
+        workdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(workdir.name, 'gate_stress.db')
+    setup_database(db_path)
+
+    plates = [f"{i:06X}" for i in range(0xA00000, 0xA00000 + args.plates)]
+    start_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    gates = [multiprocessing.Process(target=_gate,
+                                     args=(db_path, args.spots, plates, args.seconds, seed, start_event, results))
+             for seed in range(args.processes)]
+    for gate in gates:
+        gate.start()
+    print(f"{args.processes} 台闸机，{args.spots} 个车位，{args.plates} 个车牌，运行 {args.seconds} 秒...")
+    started = time.perf_counter()
+    start_event.set()
+    totals = {}
+    received, crashed = 0, []
+    # 闸机进程因非数据库异常退出时不会送回结果，不能无限等待
+    while received + len(crashed) < len(gates):
+        try:
+            counts = results.get(timeout=1.0)
+        except queue.Empty:
+            crashed = [gate for gate in gates if gate.exitcode not in (None, 0)]
+            continue
+        received += 1
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+    for gate in gates:
+        gate.join()
+    elapsed = time.perf_counter() - started
+    for gate in crashed:
+        print(f"  ✗ 闸机进程 {gate.pid} 异常退出（退出码 {gate.exitcode}），其结果未计入")
+
+    writes = totals.get("entry", 0) + totals.get("exit", 0)
+    print(f"入场 {totals.get('entry', 0)}（车位已满 {totals.get('full', 0)}）  出场 {totals.get('exit', 0)}  "
+          f"查询 {totals.get('query', 0)}  错误 {totals.get('errors', 0)}")
+    print(f"写事务吞吐: {writes / elapsed:.1f} 次/秒  总吞吐: {(writes + totals.get('query', 0)) / elapsed:.1f} 次/秒")
+
+    problems = check_consistency(db_path)
+    if workdir:
+        workdir.cleanup()
+    if problems or crashed or totals.get("errors"):
+        for problem in problems:
+            print(f"  ✗ {problem}")
+        print("检查未通过。")
+        return 1
+    print("检查通过：没有车位或车牌被重复占用。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,333 @@
 # utils/image_processor.py
-import cv2
+"""
+车牌图片批量预处理。
+
+按可配置的处理步骤链（默认与原来相同：灰度 -> 阈值165二值化 -> 反相）处理一个目录（可递归）中的全部图片，
+在进程池中按块分发任务，占满所有CPU核心。输出目录中的清单文件记录每张图片处理时的大小、修改时间、
+内容哈希和步骤链，再次运行时跳过已是最新的输出，中途中断后重新运行会从中断处继续。
+
+用法示例：
+    python -m utils.image_processor captures/ preprocessed/ --recursive
+    python -m utils.image_processor captures/ preprocessed/ --steps gray,clahe:2,blur:3,otsu,invert --check hash
+    python -m utils.image_processor --list-steps
+"""
+import argparse
+import hashlib
+import multiprocessing as mp
 import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.frame_source import IMAGE_EXTENSIONS
+
+DEFAULT_STEPS = 'gray,threshold:165,invert'
+MANIFEST_NAME = '.image_processor.db'  # 输出目录中的处理清单
+CHECK_MODES = ('mtime', 'hash')
+
+
+# ---- 处理步骤 ----
+# 每个步骤为 fn(图像, *参数) -> 图像；参数在步骤链中以冒号分隔，例如 threshold:150、resize:320:96
+
+def _gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def _odd(size: float) -> int:
+    size = max(1, int(size))
+    return size if size % 2 else size + 1
+
+
+def _resize(image, width, height=0):
+    h, w = image.shape[:2]
+    width, height = int(width), int(height)
+    if not height:
+        height = max(1, round(h * width / w))  # 只给宽度时保持宽高比
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA if width < w else cv2.INTER_LINEAR)
+
+
+STEPS = {
+    'gray': (_gray, '转为灰度图'),
+    'threshold': (lambda image, value=165: cv2.threshold(_gray(image), float(value), 255, cv2.THRESH_BINARY)[1],
+                  '固定阈值二值化，threshold:阈值（默认165）'),
+    'otsu': (lambda image: cv2.threshold(_gray(image), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1],
+             '大津法自动阈值二值化'),
+    'adaptive': (lambda image, block=31, c=10: cv2.adaptiveThreshold(
+        _gray(image), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, _odd(block), float(c)),
+                 '自适应阈值二值化，适合光照不均，adaptive:窗口大小:常数（默认31:10）'),
+    'invert': (cv2.bitwise_not, '反相'),
+    'equalize': (lambda image: cv2.equalizeHist(_gray(image)), '直方图均衡化'),
+    'clahe': (lambda image, clip=2.0, tile=8: cv2.createCLAHE(float(clip), (int(tile), int(tile))).apply(_gray(image)),
+              '限制对比度的自适应直方图均衡化，clahe:对比度上限:网格数（默认2:8）'),
+    'blur': (lambda image, size=3: cv2.GaussianBlur(image, (_odd(size), _odd(size)), 0), '高斯模糊，blur:核大小（默认3）'),
+    'median': (lambda image, size=3: cv2.medianBlur(image, _odd(size)), '中值滤波去噪点，median:核大小（默认3）'),
+    'sharpen': (lambda image: cv2.filter2D(image, -1, np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]], np.float32)),
+                '锐化'),
+    'resize': (_resize, '缩放到指定尺寸，resize:宽[:高]，省略高度时保持宽高比'),
+    'scale': (lambda image, factor: cv2.resize(image, None, fx=float(factor), fy=float(factor),
+                                               interpolation=cv2.INTER_AREA if float(factor) < 1 else cv2.INTER_LINEAR),
+              '按比例缩放，scale:倍数'),
+}
+
+
+def parse_steps(spec: str) -> List[Tuple[str, Tuple[float, ...]]]:
+    """'gray,threshold:165,invert' -> [('gray', ()), ('threshold', (165.0,)), ('invert', ())]"""
+    steps = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, *args = item.split(':')
+        if name not in STEPS:
+            raise ValueError(f"未知的处理步骤: {name}（可用步骤: {', '.join(STEPS)}）")
+        try:
+            steps.append((name, tuple(float(arg) for arg in args)))
+        except ValueError:
+            raise ValueError(f"处理步骤 {item} 的参数应为数字")
+    if not steps:
+        raise ValueError("处理步骤链不能为空")
+    return steps
+
+
+def steps_signature(steps) -> str:
+    """步骤链的规范写法，记入清单：步骤或参数改变后所有图片都需要重新处理"""
+    return ','.join(':'.join([name] + [f'{arg:g}' for arg in args]) for name, args in steps)
+
+
+def apply_steps(image, steps):
+    for name, args in steps:
+        image = STEPS[name][0](image, *args)
+    return image
+
+
+# ---- 工作进程 ----
+_worker_state = {}
+
+def _init_worker(spec: str):
+    cv2.setNumThreads(1)  # 并行度来自进程数，每个进程内的OpenCV不再开线程
+    _worker_state['steps'] = parse_steps(spec)
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _write_atomic(path: str, image):
+    """先写入同目录的临时文件再替换，中断时不会留下写了一半、却被当成已完成的输出"""
+    root, ext = os.path.splitext(path)
+    temp_path = f'{root}.partial{ext}'
+    if not cv2.imwrite(temp_path, image):
+        raise IOError("无法写入输出文件")
+    os.replace(temp_path, path)
+
+
+def _process_task(task):
+    """
+    处理一张图片，task 为 (相对路径, 输入路径, 输出路径, 清单中记录的哈希或None)。
+    返回 (相对路径, 状态, 哈希, 输入字节数, 错误信息)，状态为 'done'、'unchanged'（内容与上次相同）或 'failed'。
+    """
+    rel, src, dst, known_digest = task
+    try:
+        with open(src, 'rb') as f:
+            data = f.read()
+        digest = _digest(data)
+        if known_digest is not None and digest == known_digest:
+            return rel, 'unchanged', digest, len(data), None
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return rel, 'failed', digest, len(data), "无法解码图像"
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _write_atomic(dst, apply_steps(image, _worker_state['steps']))
+        return rel, 'done', digest, len(data), None
+    except Exception as e:
+        return rel, 'failed', None, 0, str(e)
+
+
+# ---- 处理清单 ----
+
+def _open_manifest(output_folder: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(os.path.join(output_folder, MANIFEST_NAME))
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processed (
+            path TEXT PRIMARY KEY,      -- 相对输入目录的路径
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            digest TEXT NOT NULL,       -- 输入文件内容的哈希
+            steps TEXT NOT NULL         -- 处理时的步骤链
+        ) WITHOUT ROWID
+    ''')
+    return conn
+
+
+def find_images(input_folder: str, recursive: bool = False):
+    """产出 (相对路径, 完整路径, os.stat_result)，按路径排序；输出目录位于输入目录之下时由调用方排除"""
+    def walk(folder):
+        try:
+            entries = sorted(os.scandir(folder), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"无法读取目录 {folder}: {e}")
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from walk(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(entry.path, input_folder), entry.path, entry.stat()
+    yield from walk(input_folder)
+
+
+def plan(input_folder: str, output_folder: str, steps: str, recursive: bool, check: str, force: bool, conn):
+    """
+    对比清单，返回 (需要交给工作进程的任务, 已是最新而跳过的数量, {相对路径: (大小, 修改时间)})。
+    大小和修改时间都与清单一致、步骤链相同且输出仍在时跳过；hash 模式下其余有记录的图片交给工作进程比较内容哈希。
+    """
+    known = {} if force else {
+        path: (size, mtime_ns, digest)
+        for path, size, mtime_ns, digest in conn.execute(
+            "SELECT path, size, mtime_ns, digest FROM processed WHERE steps = ?", (steps,))
+    }
+    output_real = os.path.realpath(output_folder)
+    tasks, skipped, stats = [], 0, {}
+    for rel, src, st in find_images(input_folder, recursive):
+        if os.path.realpath(src).startswith(output_real + os.sep):
+            continue
+        dst = os.path.join(output_folder, rel)
+        record = known.get(rel)
+        output_exists = record is not None and os.path.exists(dst)
+        if output_exists and record[0] == st.st_size and record[1] == st.st_mtime_ns:
+            skipped += 1
+            continue
+        stats[rel] = (st.st_size, st.st_mtime_ns)
+        tasks.append((rel, src, dst, record[2] if output_exists and check == 'hash' else None))
+    return tasks, skipped, stats
+
+
+def process_folder(input_folder: str, output_folder: str, steps: str = DEFAULT_STEPS, workers: Optional[int] = None,
+                   chunk_size: int = 32, recursive: bool = False, check: str = 'mtime', force: bool = False,
+                   verbose: bool = False) -> dict:
+    """
+    批量处理 input_folder 中的图片并写入 output_folder（保持相对路径和文件名），返回统计信息。
+    steps 为处理步骤链（见 STEPS），check 为 'mtime'（大小和修改时间变化即重新处理）或 'hash'
+    （内容哈希不变时只更新清单），force=True 时忽略清单全部重新处理。
+    """
+    if check not in CHECK_MODES:
+        raise ValueError(f"未知的检查方式: {check}")
+    if os.path.realpath(input_folder) == os.path.realpath(output_folder):
+        raise ValueError("输出目录不能与输入目录相同")
+    signature = steps_signature(parse_steps(steps))
+    os.makedirs(output_folder, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    with closing(_open_manifest(output_folder)) as conn:
+        tasks, skipped, stats = plan(input_folder, output_folder, signature, recursive, check, force, conn)
+        print(f"找到 {len(tasks) + skipped} 张图片，{skipped} 张已是最新，待处理 {len(tasks)} 张"
+              f"（{workers} 个进程，步骤: {signature}）")
+        summary = {"found": len(tasks) + skipped, "skipped": skipped, "done": 0, "unchanged": 0, "failed": 0,
+                   "bytes": 0, "seconds": 0.0}
+        if not tasks:
+            return summary
+
+        started = last_report = time.perf_counter()
+        pending = []  # 尚未写入清单的完成记录
+
+        def flush():
+            conn.executemany(
+                "INSERT OR REPLACE INTO processed (path, size, mtime_ns, digest, steps) VALUES (?, ?, ?, ?, ?)",
+                pending)
+            conn.commit()
+            pending.clear()
+
+        # 每个工作进程一次领取 chunk_size 张图片，减少进程间通信的次数
+        pool = mp.Pool(workers, initializer=_init_worker, initargs=(signature,))
+        try:
+            for rel, status, digest, size, error in pool.imap_unordered(_process_task, tasks, chunksize=chunk_size):
+                summary[status] += 1
+                summary["bytes"] += size
+                if status == 'failed':
+                    print(f"\n处理失败: {rel}: {error}")
+                else:
+                    pending.append((rel, *stats[rel], digest, signature))
+                    if verbose:
+                        print(f"已处理并保存: {rel}")
+                # 定期写入清单：中断后重新运行时，已写入清单的图片不会再处理
+                now = time.perf_counter()
+                if len(pending) >= 500 or now - last_report >= 2:
+                    flush()
+                    finished = summary["done"] + summary["unchanged"] + summary["failed"]
+                    print(f"\r进度 {finished}/{len(tasks)}，{finished / (now - started):.0f} 张/秒", end='', flush=True)
+                    last_report = now
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            print("\n已中断，已完成的图片记入清单，重新运行将从中断处继续。")
+            raise
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            flush()
+
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+def print_summary(summary: dict):
+    seconds = summary["seconds"]
+    processed = summary["done"] + summary["unchanged"] + summary["failed"]
+    print(f"\n完成：处理 {summary['done']} 张，内容未变 {summary['unchanged']} 张，跳过 {summary['skipped']} 张，"
+          f"失败 {summary['failed']} 张")
+    if seconds > 0:
+        print(f"耗时 {seconds:.1f} 秒，吞吐 {processed / seconds:.1f} 张/秒，"
+              f"{summary['bytes'] / seconds / 1024 / 1024:.1f} MB/秒")
+
 
 def process_images_in_folder(input_folder, output_folder):
     """
     批量处理一个文件夹中的所有图像。
-    功能：转为灰度图 -> 二值化阈值分割 -> 反相 -> 保存。
-    """
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    img_list = os.listdir(input_folder)
-    print(f"找到 {len(img_list)} 张图片，开始处理...")
-    
-    for pic in img_list:
-        img_path = os.path.join(input_folder, pic)
-        output_path = os.path.join(output_folder, pic)
-        
-        image = cv2.imread(img_path)
-        if image is not None:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            _, mask = cv2.threshold(gray, 165, 255, cv2.THRESH_BINARY)
-            mask_inv = cv2.bitwise_not(mask)
-            cv2.imwrite(output_path, mask_inv)
-            print(f"已处理并保存: {pic}")
\ No newline at end of file
+    功能：转为灰度图 -> 二值化阈值分割 -> 反相 -> 保存（即默认步骤链，多进程执行并跳过已是最新的输出）。
+    """
+    summary = process_folder(input_folder, output_folder, DEFAULT_STEPS)
+    print_summary(summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='车牌图片批量预处理（多进程、可中断续跑）')
+    parser.add_argument('input', nargs='?', help='输入图片目录')
+    parser.add_argument('output', nargs='?', help='输出目录')
+    parser.add_argument('--steps', default=DEFAULT_STEPS, help=f'处理步骤链，逗号分隔（默认 {DEFAULT_STEPS}）')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认等于CPU核心数')
+    parser.add_argument('--chunk-size', type=int, default=32, help='每个进程一次领取的图片数')
+    parser.add_argument('--recursive', '-r', action='store_true', help='递归处理子目录（输出保持相同的目录结构）')
+    parser.add_argument('--check', choices=CHECK_MODES, default='mtime',
+                        help='判断输入是否变化：mtime 比较大小和修改时间；hash 修改时间变了时再比较内容哈希')
+    parser.add_argument('--force', action='store_true', help='忽略处理清单，全部重新处理')
+    parser.add_argument('--verbose', '-v', action='store_true', help='逐个输出处理完成的文件')
+    parser.add_argument('--list-steps', action='store_true', help='列出可用的处理步骤')
+    args = parser.parse_args(argv)
+
+    if args.list_steps:
+        for name, (_, description) in STEPS.items():
+            print(f"{name:<10}{description}")
+        return 0
+    if not args.input or not args.output:
+        parser.error('需要输入目录和输出目录')
+    try:
+        summary = process_folder(args.input, args.output, args.steps, workers=args.workers,
+                                 chunk_size=args.chunk_size, recursive=args.recursive, check=args.check,
+                                 force=args.force, verbose=args.verbose)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        return 130
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
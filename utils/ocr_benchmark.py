@@ -0,0 +1,200 @@
+# utils/ocr_benchmark.py
+"""
+离线车牌识别基准测试。
+
+语料目录中需要一个 labels.csv，每行为 `相对路径,期望车牌`（车牌留空表示画面中不应识别出车牌）。
+路径可以是单张图片、视频文件、图片目录或录制会话目录。
+
+用法示例：
+    python -m utils.ocr_benchmark corpus/ --roi-mode auto --width 960 --output result.json
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from core.frame_source import IMAGE_EXTENSIONS, open_source
+from core.ocr_model import OcrModel
+from core.plate_recognizer import PlateRecognizer
+
+STAGES = ('decode', 'resize', 'convert', 'gate', 'locate', 'readtext', 'vote', 'draw')
+
+
+def load_labels(corpus_dir):
+    """读取 labels.csv，返回 [(绝对路径, 期望车牌或None)]"""
+    labels_path = os.path.join(corpus_dir, 'labels.csv')
+    items = []
+    with open(labels_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            path = os.path.join(corpus_dir, row[0].strip())
+            plate = row[1].strip().upper() if len(row) > 1 and row[1].strip() else None
+            items.append((path, plate))
+    return items
+
+
+def iter_frames(path, still_frames):
+    """
+    逐帧产出 (解码耗时, BGR帧)；单张图片重复 still_frames 次，模拟停在镜头前的车辆，
+    重复的帧没有解码，解码耗时为None，不计入解码的延迟分布
+    """
+    if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+        t0 = time.perf_counter()
+        frame = cv2.imread(path)
+        elapsed = time.perf_counter() - t0
+        if frame is None:
+            return
+        for i in range(still_frames):
+            yield (elapsed if i == 0 else None), frame
+        return
+
+    source = open_source(path, speed=0)
+    source.open()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            frame = source.read()
+            elapsed = time.perf_counter() - t0
+            if frame is None:
+                if source.finished:
+                    break
+                continue
+            yield elapsed, frame
+    finally:
+        source.close()
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values) * 1000.0
+    return {
+        "count": len(values),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+
+
+def run_benchmark(items, recognizer, width=0, still_frames=5, stop_on_stable=True):
+    """对语料逐条运行识别器，返回汇总结果字典"""
+    stage_samples = {stage: [] for stage in STAGES}
+    frame_latencies = []
+    results = []
+    total_frames = 0
+    started = time.perf_counter()
+
+    for path, expected in items:
+        recognizer.reset_state()
+        predicted, frames, frames_to_stable = None, 0, None
+        for decode_time, frame in iter_frames(path, still_frames):
+            t0 = time.perf_counter()
+            if width and frame.shape[1] != width:
+                scale = width / frame.shape[1]
+                frame = cv2.resize(frame, (width, int(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+            resize_time = time.perf_counter() - t0
+
+            _, plates = recognizer.recognize(frame)
+            frame_latencies.append((decode_time or 0.0) + time.perf_counter() - t0)
+            frames += 1
+            if decode_time is not None:
+                stage_samples['decode'].append(decode_time)
+            stage_samples['resize'].append(resize_time)
+            for stage, elapsed in recognizer.stage_timings.items():
+                stage_samples.setdefault(stage, []).append(elapsed)
+
+            if plates and predicted is None:
+                # 同一帧稳定出多块车牌时，以与期望一致的那块为准
+                predicted = expected if expected in plates else plates[0]
+                frames_to_stable = frames
+                if stop_on_stable:
+                    break
+        total_frames += frames
+        results.append({
+            "path": os.path.relpath(path),
+            "expected": expected,
+            "predicted": predicted,
+            "frames": frames,
+            "frames_to_stable": frames_to_stable,
+            "correct": predicted == expected,
+        })
+
+    elapsed = time.perf_counter() - started
+    tp = sum(1 for r in results if r["predicted"] and r["predicted"] == r["expected"])
+    fp = sum(1 for r in results if r["predicted"] and r["predicted"] != r["expected"])
+    positives = sum(1 for r in results if r["expected"])
+    return {
+        "frames": total_frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(total_frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "frame_latency": percentiles(frame_latencies),
+        "stages": {stage: percentiles(samples) for stage, samples in stage_samples.items()},
+        "accuracy": {
+            "items": len(results),
+            "true_positives": tp,
+            "false_positives": fp,
+            "false_negatives": positives - tp,
+            "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+            "recall": round(tp / positives, 4) if positives else None,
+        },
+        "items": results,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='离线车牌识别基准测试')
+    parser.add_argument('corpus', help='包含 labels.csv 的语料目录')
+    parser.add_argument('--output', help='把完整结果写入该JSON文件')
+    parser.add_argument('--width', type=int, default=0, help='识别前把帧缩放到该宽度，0为原始分辨率')
+    parser.add_argument('--roi-mode', choices=PlateRecognizer.ROI_MODES, default='auto')
+    parser.add_argument('--full-frame-interval', type=int, default=15)
+    parser.add_argument('--motion-gate', action='store_true', help='启用运动门控（默认关闭，便于比较纯识别开销）')
+    parser.add_argument('--vote-window', type=int, default=10)
+    parser.add_argument('--min-votes', type=int, default=3)
+    parser.add_argument('--min-confidence', type=float, default=0.5)
+    parser.add_argument('--still-frames', type=int, default=5, help='单张图片重复送入的帧数')
+    parser.add_argument('--no-stop-on-stable', action='store_true', help='识别出稳定结果后继续处理剩余帧')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    items = load_labels(args.corpus)
+    print(f"语料共 {len(items)} 条，正在加载OCR模型...")
+    model = OcrModel()
+    model.get_reader()
+
+    recognizer = PlateRecognizer(
+        model=model, roi_mode=args.roi_mode, full_frame_interval=args.full_frame_interval,
+        motion_gate=args.motion_gate, vote_window=args.vote_window,
+        min_votes=args.min_votes, min_confidence=args.min_confidence)
+    report = run_benchmark(items, recognizer, width=args.width, still_frames=args.still_frames,
+                           stop_on_stable=not args.no_stop_on_stable)
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ('corpus', 'output')}
+
+    acc = report["accuracy"]
+    print(f"帧数: {report['frames']}  耗时: {report['seconds']}s  吞吐: {report['fps']} fps")
+    print(f"单帧延迟 p50/p95/p99: {report['frame_latency'].get('p50_ms')} / "
+          f"{report['frame_latency'].get('p95_ms')} / {report['frame_latency'].get('p99_ms')} ms")
+    for stage, stats in report["stages"].items():
+        if stats["count"]:
+            print(f"  {stage:<9} p50 {stats['p50_ms']:>9.3f}  p95 {stats['p95_ms']:>9.3f}  p99 {stats['p99_ms']:>9.3f} ms")
+    print(f"精确率: {acc['precision']}  召回率: {acc['recall']}  "
+          f"(TP {acc['true_positives']} / FP {acc['false_positives']} / FN {acc['false_negatives']})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"完整结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
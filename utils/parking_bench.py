@@ -0,0 +1,173 @@
+# utils/parking_bench.py
+"""
+ParkingSystem 吞吐量基准测试。
+
+在几种数据库规模下（先用 utils.traffic_gen 预填充历史记录），通过 ParkingSystem 回放合成的实时流量
+（入场、出场、在场查询、历史查询），输出每种调用的吞吐量和 p50/p95/p99 延迟。
+结果可以保存为基线，之后的运行与基线对比，p95 延迟变慢或吞吐量下降超过容差即视为性能回退并以非零状态退出。
+
+用法示例：
+    python -m utils.parking_bench --sizes 0,100000,1000000 --ops 20000 --save-baseline
+    python -m utils.parking_bench --sizes 0,100000,1000000 --ops 20000    # 与 parking_bench_baseline.json 对比
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from core.parking_system import ParkingSystem
+from database.database_manager import setup_database
+from .traffic_gen import LiveTraffic, add_profile_arguments, generate_history, populate, profile_from_args
+
+CALLS = ('vehicle_entry', 'vehicle_exit', 'is_vehicle_inside', 'get_vehicle_history')
+BASELINE_PATH = 'parking_bench_baseline.json'
+
+
+def latency_stats(samples, seconds):
+    """samples 为每次调用的耗时（秒），seconds 为这些调用的总耗时"""
+    if not samples:
+        return {"count": 0}
+    arr = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "ops_per_sec": round(len(samples) / seconds, 1) if seconds else None,
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+
+
+def replay(parking: ParkingSystem, traffic: LiveTraffic, ops: int) -> dict:
+    """回放 ops 个操作，返回 {调用: 统计} 以及总体吞吐量；结束后让仍在场的车辆出场"""
+    calls = {
+        'entry': ('vehicle_entry', parking.vehicle_entry),
+        'exit': ('vehicle_exit', parking.vehicle_exit),
+        'inside': ('is_vehicle_inside', parking.is_vehicle_inside),
+        'history': ('get_vehicle_history', parking.get_vehicle_history),
+    }
+    samples = {name: [] for name in CALLS}
+    perf_counter = time.perf_counter
+    started = perf_counter()
+    for op, plate in traffic.operations(ops):
+        name, call = calls[op]
+        t0 = perf_counter()
+        call(plate)
+        samples[name].append(perf_counter() - t0)
+    elapsed = perf_counter() - started
+
+    while traffic.inside:
+        parking.vehicle_exit(traffic.inside.pop())
+
+    total = sum(len(values) for values in samples.values())
+    return {
+        "ops": total,
+        "seconds": round(elapsed, 3),
+        "ops_per_sec": round(total / elapsed, 1),
+        "calls": {name: latency_stats(values, sum(values)) for name, values in samples.items()},
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """返回性能回退的描述列表：p95 延迟超过基线 (1+tolerance) 倍，或吞吐量低于基线 (1-tolerance) 倍"""
+    regressions = []
+    for size, current in results.items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for name, stats in current["calls"].items():
+            old = base["calls"].get(name)
+            if not old or not old.get("count") or not stats.get("count"):
+                continue
+            if stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{size} 条记录 {name}: p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+            if stats["ops_per_sec"] < old["ops_per_sec"] * (1 - tolerance):
+                regressions.append(f"{size} 条记录 {name}: 吞吐 {old['ops_per_sec']} -> {stats['ops_per_sec']} 次/秒")
+    return regressions
+
+
+def print_results(size, result):
+    print(f"\n== 历史记录 {size} 条：{result['ops']} 次调用，{result['seconds']} 秒，总吞吐 {result['ops_per_sec']} 次/秒")
+    print(f"  {'调用':<22}{'次数':>8}{'次/秒':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in result["calls"].items():
+        if stats["count"]:
+            print(f"  {name:<22}{stats['count']:>8}{stats['ops_per_sec']:>12}"
+                  f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='ParkingSystem 在不同数据库规模下的吞吐量与延迟基准测试')
+    parser.add_argument('--sizes', default='0,100000,1000000', help='依次测试的历史记录条数（逗号分隔，递增）')
+    parser.add_argument('--ops', type=int, default=20000, help='每种规模下回放的操作数')
+    parser.add_argument('--history-ratio', type=float, default=0.1, help='操作中历史查询的比例')
+    parser.add_argument('--db', help='测试数据库路径，默认在临时目录中新建（不要指向正式数据库）')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基线文件，存在时与之对比')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='判定性能回退的容差（0.2 表示20%%）')
+    add_profile_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sizes = sorted(int(size) for size in args.sizes.split(',') if size.strip())
+    profile = profile_from_args(args)
+    workdir = None
+    db_path = args.db
+    if not db_path:
+        workdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(workdir.name, 'parking_bench.db')
+
+    # 一次生成最大规模的历史记录，按规模递增分段写入，每到一个规模就回放一轮实时流量
+    print(f"生成 {sizes[-1]} 条历史记录...")
+    history = generate_history(profile, sizes[-1]) if sizes[-1] else []
+    traffic = LiveTraffic(profile, history_ratio=args.history_ratio, seed=args.seed + 1)
+    results = {}
+    written = 0
+    setup_database(db_path)
+    try:
+        for size in sizes:
+            if size > written:
+                started = time.perf_counter()
+                populate(db_path, history[written:size])
+                print(f"写入历史记录 {written} -> {size}，耗时 {time.perf_counter() - started:.1f} 秒")
+                written = size
+            parking = ParkingSystem(profile.spots, db_path=db_path)
+            try:
+                result = replay(parking, traffic, args.ops)
+            finally:
+                parking.close()
+            results[str(size)] = result
+            print_results(size, result)
+    finally:
+        if workdir:
+            workdir.cleanup()
+
+    report = {"profile": profile.to_dict(), "ops": args.ops, "history_ratio": args.history_ratio, "results": results}
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("profile") != report["profile"]:
+            print("\n注意：基线使用的流量特征与本次不同，对比结果仅供参考。")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n与基线 {args.baseline} 相比出现性能回退：")
+            for line in regressions:
+                print(f"  ✗ {line}")
+            status = 1
+        else:
+            print(f"\n与基线 {args.baseline} 相比没有性能回退。")
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {args.baseline}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# utils/query_plan_check.py
+"""
+检查热点查询的执行计划（EXPLAIN QUERY PLAN），确认它们都走索引而不是全表扫描。
+
+用法示例：
+    python -m utils.query_plan_check            # 在临时数据库上按最新结构检查
+    python -m utils.query_plan_check --db parking.db
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+from core.report_export import DAILY_QUERY, PLATE_COUNT_QUERY, PLATE_SUMMARY_QUERY
+from database.database_manager import get_schema_version, setup_database
+from gui.record_model import KEYSET_AFTER, PAGE_QUERY
+
+MONTH = (1704038400000, 1706716799999)
+
+# (名称, SQL, 参数)：与业务代码中的查询保持一致，已提取为常量的直接引用业务代码中的SQL
+HOT_QUERIES = (
+    ("在场车辆（重建占用索引）",
+     "SELECT id, plate_number, spot_number, entry_time FROM parking_records WHERE exit_time IS NULL", ()),
+    ("车辆出场",
+     "UPDATE parking_records SET exit_time = ?, fee = ? WHERE id = ? AND exit_time IS NULL",
+     (1704074400000, 15.0, 1)),
+    ("车辆历史记录",
+     "SELECT entry_time, exit_time, fee, spot_number FROM parking_records WHERE plate_number = ? ORDER BY entry_time DESC",
+     ("AB1234",)),
+    ("记录搜索（全部）",
+     "SELECT id, plate_number, entry_time, exit_time, fee, spot_number FROM parking_records WHERE 1=1 "
+     "ORDER BY entry_time DESC", ()),
+    ("记录搜索（按日期）",
+     "SELECT id, plate_number, entry_time, exit_time, fee, spot_number FROM parking_records WHERE 1=1 "
+     "AND entry_time BETWEEN ? AND ? ORDER BY entry_time DESC", (1704038400000, 1704124799999)),
+    ("月度报表",
+     "SELECT plate_number, COUNT(*), SUM(COALESCE(fee, 0)) FROM parking_records "
+     "WHERE entry_time BETWEEN ? AND ? GROUP BY plate_number", (1704038400000, 1706716799999)),
+    ("按车牌和时间范围查询",
+     "SELECT id, plate_number, entry_time, exit_time, fee, spot_number FROM parking_records "
+     "WHERE entry_time BETWEEN ? AND ? AND plate_number = ? ORDER BY entry_time DESC",
+     (1704038400000, 1706716799999, "AB1234")),
+    ("车牌子串检索",
+     "SELECT id, plate_number, entry_time, exit_time, fee, spot_number FROM parking_records "
+     "WHERE plate_number IN (SELECT plate_number FROM plates WHERE id IN "
+     "(SELECT rowid FROM plates_fts WHERE plates_fts MATCH ?)) ORDER BY entry_time DESC, id DESC LIMIT 200",
+     ('plate_number : "AB1"',)),
+    ("记录分页（首页）", PAGE_QUERY.format(records="parking_records", where="1=1", after=""), (200,)),
+    ("记录分页（翻页）", PAGE_QUERY.format(records="parking_records", where="1=1", after=KEYSET_AFTER),
+     (1704074400000, 1, 200)),
+    ("记录分页（按日期翻页）", PAGE_QUERY.format(records="parking_records", where="1=1 AND entry_time BETWEEN ? AND ?",
+                                          after=KEYSET_AFTER),
+     MONTH + (1704074400000, 1, 200)),
+    ("报表车牌数", PLATE_COUNT_QUERY.format(records="parking_records"), MONTH),
+    ("报表按车牌汇总", PLATE_SUMMARY_QUERY.format(records="parking_records"), MONTH),
+    ("报表每日明细", DAILY_QUERY, ("2024-01-01", "2024-01-31")),
+    ("在场记录变更",
+     "SELECT c.record_id, r.plate_number, r.spot_number, r.entry_time, r.exit_time "
+     "FROM (SELECT DISTINCT record_id FROM occupancy_changes WHERE seq > ? AND seq <= ?) AS c "
+     "LEFT JOIN parking_records AS r ON r.id = c.record_id", (0, 100)),
+)
+
+
+def explain(conn, sql, params=()):
+    """返回执行计划中每一步的描述"""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def uses_index(plan) -> bool:
+    """
+    不存在对表的无索引扫描（SCAN 表名 且没有 USING ...）即认为走了索引，虚拟表（FTS）的扫描由其自身索引完成，
+    对子查询结果（CO-ROUTINE / MATERIALIZE）的扫描也不算全表扫描
+    """
+    subqueries = {detail.split(" ", 1)[1] for detail in plan if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))}
+    for detail in plan:
+        if detail.startswith("SCAN ") and " USING " not in detail and "VIRTUAL TABLE INDEX" not in detail \
+                and detail[len("SCAN "):] not in subqueries:
+            return False
+    return True
+
+
+def check_query_plans(conn):
+    """返回 [(名称, 执行计划, 是否走索引)]"""
+    results = []
+    for name, sql, params in HOT_QUERIES:
+        plan = explain(conn, sql, params)
+        results.append((name, plan, uses_index(plan)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='检查热点查询是否使用索引')
+    parser.add_argument('--db', help='要检查的数据库文件（只读取执行计划，不修改数据），默认新建临时数据库')
+    args = parser.parse_args(argv)
+
+    workdir = None
+    if args.db:
+        conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    else:
+        workdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(workdir.name, 'plan_check.db')
+        setup_database(db_path)
+        conn = sqlite3.connect(db_path)
+
+    try:
+        print(f"数据库结构版本: {get_schema_version(conn)}")
+        results = check_query_plans(conn)
+    finally:
+        conn.close()
+        if workdir:
+            workdir.cleanup()
+
+    for name, plan, ok in results:
+        print(f"{'✓' if ok else '✗'} {name}")
+        for detail in plan:
+            print(f"    {detail}")
+    failed = [name for name, _, ok in results if not ok]
+    if failed:
+        print(f"以下查询仍是全表扫描: {', '.join(failed)}")
+        return 1
+    print("所有热点查询均使用索引。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
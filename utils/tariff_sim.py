@@ -0,0 +1,117 @@
+# utils/tariff_sim.py
+"""
+收费规则模拟：用候选收费规则对一整年已出场的停车记录重新计费，并与实际收入对比。
+
+同时用当前规则（tariff.json，不存在时为默认规则）重新计费一遍，
+“当前规则”与“实际”的差异反映了历史上收费标准的变化，便于判断对比是否可信。
+已归档的记录会一并计入。
+
+用法示例：
+    python -m utils.tariff_sim candidate.json --year 2025
+    python -m utils.tariff_sim candidate.json --year 2025 --baseline tariff.json --db parking.db
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from core.tariff import TARIFF_PATH, Tariff, load_tariff, local_minutes
+from database import archive
+from database.database_manager import get_connection
+from database.timestamps import month_range
+
+
+def load_closed_records(db_path: str, start_ms: int, end_ms: int):
+    """读取入场时间在 [start_ms, end_ms] 内且已出场的记录，返回 (入场, 出场, 实收费用, 车牌) 数组"""
+    with get_connection(db_path) as conn, \
+            archive.records_source(conn, archive.months_in_range(conn, start_ms, end_ms), start_ms, end_ms) as records:
+        rows = conn.execute(
+            f"SELECT entry_time, exit_time, COALESCE(fee, 0), plate_number FROM {records} "
+            f"WHERE entry_time BETWEEN ? AND ? AND exit_time IS NOT NULL",
+            (start_ms, end_ms)
+        ).fetchall()
+    count = len(rows)
+    entry = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    exit_ = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+    fee = np.fromiter((row[2] for row in rows), dtype=np.float64, count=count)
+    plates = np.array([row[3] for row in rows], dtype=object)
+    return entry, exit_, fee, plates
+
+
+def _months(entry_ms: np.ndarray) -> np.ndarray:
+    """每条记录入场的本地月份（1-12）"""
+    local = (local_minutes(entry_ms) * 60000).astype(np.int64).astype('datetime64[ms]')
+    return local.astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+
+def _percent(new: float, old: float) -> str:
+    return f"{(new - old) / old * 100:+.1f}%" if old else "-"
+
+
+def simulate(candidate: Tariff, baseline: Tariff, entry, exit_, plates) -> dict:
+    """用当前规则和候选规则分别为全部记录计费"""
+    started = time.perf_counter()
+    baseline_fees = baseline.price(entry, exit_, plates)
+    candidate_fees = candidate.price(entry, exit_, plates)
+    return {
+        "baseline": baseline_fees,
+        "candidate": candidate_fees,
+        "seconds": time.perf_counter() - started,
+        "months": _months(entry),
+        "classes": candidate.classify(plates),
+    }
+
+
+def print_report(candidate: Tariff, baseline: Tariff, actual, result: dict):
+    baseline_fees, candidate_fees = result["baseline"], result["candidate"]
+    total_actual, total_baseline, total_candidate = actual.sum(), baseline_fees.sum(), candidate_fees.sum()
+    print(f"记录数: {len(actual)}，重新计费耗时 {result['seconds']:.2f} 秒")
+    print(f"实际收入:              ¥{total_actual:,.2f}")
+    print(f"当前规则（{baseline.name}）: ¥{total_baseline:,.2f}  {_percent(total_baseline, total_actual)}")
+    print(f"候选规则（{candidate.name}）: ¥{total_candidate:,.2f}  {_percent(total_candidate, total_actual)}")
+
+    change = candidate_fees - actual
+    print(f"\n单次停车费用变化：上涨 {np.mean(change > 0.005) * 100:.1f}%，下降 {np.mean(change < -0.005) * 100:.1f}%，"
+          f"平均 {change.mean():+.2f} 元，中位数 {np.median(change):+.2f} 元")
+
+    print("\n月份\t记录数\t实际收入\t候选规则\t变化")
+    months = result["months"]
+    for month in range(1, 13):
+        mask = months == month
+        if not mask.any():
+            continue
+        a, c = actual[mask].sum(), candidate_fees[mask].sum()
+        print(f"{month:02d}\t{mask.sum()}\t¥{a:,.2f}\t¥{c:,.2f}\t{_percent(c, a)}")
+
+    names = candidate.class_names
+    if len(names) > 1:
+        print("\n车牌分类\t记录数\t实际收入\t候选规则\t变化")
+        for k, name in enumerate(names):
+            mask = result["classes"] == k
+            a, c = actual[mask].sum(), candidate_fees[mask].sum()
+            print(f"{name}\t{mask.sum()}\t¥{a:,.2f}\t¥{c:,.2f}\t{_percent(c, a)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='用候选收费规则对一年的历史记录重新计费并与实际收入对比')
+    parser.add_argument('tariff', help='候选收费规则JSON文件')
+    parser.add_argument('--year', type=int, default=time.localtime().tm_year - 1, help='模拟的年份（默认去年）')
+    parser.add_argument('--baseline', default=TARIFF_PATH, help='当前收费规则文件（不存在时使用默认规则）')
+    parser.add_argument('--db', default='parking.db', help='数据库文件路径')
+    args = parser.parse_args(argv)
+
+    candidate = Tariff.from_file(args.tariff)
+    baseline = load_tariff(args.baseline)
+    started = time.perf_counter()
+    entry, exit_, actual, plates = load_closed_records(
+        args.db, month_range(args.year, 1)[0], month_range(args.year, 12)[1])
+    print(f"读取 {args.year} 年已出场记录 {len(actual)} 条，耗时 {time.perf_counter() - started:.2f} 秒")
+    if len(actual) == 0:
+        return 0
+    print_report(candidate, baseline, actual, simulate(candidate, baseline, entry, exit_, plates))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
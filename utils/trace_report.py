@@ -0,0 +1,111 @@
+# utils/trace_report.py
+"""
+闸机事件追踪报告。
+
+读取 core.tracing 写入的追踪日志（含 .1 备份），输出从第一次识别到车牌到出入场提交的端到端延迟，
+按相邻环节拆分的耗时分布，投票稳定所需的帧数，并列出最慢的若干次事件。
+
+用法示例：
+    python -m utils.trace_report
+    python -m utils.trace_report --log gate_traces.jsonl --since 2026-10-01 --top 20
+"""
+import argparse
+import json
+import os
+import sys
+from typing import List
+
+import numpy as np
+
+from core.tracing import TRACE_PATH
+
+
+def load_traces(path: str) -> List[dict]:
+    """按时间顺序读取追踪日志及其备份，跳过无法解析的行（例如写到一半的最后一行）"""
+    traces = []
+    for candidate in (path + '.1', path):
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    traces.append(json.loads(line))
+                except ValueError:
+                    continue
+    return traces
+
+
+def segments(trace: dict):
+    """相邻环节之间的耗时 [(“前一环节→后一环节”, 毫秒)]，按记录顺序"""
+    hops = list(trace.get("hops", {}).items())
+    return [(f"{a}→{b}", tb - ta) for (a, ta), (b, tb) in zip(hops, hops[1:])]
+
+
+def _stats(values) -> str:
+    arr = np.asarray(values, dtype=np.float64)
+    return (f"{len(arr):>6}{np.percentile(arr, 50):>10.1f}{np.percentile(arr, 95):>10.1f}"
+            f"{np.percentile(arr, 99):>10.1f}{arr.max():>10.1f}")
+
+
+def print_report(traces: List[dict], top: int):
+    failed = [t for t in traces if t.get("error")]
+    print(f"事件数: {len(traces)}，失败: {len(failed)}")
+    header = f"{'':<28}{'次数':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}"
+
+    print(f"\n端到端延迟（毫秒）\n{header}")
+    print(f"{'总计':<28}{_stats([t['total_ms'] for t in traces])}")
+    by_action = {}
+    for trace in traces:
+        by_action.setdefault(trace.get("action") or "失败", []).append(trace["total_ms"])
+    for action, values in sorted(by_action.items()):
+        print(f"{action:<28}{_stats(values)}")
+
+    print(f"\n各环节耗时（毫秒，环节按首次出现的顺序）\n{header}")
+    breakdown = {}
+    for trace in traces:
+        for name, ms in segments(trace):
+            breakdown.setdefault(name, []).append(ms)
+    mean_total = np.mean([t['total_ms'] for t in traces])
+    for name, values in breakdown.items():
+        share = np.sum(values) / len(traces) / mean_total * 100 if mean_total else 0.0
+        print(f"{name:<28}{_stats(values)}   占 {share:.0f}%")
+
+    frames = [t["frames"] for t in traces if t.get("frames") is not None]
+    votes = [t["votes"] for t in traces if t.get("votes") is not None]
+    if frames:
+        print(f"\n投票稳定所需帧数：平均 {np.mean(frames):.1f}，中位数 {np.median(frames):.0f}，"
+              f"p95 {np.percentile(frames, 95):.0f}，最多 {max(frames)}"
+              + (f"（其中识别到该车牌的帧平均 {np.mean(votes):.1f}）" if votes else ""))
+
+    print(f"\n最慢的 {min(top, len(traces))} 次事件")
+    print(f"{'时间':<25}{'车牌':<10}{'来源':<24}{'结果':<8}{'总计ms':>10}{'帧数':>6}  最慢环节")
+    for trace in sorted(traces, key=lambda t: t["total_ms"], reverse=True)[:top]:
+        slowest = max(segments(trace), key=lambda item: item[1], default=("-", 0.0))
+        outcome = trace.get("action") or "失败"
+        frames_text = "-" if trace.get("frames") is None else trace["frames"]
+        print(f"{trace.get('time', ''):<25}{trace.get('plate_number', ''):<10}{str(trace.get('source', ''))[:22]:<24}"
+              f"{outcome:<8}{trace['total_ms']:>10.1f}{frames_text:>6}  {slowest[0]} {slowest[1]:.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='闸机事件端到端延迟报告')
+    parser.add_argument('--log', default=TRACE_PATH, help=f'追踪日志路径（默认 {TRACE_PATH}）')
+    parser.add_argument('--since', help='只统计该日期（YYYY-MM-DD）及之后的事件')
+    parser.add_argument('--source', help='只统计来源（车道名或视频源）包含该文本的事件')
+    parser.add_argument('--top', type=int, default=10, help='列出最慢的事件数')
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.log)
+    if args.since:
+        traces = [t for t in traces if t.get("time", "") >= args.since]
+    if args.source:
+        traces = [t for t in traces if args.source in str(t.get("source", ""))]
+    if not traces:
+        print("没有符合条件的追踪记录。")
+        return 0
+    print_report(traces, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
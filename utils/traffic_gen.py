@@ -0,0 +1,258 @@
+# utils/traffic_gen.py
+"""
+合成停车流量生成器。
+
+按可配置的车位数、每日到达量、停车时长分布（对数正态）、高峰时段和回头客比例生成到达/离场流：
+- generate_history / populate 生成并批量写入历史停车记录（可达数百万条），用于构造不同规模的数据库；
+- LiveTraffic 生成实时操作序列（入场、出场、在场查询、历史查询），由 utils.parking_bench 通过 ParkingSystem 回放。
+
+预先填充一个测试数据库（不要指向正式数据库）：
+    python -m utils.traffic_gen --db bench.db --rows 2000000 --spots 300 --daily-arrivals 1500
+"""
+import argparse
+import heapq
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.tariff import Tariff, load_tariff
+from database import revenue
+from database.database_manager import get_connection, setup_database
+from database.timestamps import now_ms, to_ms
+
+PROVINCES = "京津沪渝冀豫云辽黑湘皖鲁新苏浙赣鄂桂甘晋蒙陕吉闽贵粤青藏川宁琼"
+LETTERS = "ABCDEFGHJKLMNPQRSTUVWXYZ"  # 车牌中不使用 I、O
+ALNUM = "0123456789" + LETTERS
+
+
+class TrafficProfile:
+    """
+    流量特征。
+    daily_arrivals 为平日每天到达的车辆数（周末乘以 weekend_factor），到达时刻按 hour_weights() 的小时权重分布；
+    停车时长服从中位数为 dwell_median_minutes、对数标准差为 dwell_sigma 的对数正态分布；
+    到达车辆中 repeat_ratio 来自 regulars 个常客车牌，其余为一次性车牌，ev_ratio 为新能源（8位）车牌的比例。
+    """
+    def __init__(self, spots: int = 100, daily_arrivals: int = 600, dwell_median_minutes: float = 90.0,
+                 dwell_sigma: float = 1.0, max_dwell_days: float = 7.0, peak_hours=((8, 3.0), (18, 2.5)),
+                 weekend_factor: float = 0.7, regulars: int = 2000, repeat_ratio: float = 0.6,
+                 ev_ratio: float = 0.1, seed: int = 0):
+        self.spots = spots
+        self.daily_arrivals = daily_arrivals
+        self.dwell_median_minutes = dwell_median_minutes
+        self.dwell_sigma = dwell_sigma
+        self.max_dwell_days = max_dwell_days
+        self.peak_hours = tuple(peak_hours)
+        self.weekend_factor = weekend_factor
+        self.regulars = regulars
+        self.repeat_ratio = repeat_ratio
+        self.ev_ratio = ev_ratio
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.regular_plates = [self.random_plate() for _ in range(regulars)]
+
+    def to_dict(self) -> dict:
+        """可写入JSON的流量特征（保存在基准测试基线中）"""
+        values = {key: value for key, value in vars(self).items() if key not in ('rng', 'regular_plates')}
+        values['peak_hours'] = [list(peak) for peak in self.peak_hours]
+        return values
+
+    def hour_weights(self) -> np.ndarray:
+        """24小时的到达权重：白天（7-22点）为1，夜间为0.15，高峰小时乘以对应倍数"""
+        weights = np.full(24, 0.15)
+        weights[7:22] = 1.0
+        for hour, factor in self.peak_hours:
+            weights[int(hour) % 24] *= factor
+        return weights / weights.sum()
+
+    def random_plate(self) -> str:
+        rng = self.rng
+        prefix = PROVINCES[rng.integers(len(PROVINCES))] + LETTERS[rng.integers(len(LETTERS))]
+        if rng.random() < self.ev_ratio:
+            # 新能源车牌：首位为 D/F，后接5位
+            return prefix + "DF"[rng.integers(2)] + ''.join(ALNUM[i] for i in rng.integers(10, size=5))
+        return prefix + ''.join(ALNUM[i] for i in rng.integers(len(ALNUM), size=5))
+
+    def arriving_plate(self) -> str:
+        if self.regular_plates and self.rng.random() < self.repeat_ratio:
+            return self.regular_plates[self.rng.integers(len(self.regular_plates))]
+        return self.random_plate()
+
+    def dwell_ms(self, size: int) -> np.ndarray:
+        minutes = self.rng.lognormal(np.log(self.dwell_median_minutes), self.dwell_sigma, size)
+        return (np.clip(minutes, 1.0, self.max_dwell_days * 1440) * 60000).astype(np.int64)
+
+    def arrivals(self, day: datetime) -> np.ndarray:
+        """某一天（本地日期）的到达时刻（纪元毫秒，升序）"""
+        expected = self.daily_arrivals * (self.weekend_factor if day.weekday() >= 5 else 1.0)
+        count = self.rng.poisson(expected)
+        hours = self.rng.choice(24, size=count, p=self.hour_weights())
+        offsets = hours * 3600000 + self.rng.integers(0, 3600000, size=count)
+        return np.sort(to_ms(day) + offsets)
+
+
+def generate_history(profile: TrafficProfile, rows: int, end_ms: Optional[int] = None) -> List[Tuple]:
+    """
+    生成 rows 条在 end_ms（默认当前时刻）之前已经结束的历史记录 [(车牌, 入场, 出场, 车位号)]，按入场时间升序。
+    按时间顺序模拟车位占用：车位满时到达的车辆离开，车位从小号开始分配（与 ParkingSystem 一致），
+    同一车牌不会同时在场，因此生成的数据满足在场唯一约束。
+    """
+    end_ms = end_ms or now_ms()
+    per_day = max(1.0, profile.daily_arrivals * (5 + 2 * profile.weekend_factor) / 7)
+    days = int(rows / per_day * 1.2) + 2
+    while True:
+        records = _simulate(profile, rows, end_ms, days)
+        if len(records) >= rows:
+            return records
+        days = int(days * 1.5) + 1  # 车位经常满导致记录不够，从更早开始
+
+
+def _simulate(profile, rows, end_ms, days):
+    first_day = datetime.fromtimestamp(end_ms / 1000).replace(hour=0, minute=0, second=0, microsecond=0) \
+        - timedelta(days=days)
+    free_spots = list(range(1, profile.spots + 1))
+    departures = []  # (出场时间, 车位号, 车牌)
+    inside = set()
+    records = []
+    day = first_day
+    while len(records) < rows and to_ms(day) < end_ms:
+        arrivals = profile.arrivals(day)
+        dwells = profile.dwell_ms(len(arrivals))
+        for entry_ms, dwell in zip(arrivals.tolist(), dwells.tolist()):
+            exit_ms = entry_ms + dwell
+            if exit_ms >= end_ms:
+                continue
+            while departures and departures[0][0] <= entry_ms:
+                _, spot, plate = heapq.heappop(departures)
+                heapq.heappush(free_spots, spot)
+                inside.discard(plate)
+            if not free_spots:
+                continue
+            plate = profile.arriving_plate()
+            if plate in inside:
+                continue
+            spot = heapq.heappop(free_spots)
+            inside.add(plate)
+            heapq.heappush(departures, (exit_ms, spot, plate))
+            records.append((plate, entry_ms, exit_ms, spot))
+            if len(records) >= rows:
+                break
+        day += timedelta(days=1)
+    return records
+
+
+def populate(db_path: str, records: List[Tuple], tariff: Optional[Tariff] = None, batch_size: int = 50000,
+             progress=None) -> int:
+    """按收费规则计费后批量写入历史记录，并重建按日收费汇总，返回写入条数"""
+    tariff = tariff or load_tariff()
+    setup_database(db_path)
+    with get_connection(db_path) as conn:
+        for start in range(0, len(records), batch_size):
+            chunk = records[start:start + batch_size]
+            plates = [row[0] for row in chunk]
+            fees = tariff.price([row[1] for row in chunk], [row[2] for row in chunk], plates)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO parking_records (plate_number, entry_time, exit_time, fee, spot_number) VALUES (?, ?, ?, ?, ?)",
+                [(plate, entry_ms, exit_ms, float(fee), spot)
+                 for (plate, entry_ms, exit_ms, spot), fee in zip(chunk, fees)]
+            )
+            conn.commit()
+            if progress:
+                progress(start + len(chunk), len(records))
+        conn.execute("BEGIN IMMEDIATE")
+        revenue.rebuild(conn)
+        conn.commit()
+    return len(records)
+
+
+class LiveTraffic:
+    """
+    实时操作序列。与管理员界面一致，每次车辆经过闸机都先查询是否在场，再办理入场或出场；
+    在场车辆数围绕 target_occupancy 波动，车位满时只出不进，另有 history_ratio 比例的常客历史查询。
+    只跟踪自己产生的车辆（inside），回放前车场应为空，结束后让 inside 中的车辆全部出场即可恢复。
+    """
+    def __init__(self, profile: TrafficProfile, history_ratio: float = 0.1, target_occupancy: float = 0.8,
+                 seed: int = 1):
+        self.profile = profile
+        self.history_ratio = history_ratio
+        self.target = profile.spots * target_occupancy
+        self.rng = random.Random(seed)
+        self.inside = []
+
+    def operations(self, count: int) -> Iterator[Tuple[str, str]]:
+        """产出约 count 个操作 (操作, 车牌)，操作为 'inside'、'entry'、'exit'、'history'"""
+        profile, rng, inside = self.profile, self.rng, self.inside
+        produced = 0
+        while produced < count:
+            if profile.regular_plates and rng.random() < self.history_ratio:
+                yield 'history', rng.choice(profile.regular_plates)
+                produced += 1
+                continue
+            arrive_probability = 0.65 if len(inside) < self.target else 0.35
+            if len(inside) < profile.spots and (not inside or rng.random() < arrive_probability):
+                plate = profile.arriving_plate()
+                if plate in inside:
+                    continue
+                yield 'inside', plate
+                yield 'entry', plate
+                inside.append(plate)
+            else:
+                i = rng.randrange(len(inside))
+                inside[i], inside[-1] = inside[-1], inside[i]
+                plate = inside.pop()
+                yield 'inside', plate
+                yield 'exit', plate
+            produced += 2
+
+
+def parse_peak_hours(text: str):
+    """'8:3,18:2.5' -> ((8, 3.0), (18, 2.5))"""
+    peaks = []
+    for item in filter(None, text.split(',')):
+        hour, factor = item.split(':')
+        peaks.append((int(hour), float(factor)))
+    return tuple(peaks)
+
+
+def add_profile_arguments(parser):
+    group = parser.add_argument_group('流量特征')
+    group.add_argument('--spots', type=int, default=100, help='车位数')
+    group.add_argument('--daily-arrivals', type=int, default=600, help='平日每天到达的车辆数')
+    group.add_argument('--dwell-median', type=float, default=90.0, help='停车时长中位数（分钟）')
+    group.add_argument('--dwell-sigma', type=float, default=1.0, help='停车时长的对数标准差，越大长时停车越多')
+    group.add_argument('--peak-hours', default='8:3,18:2.5', help='高峰小时及倍数，如 8:3,18:2.5')
+    group.add_argument('--regulars', type=int, default=2000, help='常客车牌数量')
+    group.add_argument('--repeat-ratio', type=float, default=0.6, help='到达车辆中常客的比例')
+    group.add_argument('--seed', type=int, default=0, help='随机种子')
+
+
+def profile_from_args(args) -> TrafficProfile:
+    return TrafficProfile(spots=args.spots, daily_arrivals=args.daily_arrivals,
+                          dwell_median_minutes=args.dwell_median, dwell_sigma=args.dwell_sigma,
+                          peak_hours=parse_peak_hours(args.peak_hours), regulars=args.regulars,
+                          repeat_ratio=args.repeat_ratio, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成合成历史停车记录并写入测试数据库')
+    parser.add_argument('--db', required=True, help='测试数据库路径（不要指向正式数据库）')
+    parser.add_argument('--rows', type=int, default=100000, help='生成的历史记录条数')
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    profile = profile_from_args(args)
+    started = time.perf_counter()
+    records = generate_history(profile, args.rows)
+    print(f"生成 {len(records)} 条记录，耗时 {time.perf_counter() - started:.1f} 秒")
+    started = time.perf_counter()
+    populate(args.db, records, progress=lambda done, total: print(f"\r写入 {done}/{total}", end='', flush=True))
+    print(f"\n写入完成，耗时 {time.perf_counter() - started:.1f} 秒")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())